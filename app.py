@@ -1,19 +1,37 @@
-from flask import Flask, request, jsonify
-import requests
+from flask import Flask, Response, g, request, jsonify, stream_with_context
 import os
-import shutil
+import sys
+import time
 from flask_cors import CORS
 
-# Cria a pasta static se não existir
-static_folder = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static')
-if not os.path.exists(static_folder):
-    os.makedirs(static_folder)
+import auditoria
+import cache
+import cadastros
+import consulta
+import documentos
+import estaticos
+import jobs
+import lote
+import metricas
+import monitoramento
+import nomes
+import projecao
+import serializacao
+import upstream
+
+# Pasta com o frontend pré-construído (static/index.html)
+static_folder = estaticos.STATIC_FOLDER
 
 app = Flask(__name__, static_folder=static_folder)
+app.json = serializacao.JSONProvider(app)  # orjson, quando instalado
 CORS(app)  # Habilita CORS para permitir requisições do frontend
 
 # URL da API do Portal da Transparência CEIS
-API_URL = "https://api.infosimples.com/api/v2/consultas/portal-transparencia/ceis"
+API_URL = upstream.API_URL
+
+# Fila de consultas assíncronas (jobs persistidos em SQLite)
+job_store = jobs.JobStore()
+job_runner = jobs.JobRunner(job_store)
 
 @app.route('/api/consulta-ceis', methods=['POST'])
 def consulta_ceis():
@@ -21,630 +39,456 @@ def consulta_ceis():
     Endpoint para consultar CEIS na API da Infosimples
     
     Parâmetros esperados:
-    - token: Token de acesso à API
+    - token: Token de acesso à API (dispensado com source=local ou com CEIS_TOKENS configurado)
     - cnpj: CNPJ da empresa (opcional)
     - cpf: CPF do indivíduo (opcional)
+    - source: "api" (padrão) ou "local" para consultar a base local do CEIS
+    - fields: campos da resposta, separados por vírgula (ex.: data_count,data.sancao.fim_data)
+    - modo: "completo" (padrão), "veredito" para a indicação de sanção e as datas de cada uma,
+      ou "resumo" para apenas os totais (ativas, expiradas, fim mais recente, órgãos, tipo mais grave)
+    - offset, limit: página das sanções (data_count continua com o total)
+    
+    No modo completo, fields=resumo,... inclui os mesmos totais junto com as sanções.
     """
     # Recupera os dados do formulário
     token = request.form.get('token')
     cnpj = request.form.get('cnpj')
     cpf = request.form.get('cpf')
+    fonte = request.form.get('source', 'api')
     
     # Valida parâmetros obrigatórios
-    if not token:
+    erro = consulta.validar_parametros(token, cnpj, cpf, fonte)
+    if erro is None:
+        apresentacao, erro = projecao.ler_parametros(request.values.get('modo'), request.values.get('fields'))
+    if erro is None:
+        pagina, erro = projecao.ler_pagina(request.values.get('offset'), request.values.get('limit'))
+    if erro:
+        metricas.LOOKUPS.inc(resultado='invalido')
+        payload, status = erro
+        return jsonify(payload), status
+    
+    if fonte == 'local':
+        payload, status, cache_status, age = consulta.consultar_local(cnpj, cpf)
+    else:
+        payload, status, cache_status, age = consulta.consultar(token, cnpj, cpf)
+    metricas.LOOKUPS.inc(resultado=consulta.resultado_metrica(status, cache_status))
+    
+    with metricas.medir(metricas.SERIALIZE_SECONDS, 'serialize'):
+        response = jsonify(projecao.aplicar(payload, *apresentacao, pagina=pagina))
+    response.status_code = status
+    return _com_info_cache(response, cache_status, age)
+
+@app.route('/api/consulta-sancoes', methods=['POST'])
+def consulta_sancoes():
+    """
+    Endpoint para consultar um documento em vários cadastros de sanções ao mesmo tempo
+    
+    Parâmetros esperados:
+    - token: Token de acesso à API (dispensado com CEIS_TOKENS configurado)
+    - cnpj: CNPJ da empresa (opcional)
+    - cpf: CPF do indivíduo (opcional)
+    - cadastros: cadastros consultados, separados por vírgula (padrão: CEIS_CADASTROS)
+    - fields, modo, offset, limit: como em /api/consulta-ceis
+    
+    Os registros de todos os cadastros vêm em data, cada um com o campo
+    "fonte"; o resumo por cadastro vem em "cadastros". Se algum cadastro não
+    responder no prazo ou falhar, a resposta vem com "parcial": true.
+    """
+    token = request.form.get('token')
+    cnpj = request.form.get('cnpj')
+    cpf = request.form.get('cpf')
+    
+    # Valida parâmetros obrigatórios
+    erro = consulta.validar_parametros(token, cnpj, cpf)
+    if erro is None:
+        selecionados, erro = cadastros.ler_cadastros(request.values.get('cadastros'))
+    if erro is None:
+        apresentacao, erro = projecao.ler_parametros(request.values.get('modo'), request.values.get('fields'))
+    if erro is None:
+        pagina, erro = projecao.ler_pagina(request.values.get('offset'), request.values.get('limit'))
+    if erro:
+        metricas.LOOKUPS.inc(resultado='invalido')
+        payload, status = erro
+        return jsonify(payload), status
+    
+    payload, status, cache_status, age = consulta.consultar_cadastros(token, cnpj, cpf, selecionados)
+    
+    with metricas.medir(metricas.SERIALIZE_SECONDS, 'serialize'):
+        response = jsonify(projecao.aplicar(payload, *apresentacao, pagina=pagina))
+    response.status_code = status
+    return _com_info_cache(response, cache_status, age)
+
+@app.route('/api/consulta-ceis/historico', methods=['GET'])
+def historico_consultas():
+    """
+    Endpoint com o histórico de consultas de um documento
+    
+    Parâmetros esperados:
+    - cnpj ou cpf: documento consultado
+    - desde, ate: período, em segundos desde 1970 (opcionais)
+    - offset, limit: paginação das consultas (padrão: 0 e 100)
+    - resultado: "1" para incluir a resposta completa de cada consulta
+    
+    Retorna as consultas (mais recentes primeiro) e as transições de
+    situação do documento no período.
+    """
+    cnpj = request.args.get('cnpj')
+    cpf = request.args.get('cpf')
+    
+    if not cnpj and not cpf:
         return jsonify({
             "code": 400,
             "code_message": "Parâmetro obrigatório não informado",
-            "errors": ["O token de acesso é obrigatório"]
+            "errors": ["Informe um CNPJ ou CPF para consultar o histórico"]
         }), 400
     
-    # Verifica se pelo menos um parâmetro de consulta foi informado
-    if not cnpj and not cpf:
+    erro = documentos.validar(cnpj, cpf)
+    if erro:
+        payload, status = erro
+        return jsonify(payload), status
+    
+    historico = auditoria.store.historico(
+        cache.chave_cache(cnpj, cpf),
+        desde=request.args.get('desde', type=float),
+        ate=request.args.get('ate', type=float),
+        offset=max(request.args.get('offset', 0, type=int), 0),
+        limit=min(max(request.args.get('limit', 100, type=int), 0), 10000),
+        incluir_resultado=request.args.get('resultado') in ('1', 'true', 'sim')
+    )
+    historico.update({"code": 200, "code_message": "Histórico encontrado", "errors": []})
+    return jsonify(historico)
+
+@app.route('/api/consulta-ceis/nomes', methods=['GET'])
+def buscar_nomes():
+    """
+    Endpoint para buscar sancionados pelo nome (razão social ou nome fantasia)
+    
+    Parâmetros esperados:
+    - nome: nome ou parte do nome, com ou sem acentos
+    - limit: quantidade máxima de candidatos (padrão: 10)
+    
+    Retorna os documentos candidatos em ordem de semelhança, a partir do
+    índice de nomes da base local (python nomes.py construir).
+    """
+    nome = request.args.get('nome', '').strip()
+    if not nome:
         return jsonify({
             "code": 400,
             "code_message": "Parâmetro obrigatório não informado",
-            "errors": ["Informe um CNPJ ou CPF para realizar a consulta"]
+            "errors": ["Informe o nome a buscar"]
         }), 400
     
-    # Prepara os parâmetros para enviar à API
-    params = {
-        "token": token,
-        "timeout": 300  # Timeout de 5 minutos
-    }
-    
-    # Adiciona CNPJ ou CPF aos parâmetros, se informados
-    if cnpj:
-        params["cnpj"] = cnpj
-    if cpf:
-        params["cpf"] = cpf
-    
-    try:
-        # Realiza a requisição para a API do CEIS
-        response = requests.post(API_URL, data=params)
-        
-        # Verifica se a requisição foi bem-sucedida
-        if response.status_code == 200:
-            # Retorna os dados recebidos da API
-            return jsonify(response.json())
-        else:
-            # Trata erros de comunicação com a API
-            return jsonify({
-                "code": response.status_code,
-                "code_message": "Erro ao comunicar com a API externa",
-                "errors": [f"A API retornou o código {response.status_code}"]
-            }), 500
-            
-    except requests.exceptions.RequestException as e:
-        # Trata exceções na requisição
+    if not nomes.indice.disponivel():
         return jsonify({
-            "code": 500,
-            "code_message": "Erro ao processar a requisição",
-            "errors": [str(e)]
-        }), 500
-    except Exception as e:
-        # Trata outras exceções não previstas
+            "code": 503,
+            "code_message": "Índice de nomes indisponível",
+            "errors": ["Importe o arquivo do CEIS com: python base_local.py importar <arquivo>"]
+        }), 503
+    
+    limit = min(max(request.args.get('limit', nomes.LIMITE, type=int), 1), 100)
+    candidatos, versao = nomes.indice.buscar(nome, limit)
+    return jsonify({
+        "code": 200,
+        "code_message": "Busca concluída",
+        "versao_base": versao,
+        "candidatos": candidatos,
+        "errors": []
+    })
+
+@app.route('/api/consulta-ceis/lote', methods=['POST'])
+def consulta_ceis_lote():
+    """
+    Endpoint para consultar CEIS em lote
+    
+    Formatos aceitos:
+    - JSON: {"token": "...", "documentos": ["...", ...]}
+    - JSON: ["...", ...], com o token na query string (?token=...)
+    - multipart/form-data: campo token e arquivo CSV no campo arquivo
+    
+    Os documentos são validados e deduplicados; os resultados são retornados
+    na ordem de entrada. Com ?formato=ndjson ou ?formato=sse, cada resultado
+    é transmitido assim que sua consulta termina. ?fields= e ?modo=veredito
+    reduzem o resultado de cada documento, como na consulta individual.
+    """
+    token, documentos, erro = _ler_lote()
+    if erro:
+        return erro
+    
+    apresentacao, erro = projecao.ler_parametros(request.args.get('modo'), request.args.get('fields'))
+    if erro:
+        payload, status = erro
+        return jsonify(payload), status
+    apresentar = (lambda resultado: projecao.aplicar(resultado, *apresentacao)) if apresentacao != ('completo', None) else None
+    
+    # Modo de transmissão: cada resultado é enviado assim que fica pronto
+    formato = _formato_stream()
+    if formato:
+        response = Response(
+            stream_with_context(lote.transmitir(token, documentos, app.json.dumps, formato, apresentar)),
+            mimetype=lote.STREAM_MIMETYPES[formato]
+        )
+        response.headers['Cache-Control'] = 'no-cache'
+        response.headers['X-Accel-Buffering'] = 'no'  # Desativa o buffer do Nginx
+        return response
+    
+    # Consulta os documentos em paralelo e reordena os resultados conforme a entrada
+    resultados = [None] * len(documentos)
+    for indice, item in lote.executar(token, documentos):
+        if apresentar is not None:
+            item["resultado"] = apresentar(item["resultado"])
+        resultados[indice] = item
+    
+    return jsonify({
+        "code": 200,
+        "code_message": "Lote processado",
+        "total": len(resultados),
+        "resultados": resultados,
+        "errors": []
+    })
+
+def _ler_lote(exigir_token=True):
+    """
+    Recupera o token e os documentos de um lote conforme o formato enviado
+    
+    Com exigir_token=False (lista de monitoramento), o token não é validado.
+    Retorna (token, documentos, None) ou (None, None, resposta de erro).
+    """
+    dados = request.get_json(silent=True)
+    if isinstance(dados, list):
+        token = request.args.get('token')
+        valores = dados
+    elif isinstance(dados, dict):
+        token = dados.get('token')
+        valores = dados.get('documentos')
+    else:
+        token = request.form.get('token')
+        arquivo = request.files.get('arquivo')
+        valores = lote.ler_csv(arquivo.stream) if arquivo else None
+    
+    # Valida parâmetros obrigatórios (o token é dispensado se o servidor tiver tokens próprios)
+    if exigir_token and not token and not consulta.pool:
+        return None, None, (jsonify({
+            "code": 400,
+            "code_message": "Parâmetro obrigatório não informado",
+            "errors": ["O token de acesso é obrigatório"]
+        }), 400)
+    
+    if valores is None or isinstance(valores, (str, dict)):
+        return None, None, (jsonify({
+            "code": 400,
+            "code_message": "Parâmetro obrigatório não informado",
+            "errors": ["Informe uma lista de documentos ou um arquivo CSV"]
+        }), 400)
+    
+    documentos = lote.preparar_documentos(valores)
+    if len(documentos) > lote.MAX_DOCUMENTOS:
+        return None, None, (jsonify({
+            "code": 413,
+            "code_message": "Lote muito grande",
+            "errors": [f"O lote pode ter no máximo {lote.MAX_DOCUMENTOS} documentos"]
+        }), 413)
+    
+    return token, documentos, None
+
+@app.route('/api/jobs', methods=['POST'])
+def criar_job():
+    """
+    Endpoint para enviar um lote para consulta assíncrona
+    
+    Aceita os mesmos formatos do lote e retorna imediatamente o identificador
+    do job, que pode ser acompanhado em GET /api/jobs/<job_id>.
+    """
+    token, documentos, erro = _ler_lote()
+    if erro:
+        return erro
+    
+    job_id = job_store.criar(token or '', documentos)
+    job_runner.iniciar()
+    job_runner.notificar()
+    
+    return jsonify({
+        "code": 202,
+        "code_message": "Job criado",
+        "job_id": job_id,
+        "status": jobs.PENDENTE,
+        "total": len(documentos),
+        "errors": []
+    }), 202
+
+@app.route('/api/jobs/<job_id>', methods=['GET'])
+def consultar_job(job_id):
+    """
+    Endpoint para acompanhar um job: status, progresso e resultados
+    
+    Parâmetros opcionais (paginação dos resultados):
+    - offset: posição inicial (padrão: 0)
+    - limit: quantidade máxima de resultados (padrão: 1000)
+    """
+    offset = request.args.get('offset', 0, type=int)
+    limit = min(request.args.get('limit', 1000, type=int), 10000)
+    
+    job = job_store.obter(job_id, offset=max(offset, 0), limit=max(limit, 0))
+    if job is None:
         return jsonify({
-            "code": 500,
-            "code_message": "Erro interno do servidor",
-            "errors": [str(e)]
-        }), 500
+            "code": 404,
+            "code_message": "Job não encontrado",
+            "errors": [f"Nenhum job com o identificador {job_id}"]
+        }), 404
+    
+    job.update({"code": 200, "code_message": "Job encontrado", "errors": []})
+    return jsonify(job)
 
-# Rota para servir a página principal
-@app.route('/')
-def index():
-    return app.send_static_file('index.html')
+@app.route('/api/monitoramento', methods=['POST', 'DELETE'])
+def alterar_monitoramento():
+    """
+    Endpoint para incluir (POST) ou retirar (DELETE) documentos da lista de monitoramento
+    
+    Aceita os mesmos formatos do lote; o token não é necessário, pois as
+    verificações usam a base local ou os tokens do servidor (CEIS_TOKENS).
+    """
+    _, preparados, erro = _ler_lote(exigir_token=False)
+    if erro:
+        return erro
+    
+    validos, invalidos = monitoramento.preparar(preparados)
+    if request.method == 'DELETE':
+        return jsonify({
+            "code": 200,
+            "code_message": "Documentos retirados do monitoramento",
+            "removidos": monitoramento.store.remover(validos),
+            "invalidos": invalidos,
+            "errors": []
+        })
+    
+    adicionados = monitoramento.store.adicionar(validos)
+    monitoramento.monitor.iniciar()
+    return jsonify({
+        "code": 200,
+        "code_message": "Documentos incluídos no monitoramento",
+        "adicionados": adicionados,
+        "invalidos": invalidos,
+        "errors": []
+    })
+
+@app.route('/api/monitoramento', methods=['GET'])
+def listar_monitoramento():
+    """
+    Endpoint para listar os documentos monitorados com o último veredito de cada um
+    
+    Parâmetros opcionais (paginação):
+    - offset: posição inicial (padrão: 0)
+    - limit: quantidade máxima de documentos (padrão: 1000)
+    
+    nao_verificaveis informa quantos documentos nenhuma fonte configurada
+    consegue verificar (CPFs, ou todos sem base local, quando não há CEIS_TOKENS).
+    """
+    offset = request.args.get('offset', 0, type=int)
+    limit = min(request.args.get('limit', 1000, type=int), 10000)
+    
+    total, itens = monitoramento.store.listar(offset=max(offset, 0), limit=max(limit, 0))
+    return jsonify({
+        "code": 200,
+        "code_message": "Documentos monitorados",
+        "total": total,
+        "nao_verificaveis": monitoramento.monitor.nao_verificaveis(),
+        "documentos": itens,
+        "errors": []
+    })
+
+@app.route('/api/monitoramento/eventos', methods=['GET'])
+def eventos_monitoramento():
+    """
+    Feed NDJSON das mudanças de veredito, em ordem
+    
+    Parâmetros opcionais:
+    - desde: id do último evento já processado (padrão: 0)
+    - limit: quantidade máxima de eventos (padrão: 1000)
+    """
+    desde = request.args.get('desde', 0, type=int)
+    limit = min(request.args.get('limit', 1000, type=int), 10000)
+    
+    eventos = monitoramento.store.eventos(desde=desde, limit=max(limit, 0))
+    body = b''.join(serializacao.dumps(evento) + b'\n' for evento in eventos)
+    return Response(body, mimetype=lote.STREAM_MIMETYPES['ndjson'])
 
-def create_html_file():
+@app.before_request
+def _retomar_jobs():
+    # Retoma jobs interrompidos e o monitoramento assim que o worker recebe sua primeira requisição
+    if job_store.existe():
+        job_runner.iniciar()
+    if monitoramento.store.existe():
+        monitoramento.monitor.iniciar()
+
+@app.before_request
+def _iniciar_medicao():
+    g.inicio = time.perf_counter()
+    g.timings = metricas.iniciar_timing()
+
+@app.after_request
+def _registrar_metricas(response):
+    # Registra a duração total e, se habilitado, detalha os tempos no Server-Timing
+    inicio = g.get('inicio')
+    if inicio is None:
+        return response
+    duracao = time.perf_counter() - inicio
+    endpoint = request.endpoint or 'desconhecido'
+    metricas.REQUESTS.inc(endpoint=endpoint, status=response.status_code)
+    metricas.REQUEST_SECONDS.observe(duracao, endpoint=endpoint)
+    if metricas.SERVER_TIMING:
+        g.timings['total'] = duracao
+        response.headers['Server-Timing'] = metricas.server_timing(g.timings)
+    return response
+
+@app.route('/metrics')
+def metrics():
     """
-    Cria o arquivo HTML no diretório static
+    Métricas no formato de exposição do Prometheus
     """
-    html_content = """<!DOCTYPE html>
-<html lang="pt-BR">
-<head>
-    <meta charset="UTF-8">
-    <meta name="viewport" content="width=device-width, initial-scale=1.0">
-    <title>Consulta CEIS - Portal da Transparência</title>
-    <style>
-        :root {
-            --primary-color: #1a73e8;
-            --secondary-color: #f1f3f4;
-            --error-color: #d93025;
-            --success-color: #0f9d58;
-            --text-color: #202124;
-            --light-text: #5f6368;
-        }
-        
-        * {
-            box-sizing: border-box;
-            margin: 0;
-            padding: 0;
-            font-family: 'Segoe UI', Tahoma, Geneva, Verdana, sans-serif;
-        }
-        
-        body {
-            background-color: #f8f9fa;
-            color: var(--text-color);
-            line-height: 1.6;
-        }
-        
-        .container {
-            max-width: 800px;
-            margin: 0 auto;
-            padding: 20px;
-        }
-        
-        header {
-            text-align: center;
-            margin-bottom: 30px;
-            padding-bottom: 20px;
-            border-bottom: 1px solid #e0e0e0;
-        }
-        
-        h1 {
-            color: var(--primary-color);
-            margin-bottom: 10px;
-        }
-        
-        .description {
-            color: var(--light-text);
-            margin-bottom: 15px;
-        }
-        
-        .search-form {
-            background-color: white;
-            padding: 25px;
-            border-radius: 8px;
-            box-shadow: 0 2px 10px rgba(0, 0, 0, 0.1);
-            margin-bottom: 30px;
-        }
-        
-        .form-group {
-            margin-bottom: 20px;
-        }
-        
-        label {
-            display: block;
-            margin-bottom: 8px;
-            font-weight: 500;
-        }
-        
-        input[type="text"] {
-            width: 100%;
-            padding: 12px 15px;
-            border: 1px solid #dadce0;
-            border-radius: 4px;
-            font-size: 16px;
-            transition: border 0.3s;
-        }
-        
-        input[type="text"]:focus {
-            border-color: var(--primary-color);
-            outline: none;
-        }
-        
-        .input-group {
-            display: flex;
-            gap: 15px;
-        }
-        
-        .input-group .form-group {
-            flex: 1;
-        }
-        
-        .submit-btn {
-            background-color: var(--primary-color);
-            color: white;
-            border: none;
-            padding: 12px 24px;
-            border-radius: 4px;
-            cursor: pointer;
-            font-size: 16px;
-            font-weight: 500;
-            transition: background-color 0.3s;
-            width: 100%;
-        }
-        
-        .submit-btn:hover {
-            background-color: #0d62d0;
-        }
-        
-        .submit-btn:disabled {
-            background-color: #a9c7f5;
-            cursor: not-allowed;
-        }
-        
-        .result-container {
-            background-color: white;
-            padding: 25px;
-            border-radius: 8px;
-            box-shadow: 0 2px 10px rgba(0, 0, 0, 0.1);
-            margin-top: 30px;
-            display: none;
-        }
-        
-        .result-header {
-            display: flex;
-            justify-content: space-between;
-            align-items: center;
-            margin-bottom: 20px;
-            padding-bottom: 15px;
-            border-bottom: 1px solid #e0e0e0;
-        }
-        
-        .result-title {
-            font-size: 18px;
-            font-weight: 600;
-        }
-        
-        .result-status {
-            padding: 6px 12px;
-            border-radius: 16px;
-            font-size: 14px;
-            font-weight: 500;
-        }
-        
-        .status-positive {
-            background-color: #e6f4ea;
-            color: var(--success-color);
-        }
-        
-        .status-negative {
-            background-color: #fce8e6;
-            color: var(--error-color);
-        }
-        
-        .result-info {
-            margin-bottom: 25px;
-        }
-        
-        .info-item {
-            margin-bottom: 15px;
-        }
-        
-        .info-label {
-            font-weight: 500;
-            margin-bottom: 5px;
-            color: var(--light-text);
-        }
-        
-        .info-value {
-            font-size: 16px;
-        }
-        
-        .sanction-details {
-            background-color: var(--secondary-color);
-            padding: 20px;
-            border-radius: 6px;
-            margin-top: 20px;
-        }
-        
-        .sanction-title {
-            font-weight: 600;
-            margin-bottom: 15px;
-            font-size: 17px;
-        }
-        
-        .loading {
-            display: none;
-            text-align: center;
-            padding: 20px;
-        }
-        
-        .spinner {
-            border: 4px solid rgba(0, 0, 0, 0.1);
-            border-radius: 50%;
-            border-top: 4px solid var(--primary-color);
-            width: 30px;
-            height: 30px;
-            animation: spin 1s linear infinite;
-            margin: 0 auto 15px;
-        }
-        
-        @keyframes spin {
-            0% { transform: rotate(0deg); }
-            100% { transform: rotate(360deg); }
-        }
-        
-        .error-message {
-            color: var(--error-color);
-            background-color: #fce8e6;
-            padding: 12px 15px;
-            border-radius: 4px;
-            margin-top: 15px;
-            display: none;
-        }
-        
-        .no-results {
-            text-align: center;
-            padding: 30px 0;
-            color: var(--light-text);
-            display: none;
-        }
-        
-        footer {
-            text-align: center;
-            margin-top: 40px;
-            padding-top: 20px;
-            border-top: 1px solid #e0e0e0;
-            color: var(--light-text);
-            font-size: 14px;
-        }
-        
-        @media (max-width: 768px) {
-            .input-group {
-                flex-direction: column;
-                gap: 0;
-            }
-        }
-    </style>
-</head>
-<body>
-    <div class="container">
-        <header>
-            <h1>Consulta CEIS</h1>
-            <p class="description">Cadastro de Empresas Inidôneas e Suspensas - Portal da Transparência</p>
-        </header>
-        
-        <div class="search-form">
-            <div class="input-group">
-                <div class="form-group">
-                    <label for="cnpj">CNPJ</label>
-                    <input type="text" id="cnpj" name="cnpj" placeholder="Ex: 00.000.000/0000-00">
-                </div>
-                
-                <div class="form-group">
-                    <label for="cpf">CPF</label>
-                    <input type="text" id="cpf" name="cpf" placeholder="Ex: 000.000.000-00">
-                </div>
-            </div>
-            
-            <div class="form-group">
-                <label for="token">Token de Acesso</label>
-                <input type="text" id="token" name="token" placeholder="Insira seu token de acesso à API">
-            </div>
-            
-            <button type="button" id="search-btn" class="submit-btn">Consultar</button>
-            
-            <div class="error-message" id="error-message"></div>
-        </div>
-        
-        <div class="loading" id="loading">
-            <div class="spinner"></div>
-            <p>Consultando dados, por favor aguarde...</p>
-        </div>
-        
-        <div class="no-results" id="no-results">
-            <p>Nenhum registro encontrado para os dados informados.</p>
-        </div>
-        
-        <div class="result-container" id="result-container">
-            <div class="result-header">
-                <div class="result-title" id="result-entity-name"></div>
-                <div class="result-status" id="result-status"></div>
-            </div>
-            
-            <div class="result-info">
-                <div class="info-item">
-                    <div class="info-label">Nome/Razão Social:</div>
-                    <div class="info-value" id="result-nome"></div>
-                </div>
-                
-                <div class="info-item">
-                    <div class="info-label">Nome Fantasia:</div>
-                    <div class="info-value" id="result-nome-fantasia"></div>
-                </div>
-                
-                <div class="info-item">
-                    <div class="info-label">Órgão Sancionador:</div>
-                    <div class="info-value" id="result-orgao"></div>
-                </div>
-                
-                <div class="info-item">
-                    <div class="info-label">UF:</div>
-                    <div class="info-value" id="result-uf"></div>
-                </div>
-            </div>
-            
-            <div class="sanction-details">
-                <div class="sanction-title">Detalhes da Sanção</div>
-                
-                <div class="info-item">
-                    <div class="info-label">Tipo de Sanção:</div>
-                    <div class="info-value" id="result-tipo-sancao"></div>
-                </div>
-                
-                <div class="info-item">
-                    <div class="info-label">Fundamentação Legal:</div>
-                    <div class="info-value" id="result-fundamento"></div>
-                </div>
-                
-                <div class="info-item">
-                    <div class="info-label">Data de Início:</div>
-                    <div class="info-value" id="result-data-inicio"></div>
-                </div>
-                
-                <div class="info-item">
-                    <div class="info-label">Data de Fim:</div>
-                    <div class="info-value" id="result-data-fim"></div>
-                </div>
-                
-                <div class="info-item">
-                    <div class="info-label">Data de Publicação:</div>
-                    <div class="info-value" id="result-data-publicacao"></div>
-                </div>
-                
-                <div class="info-item">
-                    <div class="info-label">Processo:</div>
-                    <div class="info-value" id="result-processo"></div>
-                </div>
-                
-                <div class="info-item">
-                    <div class="info-label">Observações:</div>
-                    <div class="info-value" id="result-observacoes"></div>
-                </div>
-            </div>
-        </div>
-        
-        <footer>
-            <p>Consulta CEIS - Cadastro de Empresas Inidôneas e Suspensas © 2025</p>
-            <p>Dados fornecidos pelo Portal da Transparência</p>
-        </footer>
-    </div>
+    return Response(metricas.exportar(), mimetype='text/plain; version=0.0.4')
 
-    <script>
-        document.addEventListener('DOMContentLoaded', () => {
-            const cnpjInput = document.getElementById('cnpj');
-            const cpfInput = document.getElementById('cpf');
-            const tokenInput = document.getElementById('token');
-            const searchBtn = document.getElementById('search-btn');
-            const errorMessage = document.getElementById('error-message');
-            const loading = document.getElementById('loading');
-            const resultContainer = document.getElementById('result-container');
-            const noResults = document.getElementById('no-results');
-            
-            // Mascaras para CNPJ e CPF
-            cnpjInput.addEventListener('input', function(e) {
-                let value = e.target.value.replace(/\\D/g, '');
-                if (value.length > 14) value = value.slice(0, 14);
-                
-                if (value.length > 12) {
-                    value = value.replace(/^(\\d{2})(\\d{3})(\\d{3})(\\d{4})(\\d{2}).*/, '$1.$2.$3/$4-$5');
-                } else if (value.length > 8) {
-                    value = value.replace(/^(\\d{2})(\\d{3})(\\d{3})(\\d*)/, '$1.$2.$3/$4');
-                } else if (value.length > 5) {
-                    value = value.replace(/^(\\d{2})(\\d{3})(\\d*)/, '$1.$2.$3');
-                } else if (value.length > 2) {
-                    value = value.replace(/^(\\d{2})(\\d*)/, '$1.$2');
-                }
-                
-                e.target.value = value;
-                
-                // Limpar CPF se CNPJ estiver sendo preenchido
-                if (value.length > 0) {
-                    cpfInput.value = '';
-                }
-            });
-            
-            cpfInput.addEventListener('input', function(e) {
-                let value = e.target.value.replace(/\\D/g, '');
-                if (value.length > 11) value = value.slice(0, 11);
-                
-                if (value.length > 9) {
-                    value = value.replace(/^(\\d{3})(\\d{3})(\\d{3})(\\d{2}).*/, '$1.$2.$3-$4');
-                } else if (value.length > 6) {
-                    value = value.replace(/^(\\d{3})(\\d{3})(\\d*)/, '$1.$2.$3');
-                } else if (value.length > 3) {
-                    value = value.replace(/^(\\d{3})(\\d*)/, '$1.$2');
-                }
-                
-                e.target.value = value;
-                
-                // Limpar CNPJ se CPF estiver sendo preenchido
-                if (value.length > 0) {
-                    cnpjInput.value = '';
-                }
-            });
-            
-            // Função para validar os campos antes da consulta
-            function validateFields() {
-                errorMessage.style.display = 'none';
-                errorMessage.textContent = '';
-                
-                if (!tokenInput.value.trim()) {
-                    showError('O token de acesso é obrigatório.');
-                    return false;
-                }
-                
-                if (!cnpjInput.value.trim() && !cpfInput.value.trim()) {
-                    showError('Informe um CNPJ ou CPF para realizar a consulta.');
-                    return false;
-                }
-                
-                return true;
-            }
-            
-            // Função para mostrar mensagens de erro
-            function showError(message) {
-                errorMessage.textContent = message;
-                errorMessage.style.display = 'block';
-            }
-            
-            // Função para formatar a exibição dos dados
-            function formatDisplayValue(value) {
-                return value && value !== '**' ? value : 'Não informado';
-            }
-            
-            // Função para realizar a consulta à API
-            async function consultCEIS() {
-                if (!validateFields()) return;
-                
-                // Preparando os dados da requisição
-                const formData = new FormData();
-                formData.append('token', tokenInput.value.trim());
-                
-                if (cnpjInput.value.trim()) {
-                    formData.append('cnpj', cnpjInput.value.replace(/\\D/g, ''));
-                }
-                
-                if (cpfInput.value.trim()) {
-                    formData.append('cpf', cpfInput.value.replace(/\\D/g, ''));
-                }
-                
-                // Configurando a exibição durante a consulta
-                loading.style.display = 'block';
-                resultContainer.style.display = 'none';
-                noResults.style.display = 'none';
-                errorMessage.style.display = 'none';
-                
-                try {
-                    // Realizando a chamada à API
-                    const response = await fetch('/api/consulta-ceis', {
-                        method: 'POST',
-                        body: formData
-                    });
-                    
-                    const data = await response.json();
-                    
-                    // Processando a resposta
-                    if (data.code === 200) {
-                        if (data.data_count > 0) {
-                            displayResults(data.data[0]);
-                        } else {
-                            noResults.style.display = 'block';
-                        }
-                    } else {
-                        // Tratando erros retornados pela API
-                        let errorMsg = `Erro ${data.code}: ${data.code_message}`;
-                        if (data.errors && data.errors.length > 0) {
-                            errorMsg += ` - ${data.errors.join('; ')}`;
-                        }
-                        showError(errorMsg);
-                    }
-                } catch (error) {
-                    showError(`Erro ao realizar a consulta: ${error.message}`);
-                } finally {
-                    loading.style.display = 'none';
-                }
-            }
-            
-            // Função para exibir os resultados na interface
-            function displayResults(data) {
-                // Preenchendo os dados básicos
-                document.getElementById('result-entity-name').textContent = data.cadastro_receita || 'Consulta CEIS';
-                document.getElementById('result-status').textContent = 'Sancionado';
-                document.getElementById('result-status').className = 'result-status status-negative';
-                
-                document.getElementById('result-nome').textContent = formatDisplayValue(data.cadastro_receita);
-                document.getElementById('result-nome-fantasia').textContent = formatDisplayValue(data.nome_fantasia);
-                
-                // Preenchendo dados do órgão sancionador
-                if (data.orgao_sancionador) {
-                    document.getElementById('result-orgao').textContent = formatDisplayValue(data.orgao_sancionador.nome);
-                    document.getElementById('result-uf').textContent = formatDisplayValue(data.orgao_sancionador.uf);
-                }
-                
-                // Preenchendo dados da sanção
-                if (data.sancao) {
-                    document.getElementById('result-tipo-sancao').textContent = formatDisplayValue(data.sancao.tipo);
-                    document.getElementById('result-fundamento').textContent = formatDisplayValue(data.sancao.fundamentacao_legal);
-                    document.getElementById('result-data-inicio').textContent = formatDisplayValue(data.sancao.inicio_data);
-                    document.getElementById('result-data-fim').textContent = formatDisplayValue(data.sancao.fim_data);
-                    document.getElementById('result-data-publicacao').textContent = formatDisplayValue(data.sancao.publicacao_data);
-                    document.getElementById('result-processo').textContent = formatDisplayValue(data.sancao.processo);
-                    document.getElementById('result-observacoes').textContent = formatDisplayValue(data.sancao.observacoes);
-                }
-                
-                // Exibindo o container de resultados
-                resultContainer.style.display = 'block';
-            }
-            
-            // Event listener para o botão de consulta
-            searchBtn.addEventListener('click', consultCEIS);
-            
-            // Permitir usar Enter para submeter o formulário
-            [cnpjInput, cpfInput, tokenInput].forEach(input => {
-                input.addEventListener('keypress', function(e) {
-                    if (e.key === 'Enter') {
-                        consultCEIS();
-                    }
-                });
-            });
-        });
-    </script>
-</body>
-</html>
-"""
-    
-    # Cria o arquivo index.html no diretório static
-    with open(os.path.join(static_folder, 'index.html'), 'w', encoding='utf-8') as f:
-        f.write(html_content)
+def _formato_stream():
+    """
+    Identifica o formato de transmissão pedido (?formato= ou cabeçalho Accept)
+    """
+    formato = request.args.get('formato', '').lower()
+    if formato in lote.STREAM_MIMETYPES:
+        return formato
+    for formato, mimetype in lote.STREAM_MIMETYPES.items():
+        if mimetype in request.headers.get('Accept', ''):
+            return formato
+    return None
+
+def _com_info_cache(response, status, age):
+    """
+    Informa nos cabeçalhos se a resposta veio do cache e a idade dos dados
+    """
+    response.headers['X-Cache'] = status
+    response.headers['Age'] = str(int(age))
+    return response
+
+# Rota para servir a página principal
+@app.route('/')
+def index():
+    # Página pré-construída, comprimida conforme o Accept-Encoding e revalidada pelo ETag
+    status, headers, body = estaticos.INDEX.responder(
+        request.headers.get('Accept-Encoding'),
+        request.headers.get('If-None-Match')
+    )
+    return Response(body, status, headers)
 
 def run():
     """
     Função para iniciar a aplicação quando instalada como pacote
+    
+    "consulta-ceis triagem ..." executa a triagem em lote e "consulta-ceis
+    monitoramento ..." administra a lista de monitoramento pela linha de
+    comando, sem iniciar o servidor.
     """
-    # Cria o arquivo HTML na pasta static
-    create_html_file()
+    if sys.argv[1:2] == ['triagem']:
+        import triagem
+        sys.exit(triagem.main(sys.argv[2:]))
+    if sys.argv[1:2] == ['monitoramento']:
+        sys.exit(monitoramento.main(sys.argv[2:]))
     
     # Configura a porta do servidor (padrão: 5000)
     port = int(os.environ.get('PORT', 5000))
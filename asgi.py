@@ -0,0 +1,247 @@
+"""
+Modo de execução assíncrono (ASGI) da consulta CEIS
+
+Expõe as mesmas rotas da aplicação Flask (/api/consulta-ceis e /), com o
+mesmo formato de resposta, mas usando um cliente HTTP assíncrono: um único
+worker mantém milhares de consultas em andamento sem uma thread por consulta.
+
+Uso:
+    uvicorn asgi:app --workers 4
+"""
+import asyncio
+import contextlib
+import functools
+import time
+
+try:
+    from starlette.applications import Starlette
+    from starlette.concurrency import run_in_threadpool
+    from starlette.middleware import Middleware
+    from starlette.middleware.cors import CORSMiddleware
+    from starlette.responses import Response
+    from starlette.routing import Route
+    import httpx
+except ImportError as e:
+    raise ImportError(
+        "O modo ASGI requer dependências extras: pip install consulta-ceis[asgi]"
+    ) from e
+
+import cache
+import cadastros
+import consulta
+import estaticos
+import metricas
+import projecao
+import serializacao
+import singleflight
+import upstream
+
+# Consultas em andamento, compartilhadas entre as corrotinas deste worker
+inflight = singleflight.AsyncSingleFlight()
+
+# Cliente HTTP assíncrono, criado na inicialização do worker
+client = None
+
+
+async def consultar(token, cnpj=None, cpf=None, cadastro='ceis'):
+    """
+    Versão assíncrona de consulta.consultar, com o mesmo cache e formato de retorno
+
+    O bloqueio entre processos por arquivo não é usado aqui, pois bloquearia o
+    event loop; workers distintos continuam compartilhando o cache configurado.
+    Os trechos que acessam SQLite (cache compartilhado, disjuntor, limite de
+    taxa, pool de tokens) rodam no pool de threads, fora do event loop.
+    """
+    cache_key = cache.chave_cache(cnpj, cpf, cadastro)
+    resultado = await run_in_threadpool(_consultar_cache, cache_key, cnpj, cpf, cadastro)
+    if resultado is None:
+        # Consultas simultâneas ao mesmo documento compartilham uma única chamada à API
+        resultado = await inflight.do(cache_key, lambda: _consultar_api(token, cnpj, cpf, cache_key, cadastro))
+        resultado = await run_in_threadpool(consulta.registrar, cache_key, resultado)
+    return resultado
+
+
+def _consultar_cache(cache_key, cnpj, cpf, cadastro):
+    """
+    Busca o resultado em cache (executada no pool de threads)
+
+    Resultados expirados há pouco são servidos enquanto uma thread os atualiza em segundo plano.
+    """
+    consulta.atualizador.registrar(cache_key, cnpj, cpf, cadastro)
+    resultado = consulta.buscar_cache(cache_key) or consulta.revalidar(cache_key)
+    return None if resultado is None else consulta.registrar(cache_key, resultado)
+
+
+def _antes_da_chamada(token, cnpj, cpf, cache_key, cadastro):
+    """
+    Escolhe o token e aplica o disjuntor e o limite de taxa (executada no pool de threads)
+
+    Retorna (parâmetros, credencial, None) se a chamada pode seguir ou
+    (None, None, resultado) caso contrário.
+    """
+    token, credencial = consulta.escolher_token(token)
+    if token is None:
+        return None, None, consulta.resultado_desatualizado(cache_key) or consulta.sem_token()
+
+    # No modo assíncrono o limite de taxa não espera por vaga, para não ocupar o pool de threads
+    bloqueio = consulta.verificar_disponibilidade(token, cache_key, aguardar=False, cadastro=cadastro)
+    if bloqueio is not None:
+        consulta.liberar_token(credencial)
+        return None, None, bloqueio
+    return consulta.montar_parametros(token, cnpj, cpf), credencial, None
+
+
+def _apos_resposta(cache_key, response, credencial, inicio, cadastro):
+    """
+    Registra a resposta no disjuntor, no cache e no pool de tokens (executada no pool de threads)
+    """
+    consulta.disjuntor(cadastro).registrar(response.status_code < 500)
+    resultado = consulta.processar_resposta(cache_key, response.status_code, lambda: serializacao.loads(response.content))
+    consulta.liberar_token(credencial, inicio, response.status_code, resultado[0])
+    return resultado
+
+
+def _apos_falha(credencial, inicio, cadastro, registrar_falha):
+    if registrar_falha:
+        metricas.UPSTREAM_RESPONSES.inc(status='excecao')
+        consulta.disjuntor(cadastro).registrar(False)
+    consulta.liberar_token(credencial, inicio)
+
+
+async def _consultar_api(token, cnpj, cpf, cache_key, cadastro='ceis'):
+    """
+    Realiza a chamada assíncrona à API da Infosimples
+    """
+    params, credencial, resultado = await run_in_threadpool(_antes_da_chamada, token, cnpj, cpf, cache_key, cadastro)
+    if resultado is not None:
+        return resultado
+
+    enviar = functools.partial(_tentativa, cadastro=cadastro)
+    inicio = time.perf_counter()
+    try:
+        response, erro, credencial, inicio = await consulta.hedger.executar_async(
+            functools.partial(enviar, params, credencial),
+            functools.partial(run_in_threadpool, consulta.preparar_reserva, params, credencial, enviar),
+            consulta.tentativa_ok, _descartar_tentativa
+        )
+        if erro is not None:
+            raise erro
+        return await run_in_threadpool(_apos_resposta, cache_key, response, credencial, inicio, cadastro)
+    except httpx.HTTPError as e:
+        await run_in_threadpool(_apos_falha, credencial, inicio, cadastro, True)
+        return consulta.erro_requisicao(e)
+    except Exception as e:
+        await run_in_threadpool(_apos_falha, credencial, inicio, cadastro, False)
+        return consulta.erro_interno(e)
+
+
+async def _tentativa(params, credencial, cadastro='ceis'):
+    """
+    Faz uma chamada assíncrona à API sem levantar exceções (ver consulta._tentativa)
+    """
+    inicio = time.perf_counter()
+    metricas.UPSTREAM_INFLIGHT.inc()
+    try:
+        with metricas.medir(metricas.UPSTREAM_SECONDS, 'upstream'):
+            response = await upstream.post_async(client, params, url=cadastros.url(cadastro))
+    except Exception as e:
+        return None, e, credencial, inicio
+    finally:
+        metricas.UPSTREAM_INFLIGHT.dec()
+    consulta.hedger.registrar(time.perf_counter() - inicio)
+    metricas.UPSTREAM_RESPONSES.inc(status=response.status_code)
+    return response, None, credencial, inicio
+
+
+def _descartar_tentativa(tentativa):
+    # Chamada pelo event loop ao fim da tentativa perdedora; a liberação do token acessa SQLite
+    asyncio.get_running_loop().run_in_executor(None, consulta.descartar_tentativa, tentativa)
+
+
+def _json(payload, status=200):
+    # Mesma serialização do jsonify da aplicação Flask, para manter respostas idênticas
+    return Response(serializacao.dumps(payload) + b"\n", status_code=status, media_type='application/json')
+
+
+async def consulta_ceis(request):
+    """
+    Endpoint para consultar CEIS na API da Infosimples
+
+    Parâmetros esperados:
+    - token: Token de acesso à API (dispensado com source=local ou com CEIS_TOKENS configurado)
+    - cnpj: CNPJ da empresa (opcional)
+    - cpf: CPF do indivíduo (opcional)
+    - source: "api" (padrão) ou "local" para consultar a base local do CEIS
+    - fields: campos da resposta, separados por vírgula
+    - modo: "completo" (padrão), "veredito" ou "resumo"
+    - offset, limit: página das sanções
+    """
+    # Recupera os dados do formulário
+    form = await request.form()
+    token = form.get('token')
+    cnpj = form.get('cnpj')
+    cpf = form.get('cpf')
+    fonte = form.get('source', 'api')
+
+    # Valida parâmetros obrigatórios
+    erro = consulta.validar_parametros(token, cnpj, cpf, fonte)
+    if erro is None:
+        apresentacao, erro = projecao.ler_parametros(
+            form.get('modo') or request.query_params.get('modo'),
+            form.get('fields') or request.query_params.get('fields')
+        )
+    if erro is None:
+        pagina, erro = projecao.ler_pagina(
+            form.get('offset') or request.query_params.get('offset'),
+            form.get('limit') or request.query_params.get('limit')
+        )
+    if erro:
+        metricas.LOOKUPS.inc(resultado='invalido')
+        return _json(*erro)
+
+    if fonte == 'local':
+        payload, status, cache_status, age = await run_in_threadpool(consulta.consultar_local, cnpj, cpf)
+    else:
+        payload, status, cache_status, age = await consultar(token, cnpj, cpf)
+    metricas.LOOKUPS.inc(resultado=consulta.resultado_metrica(status, cache_status))
+
+    with metricas.medir(metricas.SERIALIZE_SECONDS, 'serialize'):
+        response = _json(projecao.aplicar(payload, *apresentacao, pagina=pagina), status)
+    response.headers['X-Cache'] = cache_status
+    response.headers['Age'] = str(int(age))
+    return response
+
+
+async def metrics(request):
+    return Response(metricas.exportar(), media_type='text/plain; version=0.0.4')
+
+
+async def index(request):
+    status, headers, body = estaticos.INDEX.responder(
+        request.headers.get('accept-encoding'),
+        request.headers.get('if-none-match')
+    )
+    return Response(body, status_code=status, headers=headers)
+
+
+@contextlib.asynccontextmanager
+async def lifespan(app):
+    global client
+
+    client = upstream.criar_cliente_async()
+    try:
+        yield
+    finally:
+        await client.aclose()
+
+
+app = Starlette(
+    routes=[
+        Route('/api/consulta-ceis', consulta_ceis, methods=['POST']),
+        Route('/metrics', metrics),
+        Route('/', index)
+    ],
+    # Habilita CORS para permitir requisições do frontend
+    middleware=[Middleware(CORSMiddleware, allow_origins=['*'], allow_methods=['*'], allow_headers=['*'])],
+    lifespan=lifespan
+)
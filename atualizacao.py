@@ -0,0 +1,134 @@
+"""
+Atualização em segundo plano dos resultados em cache
+
+Implementa o stale-while-revalidate: um resultado expirado há pouco tempo é
+devolvido imediatamente enquanto uma nova consulta à API é feita em segundo
+plano. Além disso, os documentos mais consultados são atualizados
+periodicamente antes de expirarem, para que continuem sendo servidos do cache.
+
+As atualizações usam apenas os tokens do servidor (CEIS_TOKENS): o token
+informado em uma consulta nunca é guardado nem reutilizado. Ambas ficam
+desativadas por padrão, pois cada atualização é uma chamada cobrada.
+"""
+import os
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+# Por quanto tempo, após expirar, um resultado ainda é servido enquanto é atualizado (0 desativa)
+SWR_WINDOW = float(os.environ.get('CEIS_CACHE_SWR', 0))
+
+# Intervalo, em segundos, entre as atualizações dos documentos mais consultados (0 desativa)
+REFRESH_INTERVAL = float(os.environ.get('CEIS_REFRESH_INTERVAL', 0))
+
+# Quantidade de documentos mais consultados mantidos atualizados (0 desativa)
+REFRESH_TOP = int(os.environ.get('CEIS_REFRESH_TOP', 0))
+
+# Antecedência, em segundos, com que um documento frequente é atualizado antes de expirar
+REFRESH_AHEAD = float(os.environ.get('CEIS_REFRESH_AHEAD', 900))
+
+# Consultas à API feitas simultaneamente em segundo plano
+REFRESH_WORKERS = int(os.environ.get('CEIS_REFRESH_WORKERS', 2))
+
+
+class Atualizador:
+    """
+    Agenda atualizações em segundo plano e acompanha os documentos mais consultados
+
+    atualizar(cnpj, cpf, cache_key, antecedencia, cadastro) faz a consulta à API e
+    deve ignorar documentos que não precisam mais de atualização (por exemplo,
+    atualizados por outro worker nesse meio tempo).
+    """
+
+    def __init__(self, atualizar, workers=REFRESH_WORKERS, top=REFRESH_TOP,
+                 intervalo=REFRESH_INTERVAL, antecedencia=REFRESH_AHEAD):
+        self.atualizar = atualizar
+        self.workers = workers
+        self.top = top
+        self.intervalo = intervalo
+        self.antecedencia = antecedencia
+        self._frequencia = Counter()
+        # Documento e cadastro de cada chave; o token da consulta não é guardado
+        self._documentos = {}
+        self._pendentes = set()
+        self._executor = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def iniciar(self):
+        """
+        Cria o pool de atualização e o agendador deste processo, se necessário
+
+        Após um fork, ambos são recriados no worker.
+        """
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._pendentes = set()
+            self._executor = ThreadPoolExecutor(max_workers=max(self.workers, 1),
+                                                thread_name_prefix='ceis-atualizacao')
+            if self.intervalo > 0 and self.top > 0:
+                threading.Thread(target=self._loop, daemon=True).start()
+
+    def registrar(self, cache_key, cnpj=None, cpf=None, cadastro='ceis'):
+        """
+        Contabiliza uma consulta ao documento
+        """
+        self.iniciar()
+        with self._lock:
+            self._frequencia[cache_key] += 1
+            self._documentos[cache_key] = (cnpj, cpf, cadastro)
+            # Limita a memória usada, mantendo apenas os documentos mais frequentes
+            if len(self._frequencia) > self.top * 20 + 1000:
+                self._descartar(self.top * 10)
+
+    def agendar(self, cache_key, antecedencia=0):
+        """
+        Agenda a atualização do documento, se ainda não houver uma em andamento
+
+        Retorna True se a atualização foi agendada.
+        """
+        self.iniciar()
+        with self._lock:
+            parametros = self._documentos.get(cache_key)
+            if parametros is None or cache_key in self._pendentes:
+                return False
+            self._pendentes.add(cache_key)
+        self._executor.submit(self._executar, cache_key, parametros, antecedencia)
+        return True
+
+    def mais_consultados(self):
+        with self._lock:
+            return [cache_key for cache_key, _ in self._frequencia.most_common(self.top)]
+
+    def _descartar(self, manter):
+        mantidos = dict(self._frequencia.most_common(manter))
+        self._frequencia = Counter(mantidos)
+        self._documentos = {chave: self._documentos[chave] for chave in mantidos}
+
+    def _executar(self, cache_key, parametros, antecedencia):
+        cnpj, cpf, cadastro = parametros
+        try:
+            self.atualizar(cnpj, cpf, cache_key, antecedencia, cadastro)
+        except Exception:
+            # A falha na atualização não afeta as consultas: o resultado anterior continua no cache
+            pass
+        finally:
+            with self._lock:
+                self._pendentes.discard(cache_key)
+
+    def _loop(self):
+        while True:
+            time.sleep(self.intervalo)
+            for cache_key in self.mais_consultados():
+                self.agendar(cache_key, self.antecedencia)
+            # Reduz as contagens a cada ciclo, para que a lista reflita as consultas recentes
+            with self._lock:
+                self._frequencia = Counter({
+                    chave: contagem // 2 for chave, contagem in self._frequencia.items() if contagem > 1
+                })
+                self._documentos = {chave: self._documentos[chave] for chave in self._frequencia}
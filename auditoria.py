@@ -0,0 +1,284 @@
+"""
+Histórico de consultas (trilha de auditoria)
+
+Registra, para cada consulta respondida, o que o CEIS informava sobre o
+documento naquele momento, permitindo comprovar o resultado de uma data
+sem consultar a API novamente. O registro é somente de inclusão: gatilhos
+do SQLite impedem alterações e exclusões.
+
+As gravações não passam pelo caminho da requisição: os registros entram em
+uma fila em memória e uma thread de cada worker os grava em lotes.
+"""
+import atexit
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import deque
+
+import metricas
+
+# Grava o histórico de consultas (desativado por padrão; "1" ativa)
+AUDITORIA = os.environ.get('CEIS_AUDITORIA', '0').lower() in ('1', 'true', 'sim')
+
+# Arquivo SQLite do histórico
+AUDITORIA_PATH = os.environ.get('CEIS_AUDITORIA_PATH', 'ceis_auditoria.sqlite3')
+
+# Registros gravados por transação e intervalo máximo, em segundos, até a gravação
+BATCH_SIZE = int(os.environ.get('CEIS_AUDITORIA_BATCH', 1000))
+FLUSH_INTERVAL = float(os.environ.get('CEIS_AUDITORIA_INTERVAL', 0.5))
+
+# Registros aguardando gravação; acima disso, novos registros são descartados (e contados)
+MAX_PENDENTES = int(os.environ.get('CEIS_AUDITORIA_MAX_PENDENTES', 100000))
+
+SANCIONADO = 'sancionado'
+SEM_SANCAO = 'sem_sancao'
+ERRO = 'erro'
+
+# Origem do resultado registrado, a partir do status do cache
+FONTES = {'MISS': 'api', 'HIT': 'cache', 'STALE': 'cache_desatualizado', 'LOCAL': 'base_local'}
+
+
+def situacao_de(payload, status):
+    """
+    Resume o resultado de uma consulta em sancionado, sem_sancao ou erro
+    """
+    if status != 200 or payload.get('code') != 200:
+        return ERRO
+    return SANCIONADO if payload.get('data_count', 0) > 0 else SEM_SANCAO
+
+
+def _serializar(valor):
+    # Serialização canônica, para que o mesmo conteúdo gere sempre o mesmo hash
+    return json.dumps(valor, sort_keys=True, separators=(',', ':'), ensure_ascii=False)
+
+
+class AuditStore:
+    """
+    Histórico de consultas em SQLite, somente de inclusão
+    """
+
+    def __init__(self, path=AUDITORIA_PATH):
+        self.path = path
+        self._local = threading.local()
+
+    def _connect(self):
+        # Uma conexão por thread e por processo; as tabelas são criadas na primeira conexão
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.executescript(
+                # Resultados distintos, guardados uma única vez (consultas repetidas costumam ter o mesmo)
+                "CREATE TABLE IF NOT EXISTS resultados ("
+                " hash TEXT PRIMARY KEY,"
+                " valor TEXT NOT NULL);"
+                "CREATE TABLE IF NOT EXISTS consultas ("
+                " id INTEGER PRIMARY KEY AUTOINCREMENT,"
+                " documento TEXT NOT NULL,"
+                " consultado_em REAL NOT NULL,"
+                " obtido_em REAL NOT NULL,"
+                " fonte TEXT NOT NULL,"
+                " status INTEGER NOT NULL,"
+                " situacao TEXT NOT NULL,"
+                " data_count INTEGER NOT NULL,"
+                " hash TEXT NOT NULL,"
+                " hash_dados TEXT NOT NULL);"
+                "CREATE INDEX IF NOT EXISTS consultas_documento ON consultas (documento, consultado_em);"
+                "CREATE TRIGGER IF NOT EXISTS consultas_sem_alteracao BEFORE UPDATE ON consultas"
+                " BEGIN SELECT RAISE(ABORT, 'O histórico de consultas não pode ser alterado'); END;"
+                "CREATE TRIGGER IF NOT EXISTS consultas_sem_exclusao BEFORE DELETE ON consultas"
+                " BEGIN SELECT RAISE(ABORT, 'O histórico de consultas não pode ser alterado'); END;"
+                "CREATE TRIGGER IF NOT EXISTS resultados_sem_alteracao BEFORE UPDATE ON resultados"
+                " BEGIN SELECT RAISE(ABORT, 'O histórico de consultas não pode ser alterado'); END;"
+                "CREATE TRIGGER IF NOT EXISTS resultados_sem_exclusao BEFORE DELETE ON resultados"
+                " BEGIN SELECT RAISE(ABORT, 'O histórico de consultas não pode ser alterado'); END;"
+            )
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def gravar(self, registros):
+        """
+        Grava uma lista de registros (documento, consultado_em, idade, cache_status, payload, status)
+        em uma única transação
+        """
+        resultados = {}
+        consultas = []
+        for documento, consultado_em, idade, cache_status, payload, status in registros:
+            valor = _serializar(payload)
+            digest = hashlib.sha256(valor.encode('utf-8')).hexdigest()
+            resultados[digest] = valor
+            # O cabeçalho da API muda a cada chamada; mudanças de conteúdo são detectadas só pelos registros
+            hash_dados = hashlib.sha256(_serializar(payload.get('data')).encode('utf-8')).hexdigest()
+            consultas.append((
+                documento, consultado_em, consultado_em - idade, FONTES.get(cache_status, 'api'),
+                status, situacao_de(payload, status), payload.get('data_count', 0) or 0, digest, hash_dados
+            ))
+
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.executemany("INSERT OR IGNORE INTO resultados (hash, valor) VALUES (?, ?)", resultados.items())
+            conn.executemany(
+                "INSERT INTO consultas"
+                " (documento, consultado_em, obtido_em, fonte, status, situacao, data_count, hash, hash_dados)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                consultas
+            )
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+    def historico(self, documento, desde=None, ate=None, offset=0, limit=100, incluir_resultado=False):
+        """
+        Retorna as consultas de um documento (mais recentes primeiro) e as mudanças de situação
+
+        As transições consideram todo o período filtrado, não apenas a página retornada.
+        """
+        conn = self._connect()
+        filtros = "c.documento = ? AND c.consultado_em BETWEEN ? AND ?"
+        parametros = (documento, desde if desde is not None else 0, ate if ate is not None else float('inf'))
+
+        total = conn.execute(f"SELECT COUNT(*) FROM consultas c WHERE {filtros}", parametros).fetchone()[0]
+        rows = conn.execute(
+            "SELECT c.consultado_em, c.obtido_em, c.fonte, c.status, c.situacao, c.data_count, c.hash, r.valor"
+            " FROM consultas c LEFT JOIN resultados r ON r.hash = c.hash AND ?"
+            f" WHERE {filtros} ORDER BY c.consultado_em DESC, c.id DESC LIMIT ? OFFSET ?",
+            (incluir_resultado,) + parametros + (limit, offset)
+        ).fetchall()
+
+        consultas = []
+        for row in rows:
+            consulta = {
+                "consultado_em": row[0],
+                "obtido_em": row[1],
+                "fonte": row[2],
+                "status": row[3],
+                "situacao": row[4],
+                "data_count": row[5],
+                "hash": row[6]
+            }
+            if incluir_resultado:
+                consulta["resultado"] = json.loads(row[7]) if row[7] else None
+            consultas.append(consulta)
+
+        return {
+            "documento": documento,
+            "total": total,
+            "offset": offset,
+            "limit": limit,
+            "consultas": consultas,
+            "transicoes": self._transicoes(conn, filtros, parametros)
+        }
+
+    def _transicoes(self, conn, filtros, parametros):
+        # Mudanças na situação ou nos registros de sanção, em ordem cronológica; erros são ignorados
+        transicoes = []
+        anterior = None
+        cursor = conn.execute(
+            "SELECT c.consultado_em, c.obtido_em, c.situacao, c.data_count, c.hash, c.hash_dados"
+            f" FROM consultas c WHERE {filtros} AND c.situacao != ? ORDER BY c.consultado_em, c.id",
+            parametros + (ERRO,)
+        )
+        for consultado_em, obtido_em, situacao, data_count, digest, hash_dados in cursor:
+            if anterior is not None and hash_dados != anterior[2]:
+                transicoes.append({
+                    "em": consultado_em,
+                    "obtido_em": obtido_em,
+                    "de": anterior[0],
+                    "para": situacao,
+                    "data_count_anterior": anterior[1],
+                    "data_count": data_count,
+                    "hash": digest
+                })
+            anterior = (situacao, data_count, hash_dados)
+        return transicoes
+
+
+class AuditWriter:
+    """
+    Fila em memória gravada em lotes por uma thread de cada worker
+    """
+
+    def __init__(self, store, batch_size=BATCH_SIZE, intervalo=FLUSH_INTERVAL, max_pendentes=MAX_PENDENTES):
+        self.store = store
+        self.batch_size = batch_size
+        self.intervalo = intervalo
+        self.max_pendentes = max_pendentes
+        self._fila = deque()
+        self._acordar = threading.Event()
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def iniciar(self):
+        """
+        Inicia a thread de gravação deste processo, se ainda não estiver em execução
+
+        Após um fork, a thread é recriada no worker.
+        """
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._fila = deque()
+            threading.Thread(target=self._loop, daemon=True).start()
+            atexit.register(self.esvaziar)
+
+    def registrar(self, documento, payload, status, cache_status, idade):
+        """
+        Enfileira o registro de uma consulta; não bloqueia nem acessa o disco
+        """
+        self.iniciar()
+        if len(self._fila) >= self.max_pendentes:
+            metricas.AUDIT_DROPPED.inc()
+            return
+        self._fila.append((documento, time.time(), idade, cache_status, payload, status))
+        if len(self._fila) >= self.batch_size:
+            self._acordar.set()
+
+    def esvaziar(self):
+        """
+        Grava imediatamente todos os registros pendentes
+        """
+        while self._fila:
+            self._gravar_lote()
+
+    def _gravar_lote(self):
+        lote = []
+        try:
+            while len(lote) < self.batch_size:
+                lote.append(self._fila.popleft())
+        except IndexError:
+            pass
+        if lote:
+            self.store.gravar(lote)
+            metricas.AUDIT_WRITES.inc(len(lote))
+
+    def _loop(self):
+        while True:
+            self._acordar.wait(self.intervalo)
+            self._acordar.clear()
+            try:
+                self.esvaziar()
+            except Exception:
+                # Uma falha de gravação (ex.: disco cheio) não derruba a thread; o lote é descartado
+                metricas.AUDIT_ERRORS.inc()
+
+
+store = AuditStore()
+writer = AuditWriter(store)
+
+
+def registrar(documento, payload, status, cache_status, idade):
+    """
+    Registra no histórico o resultado de uma consulta, se a auditoria estiver ativa
+    """
+    if AUDITORIA:
+        writer.registrar(documento, payload, status, cache_status, idade)
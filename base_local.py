@@ -0,0 +1,428 @@
+"""
+Base local do CEIS
+
+Importa o arquivo completo do CEIS publicado pelo Portal da Transparência
+(CSV ou ZIP) para um índice SQLite por documento, carregado em memória
+para consultas sem chamar a API da Infosimples. Importações seguintes
+aplicam apenas as diferenças em relação ao índice atual.
+
+Uso:
+    python base_local.py importar 20250101_CEIS.zip
+    python base_local.py alteracoes --desde 3
+"""
+import argparse
+import csv
+import hashlib
+import io
+import json
+import os
+import sqlite3
+import sys
+import threading
+import time
+import unicodedata
+import zipfile
+from collections import Counter
+
+import cache
+
+# Arquivo SQLite com o índice da base local
+LOCAL_PATH = os.environ.get('CEIS_LOCAL_PATH', 'ceis_local.sqlite3')
+
+# Colunas do arquivo do Portal da Transparência (sem acentos) e o campo correspondente na resposta
+COLUNAS = {
+    'CPF OU CNPJ DO SANCIONADO': 'documento',
+    'TIPO DE PESSOA': 'tipo_pessoa',
+    'NOME DO SANCIONADO': 'nome',
+    'NOME INFORMADO PELO ORGAO SANCIONADOR': 'nome_informado',
+    'RAZAO SOCIAL - CADASTRO RECEITA': 'cadastro_receita',
+    'NOME FANTASIA - CADASTRO RECEITA': 'nome_fantasia',
+    'CODIGO DA SANCAO': 'codigo',
+    'NUMERO DO PROCESSO': 'processo',
+    'CATEGORIA DA SANCAO': 'tipo',
+    'DATA INICIO SANCAO': 'inicio_data',
+    'DATA FINAL SANCAO': 'fim_data',
+    'DATA PUBLICACAO': 'publicacao_data',
+    'DATA DO TRANSITO EM JULGADO': 'transito_julgado_data',
+    'ABRANGENCIA DEFINIDA EM DECISAO JUDICIAL': 'abrangencia',
+    'FUNDAMENTACAO LEGAL': 'fundamentacao_legal',
+    'OBSERVACOES': 'observacoes',
+    'ORGAO SANCIONADOR': 'orgao_nome',
+    'UF ORGAO SANCIONADOR': 'orgao_uf',
+    'ESFERA ORGAO SANCIONADOR': 'orgao_esfera',
+}
+
+
+def _sem_acentos(texto):
+    texto = unicodedata.normalize('NFKD', texto)
+    return ''.join(ch for ch in texto if not unicodedata.combining(ch)).strip().upper()
+
+
+def _abrir_csv(caminho):
+    """
+    Abre o CSV do CEIS, extraindo-o do ZIP quando necessário
+
+    Os arquivos do Portal da Transparência usam ";" e codificação ISO-8859-1.
+    """
+    if zipfile.is_zipfile(caminho):
+        arquivo = zipfile.ZipFile(caminho)
+        nome = next(n for n in arquivo.namelist() if n.lower().endswith('.csv'))
+        raw = arquivo.open(nome)
+    else:
+        raw = open(caminho, 'rb')
+    return io.TextIOWrapper(raw, encoding='latin-1', newline='')
+
+
+def ler_registros(caminho):
+    """
+    Lê o arquivo do CEIS e gera (documento normalizado, registro)
+
+    O registro segue o formato dos itens de "data" da API da Infosimples.
+    Documentos mascarados (como os CPFs do arquivo público) são ignorados,
+    pois não podem ser consultados pelo número completo.
+    """
+    with _abrir_csv(caminho) as texto:
+        reader = csv.reader(texto, delimiter=';')
+        header = [_sem_acentos(c) for c in next(reader)]
+        campos = [COLUNAS.get(c) for c in header]
+
+        for row in reader:
+            linha = {campo: valor.strip() for campo, valor in zip(campos, row) if campo}
+            documento = cache.normalizar_documento(linha.get('documento'))
+            if '*' in linha.get('documento', '') or len(documento) not in (11, 14):
+                continue
+            yield documento, montar_registro(documento, linha)
+
+
+def montar_registro(documento, linha):
+    """
+    Converte uma linha do arquivo no formato de item da API da Infosimples
+    """
+    return {
+        ('cnpj' if len(documento) == 14 else 'cpf'): documento,
+        "tipo_pessoa": linha.get('tipo_pessoa'),
+        "nome": linha.get('nome'),
+        "nome_informado": linha.get('nome_informado'),
+        "cadastro_receita": linha.get('cadastro_receita') or linha.get('nome'),
+        "nome_fantasia": linha.get('nome_fantasia'),
+        "orgao_sancionador": {
+            "nome": linha.get('orgao_nome'),
+            "uf": linha.get('orgao_uf'),
+            "esfera": linha.get('orgao_esfera')
+        },
+        "sancao": {
+            "codigo": linha.get('codigo'),
+            "tipo": linha.get('tipo'),
+            "fundamentacao_legal": linha.get('fundamentacao_legal'),
+            "inicio_data": linha.get('inicio_data'),
+            "fim_data": linha.get('fim_data'),
+            "publicacao_data": linha.get('publicacao_data'),
+            "transito_julgado_data": linha.get('transito_julgado_data'),
+            "abrangencia": linha.get('abrangencia'),
+            "processo": linha.get('processo'),
+            "observacoes": linha.get('observacoes')
+        }
+    }
+
+
+# Campos que identificam uma sanção sem código e não mudam entre versões do arquivo
+# (datas finais, observações e nomes podem ser corrigidos sem que seja outra sanção)
+CAMPOS_IDENTIDADE = ('tipo', 'inicio_data', 'processo', 'fundamentacao_legal')
+
+
+def _hash(valor):
+    return hashlib.sha1(json.dumps(valor, sort_keys=True, ensure_ascii=False).encode('utf-8')).hexdigest()
+
+
+def _identidade(documento, registro):
+    """
+    Chave de uma sanção a partir do código publicado pelo Portal ou, sem ele, dos campos estáveis
+    """
+    sancao = registro["sancao"]
+    if sancao.get("codigo"):
+        return sancao["codigo"]
+    return 'h:' + _hash([documento, registro["orgao_sancionador"].get("nome")] +
+                        [sancao.get(campo) for campo in CAMPOS_IDENTIDADE])
+
+
+def _chave_sancao(documento, registro, repetidas, vistas):
+    """
+    Identifica uma sanção entre versões do arquivo, independentemente da ordem das linhas
+
+    Usa o código da sanção ou os campos estáveis (_identidade). Identidades
+    repetidas no arquivo (repetidas) recebem também o hash do conteúdo, e
+    linhas idênticas, um sufixo; a chave não depende, assim, de qual linha
+    apareceu primeiro.
+    """
+    chave = _identidade(documento, registro)
+    if chave in repetidas:
+        chave += ':' + _hash(registro)
+    while chave in vistas:
+        chave += '+'
+    vistas.add(chave)
+    return chave
+
+
+def _criar_tabelas(conn):
+    conn.executescript(
+        "CREATE TABLE IF NOT EXISTS sancoes ("
+        " chave TEXT PRIMARY KEY,"
+        " documento TEXT NOT NULL,"
+        " hash TEXT NOT NULL,"
+        " dados TEXT NOT NULL);"
+        "CREATE INDEX IF NOT EXISTS sancoes_documento ON sancoes (documento);"
+        "CREATE TABLE IF NOT EXISTS alteracoes ("
+        " versao INTEGER NOT NULL,"
+        " documento TEXT NOT NULL,"
+        " chave TEXT NOT NULL,"
+        " operacao TEXT NOT NULL,"
+        " registrado_em REAL NOT NULL);"
+        "CREATE INDEX IF NOT EXISTS alteracoes_versao ON alteracoes (versao);"
+        "CREATE TABLE IF NOT EXISTS meta (chave TEXT PRIMARY KEY, valor TEXT NOT NULL);"
+    )
+
+
+def _compativel(conn):
+    # Índices gerados antes da atualização incremental não têm a coluna chave
+    colunas = [row[1] for row in conn.execute("PRAGMA table_info(sancoes)")]
+    return 'chave' in colunas
+
+
+def importar(caminho, destino=LOCAL_PATH, completo=False):
+    """
+    Atualiza o índice SQLite a partir de um arquivo do CEIS
+
+    O novo arquivo é comparado com o índice atual e apenas as sanções
+    inseridas, alteradas e removidas são aplicadas, registrando cada
+    mudança na tabela de alterações. A atualização é feita sobre uma cópia
+    que só então substitui o índice atual, de modo que leitores nunca veem
+    um índice incompleto. Com completo=True (ou sem índice anterior), o
+    índice é reconstruído do zero.
+
+    Retorna um resumo com a versão e as quantidades de cada operação.
+    """
+    temporario = destino + '.tmp'
+    if os.path.exists(temporario):
+        os.remove(temporario)
+
+    conn = sqlite3.connect(temporario)
+    versao_atual = 0
+    if os.path.exists(destino):
+        atual = sqlite3.connect(destino)
+        if _compativel(atual):
+            versao_atual = int(dict(atual.execute("SELECT chave, valor FROM meta")).get('versao', 0))
+            if not completo:
+                atual.backup(conn)
+        atual.close()
+    _criar_tabelas(conn)
+
+    # A numeração de versões continua mesmo em reconstruções completas
+    meta = dict(conn.execute("SELECT chave, valor FROM meta"))
+    versao = versao_atual + 1
+    agora = time.time()
+
+    # Estado atual: chave da sanção -> (documento, hash do conteúdo)
+    existentes = {chave: (documento, h) for chave, documento, h
+                  in conn.execute("SELECT chave, documento, hash FROM sancoes")}
+    inicial = not existentes
+
+    resumo = {"versao": versao, "inseridas": 0, "alteradas": 0, "removidas": 0}
+    alteracoes = []
+    vistas = set()
+    # Primeira leitura: identidades que aparecem mais de uma vez no arquivo
+    contagem = Counter(_identidade(documento, registro) for documento, registro in ler_registros(caminho))
+    repetidas = {identidade for identidade, n in contagem.items() if n > 1}
+    del contagem
+
+    conn.execute("BEGIN")
+    for documento, registro in ler_registros(caminho):
+        chave = _chave_sancao(documento, registro, repetidas, vistas)
+        dados = json.dumps(registro, ensure_ascii=False)
+        h = hashlib.sha1(dados.encode('utf-8')).hexdigest()
+
+        anterior = existentes.pop(chave, None)
+        if anterior is None:
+            operacao = 'inserida'
+        elif anterior[1] != h:
+            operacao = 'alterada'
+        else:
+            continue
+
+        conn.execute(
+            "INSERT OR REPLACE INTO sancoes (chave, documento, hash, dados) VALUES (?, ?, ?, ?)",
+            (chave, documento, h, dados)
+        )
+        resumo[operacao + 's'] += 1
+        # A carga inicial não é registrada como alteração
+        if not inicial:
+            alteracoes.append((versao, documento, chave, operacao, agora))
+
+    # Sanções que não constam mais do arquivo
+    for chave, (documento, _) in existentes.items():
+        conn.execute("DELETE FROM sancoes WHERE chave = ?", (chave,))
+        resumo["removidas"] += 1
+        alteracoes.append((versao, documento, chave, 'removida', agora))
+
+    conn.executemany(
+        "INSERT INTO alteracoes (versao, documento, chave, operacao, registrado_em) VALUES (?, ?, ?, ?, ?)",
+        alteracoes
+    )
+    total = conn.execute("SELECT COUNT(*) FROM sancoes").fetchone()[0]
+    conn.executemany("INSERT OR REPLACE INTO meta (chave, valor) VALUES (?, ?)", [
+        ('arquivo', os.path.basename(caminho)),
+        ('importado_em', str(agora)),
+        ('total', str(total)),
+        ('versao', str(versao)),
+        ('carga_completa', str(versao if inicial else meta.get('carga_completa', versao)))
+    ])
+    conn.commit()
+    conn.close()
+
+    os.replace(temporario, destino)
+    resumo["total"] = total
+    return resumo
+
+
+def listar_alteracoes(desde=0, path=LOCAL_PATH):
+    """
+    Retorna as alterações registradas após a versão informada
+    """
+    conn = sqlite3.connect(path)
+    try:
+        rows = conn.execute(
+            "SELECT versao, documento, chave, operacao, registrado_em FROM alteracoes"
+            " WHERE versao > ? ORDER BY versao, documento",
+            (desde,)
+        ).fetchall()
+    finally:
+        conn.close()
+    return [
+        {"versao": v, "documento": d, "chave": c, "operacao": o, "registrado_em": r}
+        for v, d, c, o, r in rows
+    ]
+
+
+class BaseLocal:
+    """
+    Índice em memória da base local, atualizado quando o arquivo muda
+
+    Após uma importação incremental, apenas os documentos alterados são
+    relidos; enquanto isso, as consultas continuam usando a versão anterior.
+    """
+
+    def __init__(self, path=LOCAL_PATH):
+        self.path = path
+        self._index = None
+        self._versao = None
+        self._importado_em = None
+        self._mtime = None
+        self._lock = threading.Lock()
+
+    def disponivel(self):
+        return os.path.exists(self.path)
+
+    def _carregar(self):
+        """
+        Carrega o índice na primeira consulta e sempre que o arquivo muda
+        """
+        mtime = os.stat(self.path).st_mtime
+        if self._index is not None and self._mtime == mtime:
+            return
+
+        # Se outra thread já está recarregando, segue com a versão atual
+        if not self._lock.acquire(blocking=self._index is None):
+            return
+        try:
+            if self._index is not None and self._mtime == mtime:
+                return
+            conn = sqlite3.connect(self.path)
+            try:
+                meta = dict(conn.execute("SELECT chave, valor FROM meta"))
+                versao = int(meta.get('versao', 0))
+                carga_completa = int(meta.get('carga_completa', versao))
+
+                if self._index is not None and self._versao is not None and self._versao >= carga_completa:
+                    index = self._aplicar_alteracoes(conn, self._index, self._versao)
+                else:
+                    index = {}
+                    for documento, dados in conn.execute("SELECT documento, dados FROM sancoes"):
+                        index.setdefault(documento, []).append(json.loads(dados))
+            finally:
+                conn.close()
+
+            # A troca da referência é atômica para as threads que estão consultando
+            self._index = index
+            self._versao = versao
+            self._importado_em = float(meta.get('importado_em', mtime))
+            self._mtime = mtime
+        finally:
+            self._lock.release()
+
+    def _aplicar_alteracoes(self, conn, index, desde):
+        """
+        Gera uma nova versão do índice relendo apenas os documentos alterados
+        """
+        index = dict(index)
+        documentos = [row[0] for row in conn.execute(
+            "SELECT DISTINCT documento FROM alteracoes WHERE versao > ?", (desde,)
+        )]
+        for documento in documentos:
+            registros = [json.loads(row[0]) for row in conn.execute(
+                "SELECT dados FROM sancoes WHERE documento = ?", (documento,)
+            )]
+            if registros:
+                index[documento] = registros
+            else:
+                index.pop(documento, None)
+        return index
+
+    def consultar(self, documento):
+        """
+        Retorna (registros, instante da importação) para um documento normalizado
+        """
+        self._carregar()
+        return self._index.get(documento, []), self._importado_em
+
+
+def main(argv=None):
+    """
+    Linha de comando para importar o arquivo do CEIS e listar alterações
+    """
+    parser = argparse.ArgumentParser(description="Base local do CEIS")
+    sub = parser.add_subparsers(dest='comando', required=True)
+
+    cmd = sub.add_parser('importar', help="Importa (ou atualiza) a base a partir de um arquivo CSV/ZIP do CEIS")
+    cmd.add_argument('arquivo', help="Arquivo baixado do Portal da Transparência")
+    cmd.add_argument('--destino', default=LOCAL_PATH, help="Arquivo do índice (padrão: %(default)s)")
+    cmd.add_argument('--completo', action='store_true', help="Reconstrói o índice do zero")
+    cmd.add_argument('--sem-nomes', action='store_true', help="Não atualiza o índice da busca por nome (nomes.py)")
+
+    cmd = sub.add_parser('alteracoes', help="Lista as sanções alteradas desde uma versão")
+    cmd.add_argument('--desde', type=int, default=0, help="Versão a partir da qual listar (padrão: %(default)s)")
+    cmd.add_argument('--base', default=LOCAL_PATH, help="Arquivo do índice (padrão: %(default)s)")
+
+    args = parser.parse_args(argv)
+
+    if args.comando == 'alteracoes':
+        for alteracao in listar_alteracoes(args.desde, args.base):
+            print(json.dumps(alteracao, ensure_ascii=False))
+        return 0
+
+    inicio = time.time()
+    resumo = importar(args.arquivo, args.destino, args.completo)
+    print(
+        f"Versão {resumo['versao']}: {resumo['inseridas']} inseridas, {resumo['alteradas']} alteradas, "
+        f"{resumo['removidas']} removidas ({resumo['total']} sanções) em {time.time() - inicio:.1f} s"
+    )
+
+    # O índice da busca por nome acompanha cada versão da base
+    if not args.sem_nomes:
+        import nomes
+        inicio = time.time()
+        resumo = nomes.construir(args.destino)
+        print(f"Índice de nomes: {resumo['entradas']} nomes em {time.time() - inicio:.1f} s")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,302 @@
+"""
+Teste de carga do endpoint de consulta individual
+
+Sobe o servidor falso da Infosimples e a aplicação (Gunicorn ou Uvicorn) em
+cada configuração de workers/threads, gera carga em /api/consulta-ceis com
+conexões keep-alive e mede requisições por segundo, latência (p50/p95/p99)
+e memória dos processos do servidor. O resultado é emitido em JSON.
+
+Uso:
+    python benchmarks/carga.py --configs 1x8,2x8,4x8 --duracao 20 --latencia 200 --saida resultado.json
+"""
+import argparse
+import http.client
+import json
+import os
+import platform
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from urllib.parse import urlencode
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import documentos  # noqa: E402
+import upstream_falso  # noqa: E402
+
+
+def porta_livre():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def gerar_documentos(quantidade, semente=42):
+    """
+    Gera CNPJs válidos e distintos
+    """
+    aleatorio = random.Random(semente)
+    bases = aleatorio.sample(range(10 ** 11, 10 ** 12), quantidade)
+    return [documentos.gerar_cnpj(f"{base:012d}") for base in bases]
+
+
+def memoria_processos(pid):
+    """
+    Soma a memória residente (RSS), em MB, do processo e de seus descendentes (apenas Linux)
+    """
+    total = 0
+    pendentes = [pid]
+    while pendentes:
+        atual = pendentes.pop()
+        try:
+            with open(f'/proc/{atual}/status') as f:
+                for linha in f:
+                    if linha.startswith('VmRSS:'):
+                        total += int(linha.split()[1])
+            for tarefa in os.listdir(f'/proc/{atual}/task'):
+                with open(f'/proc/{atual}/task/{tarefa}/children') as f:
+                    pendentes.extend(int(filho) for filho in f.read().split())
+        except (FileNotFoundError, ProcessLookupError):
+            continue
+        except OSError:
+            return None
+    return round(total / 1024, 1)
+
+
+def percentil(valores, p):
+    # Método nearest-rank sobre a lista ordenada
+    if not valores:
+        return None
+    indice = max(0, min(len(valores) - 1, int(round(p / 100 * len(valores) + 0.5)) - 1))
+    return valores[indice]
+
+
+def aguardar_porta(porta, processo=None, limite=30):
+    """
+    Aguarda um servidor local aceitar conexões na porta
+    """
+    fim = time.monotonic() + limite
+    while time.monotonic() < fim:
+        if processo is not None and processo.poll() is not None:
+            raise RuntimeError(f"O servidor encerrou ao iniciar (código {processo.returncode})")
+        try:
+            socket.create_connection(('127.0.0.1', porta), timeout=1).close()
+            return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError(f"O servidor não respondeu em {limite} s")
+
+
+def iniciar_servidor(servidor, workers, threads, porta, env):
+    if servidor == 'uvicorn':
+        comando = [sys.executable, '-m', 'uvicorn', 'asgi:app', '--host', '127.0.0.1', '--port', str(porta),
+                   '--workers', str(workers), '--no-access-log', '--log-level', 'warning']
+    else:
+        comando = [sys.executable, '-m', 'gunicorn', '--bind', f'127.0.0.1:{porta}', '--workers', str(workers),
+                   '--threads', str(threads), '--log-level', 'warning', 'app:app']
+    processo = subprocess.Popen(comando, cwd=RAIZ, env=env)
+    try:
+        aguardar_porta(porta, processo)
+    except RuntimeError:
+        processo.terminate()
+        raise
+    return processo
+
+
+def gerar_carga(porta, docs, concorrencia, aquecimento, duracao, token):
+    """
+    Mantém `concorrencia` clientes enviando consultas em sequência
+
+    Retorna (latências em segundos, contagem por status, duração medida).
+    """
+    latencias = []
+    status = {}
+    lock = threading.Lock()
+    inicio_medicao = time.monotonic() + aquecimento
+    fim = inicio_medicao + duracao
+    cabecalhos = {'Content-Type': 'application/x-www-form-urlencoded'}
+
+    def cliente(numero):
+        aleatorio = random.Random(numero)
+        conexao = http.client.HTTPConnection('127.0.0.1', porta, timeout=600)
+        minhas_latencias = []
+        meus_status = {}
+        while True:
+            agora = time.monotonic()
+            if agora >= fim:
+                break
+            corpo = urlencode({'token': token, 'cnpj': aleatorio.choice(docs)})
+            inicio = time.perf_counter()
+            try:
+                conexao.request('POST', '/api/consulta-ceis', corpo, cabecalhos)
+                resposta = conexao.getresponse()
+                resposta.read()
+                codigo = str(resposta.status)
+            except (OSError, http.client.HTTPException):
+                conexao.close()
+                conexao = http.client.HTTPConnection('127.0.0.1', porta, timeout=600)
+                codigo = 'excecao'
+            latencia = time.perf_counter() - inicio
+            # Requisições iniciadas durante o aquecimento não entram na medição
+            if agora >= inicio_medicao:
+                minhas_latencias.append(latencia)
+                meus_status[codigo] = meus_status.get(codigo, 0) + 1
+        conexao.close()
+        with lock:
+            latencias.extend(minhas_latencias)
+            for codigo, quantidade in meus_status.items():
+                status[codigo] = status.get(codigo, 0) + quantidade
+
+    clientes = [threading.Thread(target=cliente, args=(i,)) for i in range(concorrencia)]
+    for c in clientes:
+        c.start()
+    for c in clientes:
+        c.join()
+    # As últimas requisições podem terminar depois do fim previsto
+    return latencias, status, max(duracao, time.monotonic() - inicio_medicao)
+
+
+def executar_configuracao(args, workers, threads, porta_upstream, pasta):
+    porta = porta_livre()
+    env = dict(os.environ)
+    env.update({
+        'CEIS_API_URL': f'http://127.0.0.1:{porta_upstream}/',
+        'CEIS_CACHE_BACKEND': args.cache,
+        'CEIS_POOL_SIZE': str(max(threads, 10)),
+        # Arquivos de estado em uma pasta temporária, separada por configuração
+        'CEIS_CACHE_PATH': os.path.join(pasta, f'cache-{workers}x{threads}.sqlite3'),
+        'CEIS_RESILIENCIA_PATH': os.path.join(pasta, f'resiliencia-{workers}x{threads}.sqlite3'),
+        'CEIS_JOBS_PATH': os.path.join(pasta, f'jobs-{workers}x{threads}.sqlite3'),
+        'CEIS_AUDITORIA_PATH': os.path.join(pasta, f'auditoria-{workers}x{threads}.sqlite3'),
+        'CEIS_LOCAL_PATH': os.path.join(pasta, 'sem-base-local.sqlite3'),
+        'CEIS_REFRESH_INTERVAL': '0'
+    })
+    processo = iniciar_servidor(args.servidor, workers, threads, porta, env)
+    try:
+        memoria_inicial = memoria_processos(processo.pid)
+        pico = [memoria_inicial]
+        ativo = threading.Event()
+        ativo.set()
+
+        def amostrar():
+            while ativo.is_set():
+                memoria = memoria_processos(processo.pid)
+                if memoria is not None:
+                    pico[0] = max(pico[0] or 0, memoria)
+                time.sleep(0.5)
+
+        amostrador = threading.Thread(target=amostrar, daemon=True)
+        amostrador.start()
+        latencias, status, medido = gerar_carga(
+            porta, gerar_documentos(args.documentos), args.concorrencia, args.aquecimento, args.duracao, args.token
+        )
+        ativo.clear()
+        amostrador.join()
+        memoria_final = memoria_processos(processo.pid)
+    finally:
+        processo.terminate()
+        processo.wait(timeout=30)
+
+    latencias.sort()
+    total = len(latencias)
+    return {
+        "servidor": args.servidor,
+        "workers": workers,
+        "threads": threads if args.servidor == 'gunicorn' else None,
+        "requisicoes": total,
+        "duracao_s": round(medido, 3),
+        "rps": round(total / medido, 2) if medido else 0,
+        "status": status,
+        "latencia_ms": {
+            "media": round(sum(latencias) / total * 1000, 3) if total else None,
+            "p50": round(percentil(latencias, 50) * 1000, 3) if total else None,
+            "p95": round(percentil(latencias, 95) * 1000, 3) if total else None,
+            "p99": round(percentil(latencias, 99) * 1000, 3) if total else None,
+            "max": round(latencias[-1] * 1000, 3) if total else None
+        },
+        "memoria_mb": {"inicial": memoria_inicial, "pico": pico[0], "final": memoria_final}
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Teste de carga de /api/consulta-ceis com a API simulada")
+    parser.add_argument('--configs', default='1x8,2x8,4x8',
+                        help="Configurações WORKERSxTHREADS separadas por vírgula (ex.: 1x8,4x4)")
+    parser.add_argument('--servidor', choices=('gunicorn', 'uvicorn'), default='gunicorn')
+    parser.add_argument('--duracao', type=float, default=10, help="Segundos de medição por configuração")
+    parser.add_argument('--aquecimento', type=float, default=2, help="Segundos de aquecimento, fora da medição")
+    parser.add_argument('--concorrencia', type=int, default=32, help="Clientes simultâneos")
+    parser.add_argument('--documentos', type=int, default=1000,
+                        help="CNPJs distintos consultados (menos documentos = mais acertos no cache)")
+    parser.add_argument('--cache', default='memory', help="CEIS_CACHE_BACKEND da aplicação (memory, sqlite ou none)")
+    parser.add_argument('--token', default='benchmark')
+    parser.add_argument('--saida', help="Arquivo JSON de saída (padrão: saída padrão)")
+    upstream_falso.adicionar_argumentos(parser)
+    args = parser.parse_args()
+
+    configuracoes = []
+    for item in args.configs.split(','):
+        workers, _, threads = item.strip().partition('x')
+        configuracoes.append((int(workers), int(threads or 1)))
+
+    # A API simulada roda em outro processo, para não disputar o GIL com os clientes
+    porta_upstream = porta_livre()
+    servidor_falso = subprocess.Popen([
+        sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'upstream_falso.py'),
+        '--porta', str(porta_upstream),
+        '--latencia', str(args.latencia), '--jitter', str(args.jitter),
+        '--erros', str(args.erros), '--status-erro', str(args.status_erro),
+        '--sancionados', str(args.sancionados), '--registros', str(args.registros),
+        '--preenchimento', str(args.preenchimento)
+    ], stdout=subprocess.DEVNULL)
+
+    resultados = []
+    try:
+        aguardar_porta(porta_upstream)
+        with tempfile.TemporaryDirectory(prefix='ceis-carga-') as pasta:
+            for workers, threads in configuracoes:
+                print(f"Medindo {args.servidor} {workers}x{threads}...", file=sys.stderr, flush=True)
+                resultados.append(executar_configuracao(args, workers, threads, porta_upstream, pasta))
+        conexao = http.client.HTTPConnection('127.0.0.1', porta_upstream, timeout=5)
+        conexao.request('GET', '/')
+        chamadas_upstream = json.loads(conexao.getresponse().read())
+        conexao.close()
+    finally:
+        servidor_falso.terminate()
+        servidor_falso.wait(timeout=30)
+
+    relatorio = {
+        "gerado_em": time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        "ambiente": {
+            "python": platform.python_version(),
+            "sistema": platform.platform(),
+            "cpus": os.cpu_count()
+        },
+        "parametros": {
+            "duracao_s": args.duracao,
+            "aquecimento_s": args.aquecimento,
+            "concorrencia": args.concorrencia,
+            "documentos": args.documentos,
+            "cache": args.cache,
+            "upstream": vars(upstream_falso.configuracao_de(args))
+        },
+        "upstream_chamadas": chamadas_upstream,
+        "resultados": resultados
+    }
+
+    saida = json.dumps(relatorio, ensure_ascii=False, indent=2)
+    if args.saida:
+        with open(args.saida, 'w', encoding='utf-8') as f:
+            f.write(saida + '\n')
+    else:
+        print(saida)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,203 @@
+"""
+Servidor que imita a API da Infosimples (consulta CEIS) para testes de carga
+
+Responde no mesmo formato da API, com latência, taxa de erros e tamanho de
+resposta configuráveis, sem consumir créditos. Aponte a aplicação para ele
+com CEIS_API_URL.
+
+Uso:
+    python benchmarks/upstream_falso.py --porta 8765 --latencia 200 --erros 0.01
+    CEIS_API_URL=http://127.0.0.1:8765/ gunicorn app:app
+"""
+import argparse
+import hashlib
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs
+
+
+class Configuracao:
+    """
+    Comportamento do servidor falso
+    """
+
+    def __init__(self, latencia=0.0, jitter=0.0, erros=0.0, status_erro=500,
+                 sancionados=0.2, registros=1, preenchimento=0):
+        self.latencia = latencia            # latência média, em milissegundos
+        self.jitter = jitter                # desvio padrão da latência, em milissegundos
+        self.erros = erros                  # fração das chamadas respondidas com status_erro
+        self.status_erro = status_erro
+        self.sancionados = sancionados      # fração dos documentos com sanção
+        self.registros = registros          # sanções por documento sancionado
+        self.preenchimento = preenchimento  # bytes extras por registro, para simular respostas grandes
+
+
+class Estatisticas:
+    def __init__(self):
+        self.chamadas = 0
+        self.erros = 0
+        self._lock = threading.Lock()
+
+    def registrar(self, erro):
+        with self._lock:
+            self.chamadas += 1
+            self.erros += erro
+
+    def exportar(self):
+        with self._lock:
+            return {"chamadas": self.chamadas, "erros": self.erros}
+
+
+def sancionado(documento, fracao):
+    # Decisão determinística por documento, para que repetições tenham o mesmo resultado
+    return int(hashlib.sha1(documento.encode('utf-8')).hexdigest()[:8], 16) % 10000 < fracao * 10000
+
+
+def montar_resposta(params, config, inicio):
+    """
+    Monta uma resposta no formato da API da Infosimples
+    """
+    documento = params.get('cnpj') or params.get('cpf') or ''
+    tipo = 'cnpj' if params.get('cnpj') else 'cpf'
+    data = []
+    if sancionado(documento, config.sancionados):
+        for i in range(config.registros):
+            data.append({
+                tipo: documento,
+                "tipo_pessoa": "Jurídica" if tipo == 'cnpj' else "Física",
+                "nome": f"EMPRESA TESTE {documento}",
+                "nome_informado": f"EMPRESA TESTE {documento}",
+                "cadastro_receita": f"EMPRESA TESTE {documento}",
+                "nome_fantasia": "TESTE",
+                "orgao_sancionador": {"nome": "Controladoria-Geral da União", "uf": "DF", "esfera": "Federal"},
+                "sancao": {
+                    "codigo": f"{documento}-{i}",
+                    "tipo": "Impedimento/proibição de contratar com prazo determinado",
+                    "fundamentacao_legal": "Lei 14.133/2021, art. 156, III",
+                    "inicio_data": "01/01/2024",
+                    "fim_data": "01/01/2027",
+                    "publicacao_data": "02/01/2024",
+                    "transito_julgado_data": None,
+                    "abrangencia": "Todas as esferas em todos os poderes",
+                    "processo": f"00000.{i:06d}/2024-00",
+                    "observacoes": "x" * config.preenchimento
+                }
+            })
+
+    return {
+        "code": 200,
+        "code_message": "A requisição foi processada com sucesso.",
+        "header": {
+            "api_version": "v2",
+            "service": "cgu/ceis",
+            "parameters": {tipo: documento},
+            "client_name": "Benchmark",
+            "token_name": "benchmark",
+            "billable": True,
+            "price": "0.0",
+            "requested_at": time.strftime('%Y-%m-%dT%H:%M:%S', time.localtime(inicio)),
+            "elapsed_time_in_milliseconds": int((time.time() - inicio) * 1000),
+            "remote_ip": "127.0.0.1",
+            "signature": hashlib.sha256(documento.encode('utf-8')).hexdigest()
+        },
+        "data_count": len(data),
+        "data": data,
+        "errors": [],
+        "site_receipts": []
+    }
+
+
+def criar_servidor(porta=8765, config=None, host='127.0.0.1'):
+    """
+    Cria o servidor falso (ainda não iniciado); use serve_forever ou iniciar
+    """
+    config = config or Configuracao()
+    estatisticas = Estatisticas()
+
+    class Handler(BaseHTTPRequestHandler):
+        # HTTP/1.1 mantém as conexões abertas, como a API real
+        protocol_version = 'HTTP/1.1'
+
+        def do_POST(self):
+            inicio = time.time()
+            tamanho = int(self.headers.get('Content-Length', 0))
+            params = {chave: valores[0] for chave, valores in parse_qs(self.rfile.read(tamanho).decode('utf-8')).items()}
+
+            atraso = max(0.0, random.gauss(config.latencia, config.jitter)) / 1000
+            if atraso:
+                time.sleep(atraso)
+
+            erro = random.random() < config.erros
+            estatisticas.registrar(erro)
+            if erro:
+                self._responder(config.status_erro, {"code": 600, "code_message": "Erro simulado", "errors": ["Erro simulado"]})
+            else:
+                self._responder(200, montar_resposta(params, config, inicio))
+
+        def do_GET(self):
+            # Contadores de chamadas, para conferir quantas consultas chegaram à "API"
+            self._responder(200, estatisticas.exportar())
+
+        def _responder(self, status, payload):
+            corpo = json.dumps(payload).encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json; charset=utf-8')
+            self.send_header('Content-Length', str(len(corpo)))
+            self.end_headers()
+            self.wfile.write(corpo)
+
+        def log_message(self, *args):
+            pass
+
+    servidor = ThreadingHTTPServer((host, porta), Handler)
+    servidor.daemon_threads = True
+    servidor.estatisticas = estatisticas
+    return servidor
+
+
+def iniciar(porta=8765, config=None):
+    """
+    Inicia o servidor falso em uma thread e o retorna
+    """
+    servidor = criar_servidor(porta, config)
+    threading.Thread(target=servidor.serve_forever, daemon=True).start()
+    return servidor
+
+
+def adicionar_argumentos(parser):
+    parser.add_argument('--latencia', type=float, default=0, help="Latência média, em milissegundos")
+    parser.add_argument('--jitter', type=float, default=0, help="Desvio padrão da latência, em milissegundos")
+    parser.add_argument('--erros', type=float, default=0, help="Fração das chamadas com erro (0 a 1)")
+    parser.add_argument('--status-erro', type=int, default=500, help="Status HTTP das respostas com erro")
+    parser.add_argument('--sancionados', type=float, default=0.2, help="Fração dos documentos com sanção")
+    parser.add_argument('--registros', type=int, default=1, help="Sanções por documento sancionado")
+    parser.add_argument('--preenchimento', type=int, default=0, help="Bytes extras por sanção")
+
+
+def configuracao_de(args):
+    return Configuracao(
+        latencia=args.latencia, jitter=args.jitter, erros=args.erros, status_erro=args.status_erro,
+        sancionados=args.sancionados, registros=args.registros, preenchimento=args.preenchimento
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Servidor que imita a API da Infosimples (CEIS)")
+    parser.add_argument('--porta', type=int, default=8765)
+    parser.add_argument('--host', default='127.0.0.1')
+    adicionar_argumentos(parser)
+    args = parser.parse_args()
+
+    servidor = criar_servidor(args.porta, configuracao_de(args), args.host)
+    print(f"Servidor falso em http://{args.host}:{args.porta}/", flush=True)
+    try:
+        servidor.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,271 @@
+"""
+Cache de resultados das consultas ao CEIS
+
+Oferece um cache em memória (LRU com TTL) por processo e, opcionalmente,
+um backend SQLite compartilhado entre todos os workers do Gunicorn.
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+import documentos
+
+# Backend do cache: "memory" (padrão), "sqlite" (memória + arquivo compartilhado) ou "none"
+CACHE_BACKEND = os.environ.get('CEIS_CACHE_BACKEND', 'memory').lower()
+
+# Caminho do arquivo SQLite usado pelo backend compartilhado
+CACHE_PATH = os.environ.get('CEIS_CACHE_PATH', 'ceis_cache.sqlite3')
+
+# Número máximo de documentos mantidos em cada nível do cache
+CACHE_MAXSIZE = int(os.environ.get('CEIS_CACHE_MAXSIZE', 10000))
+
+# Validade, em segundos, de resultados com sanção (positivos) e sem sanção (negativos)
+TTL_POSITIVE = float(os.environ.get('CEIS_CACHE_TTL_POSITIVE', 86400))
+TTL_NEGATIVE = float(os.environ.get('CEIS_CACHE_TTL_NEGATIVE', 21600))
+
+# Por quanto tempo, após expirar, um resultado ainda pode ser servido como desatualizado
+# (ex.: quando a API está indisponível)
+STALE_MAX = float(os.environ.get('CEIS_CACHE_STALE_MAX', 604800))
+
+def normalizar_documento(valor):
+    """
+    Remove a formatação de um CNPJ/CPF (mantendo as letras do CNPJ alfanumérico)
+    """
+    return documentos.normalizar(valor)
+
+
+def chave_cache(cnpj=None, cpf=None, cadastro='ceis'):
+    """
+    Monta a chave do cache a partir dos documentos normalizados
+
+    "11.111.111/1111-11" e "11111111111111" geram a mesma chave. Resultados
+    de outros cadastros além do CEIS levam o nome do cadastro como prefixo.
+    """
+    partes = []
+    if cnpj:
+        partes.append('cnpj:' + normalizar_documento(cnpj))
+    if cpf:
+        partes.append('cpf:' + normalizar_documento(cpf))
+    chave = '|'.join(partes)
+    return chave if cadastro == 'ceis' else f'{cadastro}/{chave}'
+
+
+def ttl_para(payload):
+    """
+    Escolhe a validade de um resultado conforme haja ou não sanção
+    """
+    if payload.get('data_count', 0) > 0:
+        return TTL_POSITIVE
+    return TTL_NEGATIVE
+
+
+class MemoryCache:
+    """
+    Cache LRU em memória com validade por entrada
+    """
+
+    def __init__(self, maxsize=CACHE_MAXSIZE):
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """
+        Retorna (valor, armazenado_em) ou None se ausente/expirado
+        """
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            value, stored_at, expires_at = entry
+            if expires_at <= time.time():
+                # Entradas expiradas ficam disponíveis para get_stale até o limite
+                if expires_at + STALE_MAX <= time.time():
+                    del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value, stored_at
+
+    def get_stale(self, key):
+        """
+        Retorna (valor, armazenado_em) mesmo que expirado, dentro do limite STALE_MAX
+        """
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None or entry[2] + STALE_MAX <= time.time():
+                return None
+            return entry[0], entry[1]
+
+    def expiracao(self, key):
+        """
+        Retorna o instante em que a entrada expira, ou None se ausente
+        """
+        with self._lock:
+            entry = self._data.get(key)
+            return None if entry is None else entry[2]
+
+    def set(self, key, value, ttl, stored_at=None):
+        stored_at = time.time() if stored_at is None else stored_at
+        with self._lock:
+            self._data[key] = (value, stored_at, stored_at + ttl)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def itens(self):
+        """
+        Retorna as entradas ainda disponíveis como (chave, valor, armazenado_em, expira_em)
+
+        Inclui as expiradas há menos de STALE_MAX, que ainda servem a get_stale.
+        """
+        agora = time.time()
+        with self._lock:
+            return [(key, value, stored_at, expires_at)
+                    for key, (value, stored_at, expires_at) in self._data.items() if expires_at + STALE_MAX > agora]
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+class SQLiteCache:
+    """
+    Cache persistido em SQLite, compartilhado entre processos
+    """
+
+    def __init__(self, path=CACHE_PATH, maxsize=CACHE_MAXSIZE):
+        self.path = path
+        self.maxsize = maxsize
+        self._local = threading.local()
+        self._writes = 0
+        self._connect().execute(
+            "CREATE TABLE IF NOT EXISTS resultados ("
+            " chave TEXT PRIMARY KEY,"
+            " valor TEXT NOT NULL,"
+            " armazenado_em REAL NOT NULL,"
+            " expira_em REAL NOT NULL)"
+        )
+
+    def _connect(self):
+        # Uma conexão por thread (e por processo, pois conexões não sobrevivem a um fork);
+        # o modo WAL permite leituras concorrentes entre workers
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def get(self, key):
+        row = self._connect().execute(
+            "SELECT valor, armazenado_em FROM resultados WHERE chave = ? AND expira_em > ?",
+            (key, time.time())
+        ).fetchone()
+        if row is None:
+            return None
+        return json.loads(row[0]), row[1]
+
+    def get_stale(self, key):
+        row = self._connect().execute(
+            "SELECT valor, armazenado_em FROM resultados WHERE chave = ? AND expira_em > ?",
+            (key, time.time() - STALE_MAX)
+        ).fetchone()
+        if row is None:
+            return None
+        return json.loads(row[0]), row[1]
+
+    def expiracao(self, key):
+        row = self._connect().execute("SELECT expira_em FROM resultados WHERE chave = ?", (key,)).fetchone()
+        return None if row is None else row[0]
+
+    def set(self, key, value, ttl, stored_at=None):
+        stored_at = time.time() if stored_at is None else stored_at
+        conn = self._connect()
+        conn.execute(
+            "INSERT OR REPLACE INTO resultados (chave, valor, armazenado_em, expira_em)"
+            " VALUES (?, ?, ?, ?)",
+            (key, json.dumps(value), stored_at, stored_at + ttl)
+        )
+        # Limpeza periódica para manter o arquivo dentro do limite de tamanho
+        self._writes += 1
+        if self._writes % 100 == 0:
+            self._prune(conn)
+
+    def _prune(self, conn):
+        conn.execute("DELETE FROM resultados WHERE expira_em <= ?", (time.time() - STALE_MAX,))
+        conn.execute(
+            "DELETE FROM resultados WHERE chave IN ("
+            " SELECT chave FROM resultados ORDER BY armazenado_em DESC LIMIT -1 OFFSET ?)",
+            (self.maxsize,)
+        )
+
+    def delete(self, key):
+        self._connect().execute("DELETE FROM resultados WHERE chave = ?", (key,))
+
+    def clear(self):
+        self._connect().execute("DELETE FROM resultados")
+
+
+class TieredCache:
+    """
+    Combina o cache em memória do worker com um backend compartilhado
+
+    Acertos no backend compartilhado são copiados para a memória local,
+    preservando o instante original de armazenamento (e, portanto, a idade).
+    """
+
+    def __init__(self, local, shared):
+        self.local = local
+        self.shared = shared
+
+    def get(self, key):
+        hit = self.local.get(key)
+        if hit is not None:
+            return hit
+        hit = self.shared.get(key)
+        if hit is not None:
+            value, stored_at = hit
+            self.local.set(key, value, ttl_para(value), stored_at=stored_at)
+        return hit
+
+    def get_stale(self, key):
+        return self.local.get_stale(key) or self.shared.get_stale(key)
+
+    def expiracao(self, key):
+        # O backend compartilhado reflete atualizações feitas por outros workers
+        return self.shared.expiracao(key)
+
+    def set(self, key, value, ttl, stored_at=None):
+        self.local.set(key, value, ttl, stored_at)
+        self.shared.set(key, value, ttl, stored_at)
+
+    def itens(self):
+        return self.local.itens()
+
+    def delete(self, key):
+        self.local.delete(key)
+        self.shared.delete(key)
+
+    def clear(self):
+        self.local.clear()
+        self.shared.clear()
+
+
+def criar_cache(backend=CACHE_BACKEND):
+    """
+    Cria o cache configurado; retorna None quando o cache está desativado
+    """
+    if backend == 'none':
+        return None
+    if backend == 'sqlite':
+        return TieredCache(MemoryCache(), SQLiteCache())
+    return MemoryCache()
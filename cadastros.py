@@ -0,0 +1,163 @@
+"""
+Cadastros de sanções consultados pela triagem em múltiplas fontes
+
+Cada cadastro do Portal da Transparência (CEIS, CNEP, CEPIM...) é uma
+consulta distinta da Infosimples. Uma triagem consulta todos os cadastros
+configurados ao mesmo tempo, cada um com seu próprio prazo, e combina os
+resultados em uma única resposta: a latência total é a do cadastro mais
+lento, e um cadastro que não responde a tempo não impede a resposta dos demais.
+
+Configuração:
+    CEIS_CADASTROS=ceis,cnep,cepim
+    CEIS_CADASTROS_URLS={"leniencia": "https://.../acordos-leniencia"}
+"""
+import json
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import upstream
+
+# Endereço de cada cadastro na Infosimples (o do CEIS segue CEIS_API_URL)
+URLS = {
+    'ceis': upstream.API_URL,
+    'cnep': "https://api.infosimples.com/api/v2/consultas/portal-transparencia/cnep",
+    'cepim': "https://api.infosimples.com/api/v2/consultas/portal-transparencia/cepim"
+}
+
+# Endereços adicionais ou substitutos, em JSON (ex.: {"leniencia": "https://..."})
+URLS.update(json.loads(os.environ.get('CEIS_CADASTROS_URLS', '{}')))
+
+# Cadastros consultados quando a triagem não escolhe quais
+CADASTROS = [nome.strip() for nome in os.environ.get('CEIS_CADASTROS', 'ceis,cnep,cepim').split(',') if nome.strip()]
+
+# Prazo, em segundos, de cada cadastro (e prazos específicos em JSON, ex.: {"cepim": 10})
+TIMEOUT = float(os.environ.get('CEIS_CADASTROS_TIMEOUT', 60))
+TIMEOUTS = json.loads(os.environ.get('CEIS_CADASTROS_TIMEOUTS', '{}'))
+
+# Consultas a cadastros em andamento ao mesmo tempo por worker
+WORKERS = int(os.environ.get('CEIS_CADASTROS_WORKERS', 32))
+
+_executor = None
+_executor_pid = None
+_executor_lock = threading.Lock()
+
+
+def url(nome):
+    return URLS[nome]
+
+
+def timeout(nome):
+    return float(TIMEOUTS.get(nome, TIMEOUT))
+
+
+def ler_cadastros(valor=None):
+    """
+    Interpreta a lista de cadastros pedida (separados por vírgula)
+
+    Retorna (nomes, None) ou (None, (dados do erro, status HTTP)).
+    """
+    if not valor:
+        return CADASTROS, None
+    nomes = []
+    for nome in valor.split(','):
+        nome = nome.strip().lower()
+        if nome and nome not in nomes:
+            nomes.append(nome)
+    desconhecidos = [nome for nome in nomes if nome not in URLS]
+    if not nomes or desconhecidos:
+        return None, ({
+            "code": 400,
+            "code_message": "Parâmetro inválido",
+            "errors": [f"Cadastro desconhecido: {', '.join(desconhecidos) or valor} (use {', '.join(sorted(URLS))})"]
+        }, 400)
+    return nomes, None
+
+
+def get_executor():
+    """
+    Retorna o pool de threads das triagens deste processo (recriado após um fork)
+    """
+    global _executor, _executor_pid
+
+    pid = os.getpid()
+    if _executor is None or _executor_pid != pid:
+        with _executor_lock:
+            if _executor is None or _executor_pid != pid:
+                _executor = ThreadPoolExecutor(max_workers=WORKERS, thread_name_prefix='ceis-cadastros')
+                _executor_pid = pid
+    return _executor
+
+
+def tempo_esgotado(nome):
+    """
+    Resultado de um cadastro que não respondeu dentro do prazo
+    """
+    return {
+        "code": 504,
+        "code_message": "Tempo esgotado",
+        "errors": [f"Sem resposta em {timeout(nome):g} s"]
+    }, 504, 'MISS', 0
+
+
+def combinar(resultados):
+    """
+    Combina os resultados de cada cadastro em uma única resposta
+
+    resultados mapeia o nome do cadastro para (dados, status HTTP, status do
+    cache, idade). Os registros de todos os cadastros ficam em data, cada um
+    com o campo "fonte"; o resumo por cadastro fica em "cadastros". Um
+    cadastro com erro ou representado pelo último resultado conhecido
+    (STALE) é marcado como parcial, assim como a resposta.
+    Retorna (dados, status HTTP, status do cache, idade).
+    """
+    data = []
+    resumo = {}
+    errors = []
+    respondidos = 0
+    atuais = 0
+    for nome, (payload, status, cache_status, age) in resultados.items():
+        sucesso = status == 200 and payload.get('code') == 200
+        resumo[nome] = {
+            "code": payload.get('code'),
+            "code_message": payload.get('code_message'),
+            "status": status,
+            "cache": cache_status,
+            "idade": int(age),
+            "data_count": payload.get('data_count', 0) if sucesso else None,
+            "parcial": not sucesso or cache_status == 'STALE'
+        }
+        if not sucesso:
+            errors.extend(f"{nome.upper()}: {erro}" for erro in payload.get('errors') or [payload.get('code_message')])
+            continue
+        respondidos += 1
+        atuais += cache_status != 'STALE'
+        data.extend(dict(item, fonte=nome) for item in payload.get('data') or [])
+
+    if not respondidos:
+        return {
+            "code": 502,
+            "code_message": "Nenhum cadastro respondeu",
+            "cadastros": resumo,
+            "errors": errors
+        }, 502, 'MISS', 0
+
+    caches = {cache_status for _, _, cache_status, _ in resultados.values()}
+    if caches == {'HIT'}:
+        cache_status = 'HIT'
+    elif 'STALE' in caches:
+        cache_status = 'STALE'
+    else:
+        cache_status = 'MISS'
+
+    parcial = atuais < len(resultados)
+    return {
+        "code": 200,
+        "code_message": "Resultado parcial: nem todos os cadastros responderam." if parcial
+        else "A requisição foi processada com sucesso.",
+        "parcial": parcial,
+        "cadastros": resumo,
+        "data_count": len(data),
+        "data": data,
+        "errors": errors
+    }, 200, cache_status, max(age for _, _, _, age in resultados.values())
@@ -0,0 +1,540 @@
+"""
+Núcleo da consulta ao CEIS
+
+Concentra o caminho de consulta de um documento (cache, agrupamento de
+chamadas simultâneas e chamada à API da Infosimples), usado tanto pela
+consulta individual quanto pela consulta em lote.
+"""
+import functools
+import time
+from concurrent.futures import TimeoutError as FuturesTimeoutError
+
+import requests
+
+import atualizacao
+import auditoria
+import base_local
+import cache
+import cadastros
+import documentos
+import hedging
+import metricas
+import resiliencia
+import serializacao
+import singleflight
+import snapshot
+import tokens
+import upstream
+
+# Cache de resultados compartilhado pelas requisições deste worker, aquecido pelo snapshot
+result_cache = snapshot.aquecido(cache.criar_cache())
+
+# Consultas em andamento, compartilhadas entre as threads deste worker
+inflight = singleflight.SingleFlight()
+
+# Limitador de taxa e disjuntor da API, com estado compartilhado entre os workers
+estado_compartilhado = resiliencia.SharedState()
+rate_limiter = resiliencia.TokenBucket(estado_compartilhado)
+breaker = resiliencia.CircuitBreaker(estado_compartilhado)
+
+# Disjuntores dos demais cadastros (CNEP, CEPIM...), para que a falha de um não bloqueie os outros
+_disjuntores = {'ceis': breaker}
+
+# Tokens da API mantidos pelo servidor (CEIS_TOKENS), usados quando a consulta não informa um
+pool = tokens.TokenPool(state=estado_compartilhado)
+
+# Requisições de reserva enviadas quando a API demora a responder (hedging)
+hedger = hedging.Hedger()
+
+# Atualização em segundo plano de resultados expirados e dos documentos mais consultados
+atualizador = atualizacao.Atualizador(lambda *args: atualizar(*args))
+
+# Base local do CEIS (source=local), carregada em memória na primeira consulta
+base = base_local.BaseLocal()
+
+# Fontes de dados aceitas pelo parâmetro source
+FONTES = ('api', 'local')
+
+
+def validar_parametros(token, cnpj=None, cpf=None, fonte='api'):
+    """
+    Valida os parâmetros de uma consulta individual
+
+    O token só é exigido quando a consulta vai à API e o servidor não tem
+    tokens próprios configurados; CNPJ e CPF têm os dígitos verificadores
+    conferidos.
+    Retorna None se forem válidos ou (dados do erro, status HTTP).
+    """
+    if fonte not in FONTES:
+        return {
+            "code": 400,
+            "code_message": "Parâmetro inválido",
+            "errors": [f"Fonte desconhecida: {fonte} (use {' ou '.join(FONTES)})"]
+        }, 400
+
+    # Valida parâmetros obrigatórios
+    if fonte == 'api' and not token and not pool:
+        return {
+            "code": 400,
+            "code_message": "Parâmetro obrigatório não informado",
+            "errors": ["O token de acesso é obrigatório"]
+        }, 400
+
+    # Verifica se pelo menos um parâmetro de consulta foi informado
+    if not cnpj and not cpf:
+        return {
+            "code": 400,
+            "code_message": "Parâmetro obrigatório não informado",
+            "errors": ["Informe um CNPJ ou CPF para realizar a consulta"]
+        }, 400
+
+    # Documentos com dígitos verificadores inválidos são recusados sem chamar a API
+    return documentos.validar(cnpj, cpf)
+
+
+def consultar(token, cnpj=None, cpf=None, limiter=None, cadastro='ceis', timeout=None):
+    """
+    Consulta um documento, usando o cache e agrupando chamadas simultâneas
+
+    O limiter opcional é acionado apenas antes de chamadas reais à API,
+    de modo que acertos no cache não consomem a cota de requisições.
+    cadastro escolhe a consulta da Infosimples (CEIS por padrão) e timeout,
+    se informado, substitui o timeout de leitura da chamada à API.
+
+    Retorna (dados, status HTTP, status do cache, idade dos dados em segundos).
+    """
+    cache_key = cache.chave_cache(cnpj, cpf, cadastro)
+    atualizador.registrar(cache_key, cnpj, cpf, cadastro)
+    resultado = buscar_cache(cache_key) or revalidar(cache_key)
+    if resultado is None:
+        # Consultas simultâneas ao mesmo documento compartilham uma única chamada à API
+        resultado, _ = inflight.do(
+            cache_key,
+            lambda: _consultar_api(token, cnpj, cpf, cache_key, limiter, cadastro, timeout)
+        )
+    return registrar(cache_key, resultado)
+
+
+def consultar_cadastros(token, cnpj=None, cpf=None, nomes=None):
+    """
+    Consulta o documento em vários cadastros ao mesmo tempo e combina os resultados
+
+    Cada cadastro tem seu próprio prazo (CEIS_CADASTROS_TIMEOUT), contado a
+    partir do início da triagem e usado também como timeout de leitura da
+    chamada à API, que não fica presa além dele. Um cadastro que não responde
+    a tempo ou falha entra com o último resultado conhecido (marcado como
+    parcial) ou com o erro.
+
+    Retorna (dados, status HTTP, status do cache, idade) no formato de cadastros.combinar.
+    """
+    nomes = nomes or cadastros.CADASTROS
+    executor = cadastros.get_executor()
+    futuros = {
+        nome: executor.submit(consultar, token, cnpj, cpf, None, nome, cadastros.timeout(nome))
+        for nome in nomes
+    }
+
+    inicio = time.monotonic()
+    resultados = {}
+    for nome, futuro in futuros.items():
+        restante = cadastros.timeout(nome) - (time.monotonic() - inicio)
+        try:
+            resultado = futuro.result(timeout=max(restante, 0))
+        except FuturesTimeoutError:
+            resultado = cadastros.tempo_esgotado(nome)
+        if resultado[1] != 200:
+            resultado = resultado_desatualizado(cache.chave_cache(cnpj, cpf, nome)) or resultado
+        resultados[nome] = resultado
+        metricas.LOOKUPS.inc(resultado=resultado_metrica(resultado[1], resultado[2]))
+    return cadastros.combinar(resultados)
+
+
+def registrar(cache_key, resultado):
+    """
+    Registra o resultado no histórico de consultas (em segundo plano) e o retorna
+    """
+    payload, status, cache_status, age = resultado
+    auditoria.registrar(cache_key, payload, status, cache_status, age)
+    return resultado
+
+
+def consultar_local(cnpj=None, cpf=None):
+    """
+    Consulta a base local, sem chamar a API
+
+    A resposta tem o mesmo formato da API da Infosimples; a idade retornada
+    é o tempo desde a importação do arquivo do CEIS.
+    """
+    if not base.disponivel():
+        return {
+            "code": 503,
+            "code_message": "Base local indisponível",
+            "errors": ["Importe o arquivo do CEIS com: python base_local.py importar <arquivo>"]
+        }, 503, 'LOCAL', 0
+
+    data = []
+    importado_em = time.time()
+    for documento in (cnpj, cpf):
+        if documento:
+            registros, importado_em = base.consultar(cache.normalizar_documento(documento))
+            data.extend(registros)
+
+    return registrar(cache.chave_cache(cnpj, cpf), ({
+        "code": 200,
+        "code_message": "A requisição foi processada com sucesso.",
+        "header": {"fonte": "base_local"},
+        "data_count": len(data),
+        "data": data,
+        "errors": []
+    }, 200, 'LOCAL', time.time() - importado_em))
+
+
+def resultado_metrica(status, cache_status):
+    """
+    Classifica o resultado de uma consulta para a métrica de consultas
+    """
+    if cache_status == 'HIT':
+        return 'cache'
+    if cache_status == 'STALE':
+        return 'desatualizado'
+    if status == 503:
+        return 'indisponivel'
+    if status == 429:
+        return 'limite'
+    if cache_status == 'LOCAL':
+        return 'local' if status == 200 else 'erro'
+    return 'api' if status == 200 else 'erro'
+
+
+def buscar_cache(cache_key, registrar=True):
+    """
+    Retorna o resultado em cache para a chave, se houver resultado válido
+
+    Com registrar=False (nova verificação da mesma consulta), o acesso não
+    entra nas métricas de acerto do cache.
+    """
+    if result_cache is None:
+        return None
+    hit = result_cache.get(cache_key)
+    if registrar:
+        metricas.CACHE.inc(resultado='miss' if hit is None else 'hit')
+    if hit is None:
+        return None
+    payload, stored_at = hit
+    return payload, 200, 'HIT', time.time() - stored_at
+
+
+def revalidar(cache_key):
+    """
+    Stale-while-revalidate: devolve o resultado expirado há menos de
+    CEIS_CACHE_SWR segundos e agenda sua atualização em segundo plano
+
+    Só se aplica com tokens no pool do servidor, usados na atualização.
+    """
+    if result_cache is None or atualizacao.SWR_WINDOW <= 0 or not pool:
+        return None
+    expira_em = result_cache.expiracao(cache_key)
+    if expira_em is None or time.time() - expira_em > atualizacao.SWR_WINDOW:
+        return None
+    hit = resultado_desatualizado(cache_key)
+    if hit is not None:
+        atualizador.agendar(cache_key)
+    return hit
+
+
+def atualizar(cnpj, cpf, cache_key, antecedencia=0, cadastro='ceis'):
+    """
+    Atualiza em segundo plano o resultado em cache de um documento
+
+    A atualização usa apenas os tokens do pool e é ignorada sem eles ou se o
+    resultado não expira nos próximos antecedencia segundos, como quando
+    outro worker acabou de atualizá-lo.
+    """
+    if not pool:
+        return None
+    with singleflight.lock_entre_processos(cache_key):
+        expira_em = result_cache.expiracao(cache_key) if result_cache is not None else None
+        if expira_em is not None and expira_em - time.time() > antecedencia:
+            return None
+        metricas.REFRESHES.inc()
+        # Atualizações em segundo plano não têm pressa: não gastam o orçamento de reservas
+        return _chamar_api(None, cnpj, cpf, cache_key, cadastro=cadastro, reserva=False)
+
+
+def _consultar_api(token, cnpj, cpf, cache_key, limiter=None, cadastro='ceis', timeout=None):
+    """
+    Realiza a chamada à API da Infosimples e armazena o resultado no cache
+    """
+    with singleflight.lock_entre_processos(cache_key):
+        # Outro worker pode ter concluído a mesma consulta enquanto aguardávamos o bloqueio
+        hit = buscar_cache(cache_key, registrar=False)
+        if hit is not None:
+            return hit
+        return _chamar_api(token, cnpj, cpf, cache_key, limiter, cadastro, timeout=timeout)
+
+
+def _chamar_api(token, cnpj, cpf, cache_key, limiter=None, cadastro='ceis', reserva=True, timeout=None):
+    token, credencial = escolher_token(token)
+    if token is None:
+        return resultado_desatualizado(cache_key) or sem_token()
+
+    bloqueio = verificar_disponibilidade(token, cache_key, cadastro=cadastro)
+    if bloqueio is not None:
+        liberar_token(credencial)
+        return bloqueio
+
+    params = montar_parametros(token, cnpj, cpf)
+    inicio = time.perf_counter()
+    try:
+        if limiter is not None:
+            limiter.acquire()
+
+        # Realiza a requisição para a API do CEIS reaproveitando o pool de conexões,
+        # com uma requisição de reserva se a resposta demorar (hedging)
+        def enviar(params, credencial):
+            return _tentativa(params, credencial, cadastro, timeout)
+
+        if reserva:
+            response, erro, credencial, inicio = hedger.executar(
+                functools.partial(enviar, params, credencial),
+                functools.partial(preparar_reserva, params, credencial, enviar),
+                tentativa_ok, descartar_tentativa
+            )
+        else:
+            response, erro, credencial, inicio = enviar(params, credencial)
+        if erro is not None:
+            raise erro
+        disjuntor(cadastro).registrar(response.status_code < 500)
+        resultado = processar_resposta(cache_key, response.status_code, lambda: serializacao.loads(response.content))
+        liberar_token(credencial, inicio, response.status_code, resultado[0])
+        return resultado
+
+    except requests.exceptions.RequestException as e:
+        metricas.UPSTREAM_RESPONSES.inc(status='excecao')
+        disjuntor(cadastro).registrar(False)
+        liberar_token(credencial, inicio)
+        return erro_requisicao(e)
+    except Exception as e:
+        liberar_token(credencial, inicio)
+        return erro_interno(e)
+
+
+def _tentativa(params, credencial, cadastro='ceis', timeout=None):
+    """
+    Faz uma chamada à API sem levantar exceções
+
+    Retorna (resposta, exceção, credencial, início), com resposta ou exceção
+    None; a latência alimenta o limiar das requisições de reserva.
+    """
+    inicio = time.perf_counter()
+    metricas.UPSTREAM_INFLIGHT.inc()
+    try:
+        with metricas.medir(metricas.UPSTREAM_SECONDS, 'upstream'):
+            response = upstream.post(params, url=cadastros.url(cadastro), timeout=timeout)
+    except Exception as e:
+        return None, e, credencial, inicio
+    finally:
+        metricas.UPSTREAM_INFLIGHT.dec()
+    hedger.registrar(time.perf_counter() - inicio)
+    metricas.UPSTREAM_RESPONSES.inc(status=response.status_code)
+    return response, None, credencial, inicio
+
+
+def tentativa_ok(tentativa):
+    """
+    Indica se a tentativa pode ser usada como resposta (sem exceção nem status 5xx)
+    """
+    response, erro, _, _ = tentativa
+    return erro is None and response.status_code < 500
+
+
+def preparar_reserva(params, credencial, enviar):
+    """
+    Escolhe o token da requisição de reserva e aplica seu limite de taxa
+
+    Com um token do pool, a reserva usa outro token (CEIS_HEDGE_OUTRO_TOKEN)
+    ou o mesmo; um token informado na consulta é sempre reaproveitado.
+    Retorna a função que envia a reserva ou (None, motivo).
+    """
+    token, outra = params["token"], None
+    if credencial is not None:
+        outra = pool.escolher(excluir=credencial) if hedging.OUTRO_TOKEN else pool.reservar(credencial)
+        if outra is None:
+            return None, 'token'
+        token = outra.token
+    if not rate_limiter.acquire(token, max_wait=0):
+        liberar_token(outra)
+        return None, 'limite'
+    params_reserva = dict(params, token=token)
+    return lambda: enviar(params_reserva, outra)
+
+
+def descartar_tentativa(tentativa):
+    """
+    Libera o token da tentativa descartada de uma chamada com reserva
+    """
+    response, erro, credencial, inicio = tentativa
+    if erro is not None:
+        metricas.UPSTREAM_RESPONSES.inc(status='excecao')
+        liberar_token(credencial, inicio)
+        return
+    try:
+        payload = serializacao.loads(response.content) if response.status_code == 200 else None
+    except ValueError:
+        payload = None
+    liberar_token(credencial, inicio, response.status_code, payload)
+
+
+def escolher_token(token):
+    """
+    Define o token da chamada: o informado na consulta ou, sem ele, o melhor do pool
+
+    Retorna (token, credencial do pool ou None); o token é None se o pool
+    não tiver nenhum token disponível.
+    """
+    if token or not pool:
+        return token, None
+    credencial = pool.escolher()
+    if credencial is None:
+        return None, None
+    return credencial.token, credencial
+
+
+def liberar_token(credencial, inicio=None, status_code=None, payload=None):
+    """
+    Devolve ao pool o token usado na chamada, com a latência e o resultado obtidos
+
+    Sem inicio, a chamada não chegou a ser feita e o token é apenas liberado.
+    """
+    if credencial is None:
+        return
+    if inicio is None:
+        pool.liberar(credencial)
+    else:
+        codigo = payload.get('code') if isinstance(payload, dict) else None
+        pool.registrar(credencial, time.perf_counter() - inicio, status_code, codigo)
+
+
+def sem_token():
+    """
+    Resposta quando todos os tokens do pool foram retirados ou esgotaram a cota
+    """
+    return {
+        "code": 503,
+        "code_message": "Nenhum token disponível",
+        "errors": ["Todos os tokens da API foram recusados ou esgotaram a cota"]
+    }, 503, 'MISS', 0
+
+
+def disjuntor(cadastro='ceis'):
+    """
+    Retorna o disjuntor do cadastro (o do CEIS é o breaker do módulo)
+    """
+    atual = _disjuntores.get(cadastro)
+    if atual is None:
+        atual = _disjuntores.setdefault(
+            cadastro, resiliencia.CircuitBreaker(estado_compartilhado, chave=f'infosimples-{cadastro}')
+        )
+    return atual
+
+
+def verificar_disponibilidade(token, cache_key, aguardar=True, cadastro='ceis'):
+    """
+    Aplica o disjuntor e o limite de taxa do token antes de uma chamada à API
+
+    Retorna None se a chamada pode seguir. Caso contrário, retorna o último
+    resultado conhecido do documento (mesmo expirado) ou um erro 503
+    (API indisponível) / 429 (limite excedido). Com aguardar=False, o limite
+    de taxa não espera por uma vaga (usado pelo modo assíncrono).
+    """
+    permitido, espera = disjuntor(cadastro).permitir()
+    if not permitido:
+        return resultado_desatualizado(cache_key) or ({
+            "code": 503,
+            "code_message": "API externa indisponível",
+            "errors": [f"A API apresentou falhas consecutivas; nova tentativa em {int(espera) + 1} s"]
+        }, 503, 'MISS', 0)
+
+    if not rate_limiter.acquire(token, max_wait=resiliencia.RATE_MAX_WAIT if aguardar else 0):
+        return resultado_desatualizado(cache_key) or ({
+            "code": 429,
+            "code_message": "Limite de requisições excedido",
+            "errors": ["O limite de consultas por segundo para este token foi atingido"]
+        }, 429, 'MISS', 0)
+
+    return None
+
+
+def resultado_desatualizado(cache_key):
+    """
+    Retorna o último resultado em cache do documento, mesmo que expirado
+    """
+    if result_cache is None:
+        return None
+    hit = result_cache.get_stale(cache_key)
+    if hit is None:
+        return None
+    payload, stored_at = hit
+    return payload, 200, 'STALE', time.time() - stored_at
+
+
+def montar_parametros(token, cnpj=None, cpf=None):
+    """
+    Prepara os parâmetros para enviar à API
+    """
+    params = {
+        "token": token,
+        "timeout": 300  # Timeout de 5 minutos
+    }
+
+    # Adiciona CNPJ ou CPF aos parâmetros, se informados
+    if cnpj:
+        params["cnpj"] = cnpj
+    if cpf:
+        params["cpf"] = cpf
+    return params
+
+
+def processar_resposta(cache_key, status_code, ler_json):
+    """
+    Interpreta a resposta da API, armazenando no cache os resultados bem-sucedidos
+
+    ler_json é chamado apenas quando a API responde com sucesso.
+    """
+    # Verifica se a requisição foi bem-sucedida
+    if status_code == 200:
+        # Armazena resultados bem-sucedidos e retorna os dados recebidos da API
+        with metricas.medir(metricas.PARSE_SECONDS, 'parse'):
+            payload = ler_json()
+        if result_cache is not None and payload.get('code') == 200:
+            result_cache.set(cache_key, payload, cache.ttl_para(payload))
+        return payload, 200, 'MISS', 0
+
+    # Trata erros de comunicação com a API
+    return {
+        "code": status_code,
+        "code_message": "Erro ao comunicar com a API externa",
+        "errors": [f"A API retornou o código {status_code}"]
+    }, 500, 'MISS', 0
+
+
+def erro_requisicao(e):
+    """
+    Resposta para exceções na comunicação com a API
+    """
+    return {
+        "code": 500,
+        "code_message": "Erro ao processar a requisição",
+        "errors": [str(e)]
+    }, 500, 'MISS', 0
+
+
+def erro_interno(e):
+    """
+    Resposta para outras exceções não previstas
+    """
+    return {
+        "code": 500,
+        "code_message": "Erro interno do servidor",
+        "errors": [str(e)]
+    }, 500, 'MISS', 0
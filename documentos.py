@@ -0,0 +1,194 @@
+"""
+Normalização e validação de CNPJ e CPF
+
+Remove a formatação e confere os dígitos verificadores antes de qualquer
+chamada à API, de modo que documentos inválidos sejam recusados localmente.
+Aceita o CNPJ alfanumérico (12 caracteres de 0-9/A-Z seguidos de 2 dígitos
+verificadores), em que cada caractere vale seu código ASCII menos 48.
+
+Uso como benchmark:
+    python documentos.py [quantidade]
+"""
+import operator
+import re
+import sys
+import time
+
+# Pesos do cálculo dos dígitos verificadores (módulo 11)
+PESOS_CPF_1 = (10, 9, 8, 7, 6, 5, 4, 3, 2)
+PESOS_CPF_2 = (11, 10, 9, 8, 7, 6, 5, 4, 3, 2)
+PESOS_CNPJ_1 = (5, 4, 3, 2, 9, 8, 7, 6, 5, 4, 3, 2)
+PESOS_CNPJ_2 = (6, 5, 4, 3, 2, 9, 8, 7, 6, 5, 4, 3, 2)
+
+# Os cálculos usam os códigos ASCII diretamente; o deslocamento de 48 ('0')
+# de cada caractere é descontado de uma vez pela soma dos pesos
+_AJUSTE_CPF_1 = 48 * sum(PESOS_CPF_1)
+_AJUSTE_CPF_2 = 48 * sum(PESOS_CPF_2)
+_AJUSTE_CNPJ_1 = 48 * sum(PESOS_CNPJ_1)
+_AJUSTE_CNPJ_2 = 48 * sum(PESOS_CNPJ_2)
+
+# Formatação removida na normalização: pontuação usual e espaços
+_FORMATACAO = str.maketrans('', '', './- \t')
+_nao_alfanumerico = re.compile(r'[^0-9A-Za-z]')
+_cpf = re.compile(r'\d{11}')
+_cnpj = re.compile(r'[0-9A-Z]{12}\d{2}')
+
+_mul = operator.mul
+
+
+def normalizar(valor):
+    """
+    Remove a formatação de um CNPJ/CPF, mantendo dígitos e letras (em maiúsculas)
+
+    "11.111.111/1111-11" e "11111111111111" geram o mesmo documento.
+    """
+    if not valor:
+        return ''
+    documento = valor.translate(_FORMATACAO)
+    if not documento.isalnum() or not documento.isascii():
+        documento = _nao_alfanumerico.sub('', documento)
+    return documento.upper()
+
+
+def _digito(soma):
+    resto = soma % 11
+    return 0 if resto < 2 else 11 - resto
+
+
+def cpf_valido(documento):
+    """
+    Confere os dígitos verificadores de um CPF normalizado (11 dígitos)
+    """
+    if not _cpf.fullmatch(documento) or documento == documento[0] * 11:
+        return False
+    codigos = documento.encode('ascii')
+    d1 = (sum(map(_mul, codigos, PESOS_CPF_1)) - _AJUSTE_CPF_1) * 10 % 11 % 10
+    if d1 != codigos[9] - 48:
+        return False
+    d2 = (sum(map(_mul, codigos, PESOS_CPF_2)) - _AJUSTE_CPF_2) * 10 % 11 % 10
+    return d2 == codigos[10] - 48
+
+
+def cnpj_valido(documento):
+    """
+    Confere os dígitos verificadores de um CNPJ normalizado, numérico ou alfanumérico
+    """
+    if not _cnpj.fullmatch(documento) or documento == documento[0] * 14:
+        return False
+    codigos = documento.encode('ascii')
+    if _digito(sum(map(_mul, codigos, PESOS_CNPJ_1)) - _AJUSTE_CNPJ_1) != codigos[12] - 48:
+        return False
+    return _digito(sum(map(_mul, codigos, PESOS_CNPJ_2)) - _AJUSTE_CNPJ_2) == codigos[13] - 48
+
+
+def classificar(valor):
+    """
+    Normaliza um documento e identifica se é um CNPJ ou CPF válido
+
+    Retorna (tipo, documento normalizado), com tipo None quando inválido.
+    """
+    documento = normalizar(valor)
+    if len(documento) == 14:
+        return ('cnpj' if cnpj_valido(documento) else None), documento
+    if len(documento) == 11:
+        return ('cpf' if cpf_valido(documento) else None), documento
+    return None, documento
+
+
+def classificar_lista(valores):
+    """
+    Versão de classificar para listas grandes (consultas em lote)
+
+    Retorna a lista de (tipo, documento normalizado) na ordem de entrada.
+    """
+    # Funções em variáveis locais evitam buscas de atributos e globais a cada item
+    normalizar_, cnpj_valido_, cpf_valido_ = normalizar, cnpj_valido, cpf_valido
+    resultado = []
+    adicionar = resultado.append
+    for valor in valores:
+        documento = normalizar_(valor)
+        tamanho = len(documento)
+        if tamanho == 14:
+            adicionar(('cnpj' if cnpj_valido_(documento) else None, documento))
+        elif tamanho == 11:
+            adicionar(('cpf' if cpf_valido_(documento) else None, documento))
+        else:
+            adicionar((None, documento))
+    return resultado
+
+
+def validar(cnpj=None, cpf=None):
+    """
+    Valida os documentos de uma consulta individual
+
+    Retorna None se forem válidos ou (dados do erro, status HTTP), no mesmo
+    formato de erro dos endpoints.
+    """
+    erros = []
+    if cnpj and not cnpj_valido(normalizar(cnpj)):
+        erros.append(f"CNPJ inválido: {cnpj}")
+    if cpf and not cpf_valido(normalizar(cpf)):
+        erros.append(f"CPF inválido: {cpf}")
+    if erros:
+        return {
+            "code": 400,
+            "code_message": "Parâmetro inválido",
+            "errors": erros
+        }, 400
+    return None
+
+
+def gerar_cnpj(base):
+    """
+    Completa uma base de 12 caracteres com os dígitos verificadores (útil em testes e benchmarks)
+    """
+    codigos = base.encode('ascii')
+    d1 = _digito(sum(map(_mul, codigos, PESOS_CNPJ_1)) - _AJUSTE_CNPJ_1)
+    codigos += bytes((48 + d1,))
+    d2 = _digito(sum(map(_mul, codigos, PESOS_CNPJ_2)) - _AJUSTE_CNPJ_2)
+    return f"{base}{d1}{d2}"
+
+
+def gerar_cpf(base):
+    """
+    Completa uma base de 9 dígitos com os dígitos verificadores (útil em testes e benchmarks)
+    """
+    codigos = base.encode('ascii')
+    d1 = (sum(map(_mul, codigos, PESOS_CPF_1)) - _AJUSTE_CPF_1) * 10 % 11 % 10
+    codigos += bytes((48 + d1,))
+    d2 = (sum(map(_mul, codigos, PESOS_CPF_2)) - _AJUSTE_CPF_2) * 10 % 11 % 10
+    return f"{base}{d1}{d2}"
+
+
+def benchmark(quantidade=1_000_000):
+    """
+    Mede a validação de uma lista de documentos variados (formatados, alfanuméricos e inválidos)
+    """
+    amostras = []
+    for i in range(quantidade // 5 + 1):
+        cnpj = gerar_cnpj(f"{i * 7919 % 10 ** 12:012d}")
+        amostras.append(f"{cnpj[:2]}.{cnpj[2:5]}.{cnpj[5:8]}/{cnpj[8:12]}-{cnpj[12:]}")
+        amostras.append(gerar_cnpj(f"{i % 10 ** 6:06d}AB{i % 1000:03d}Z"[:12]))
+        cpf = gerar_cpf(f"{i * 104729 % 10 ** 9:09d}")
+        amostras.append(f"{cpf[:3]}.{cpf[3:6]}.{cpf[6:9]}-{cpf[9:]}")
+        amostras.append(cpf[:10] + str((int(cpf[10]) + 1) % 10))
+        amostras.append('123')
+    amostras = amostras[:quantidade]
+
+    inicio = time.perf_counter()
+    resultado = classificar_lista(amostras)
+    lista = time.perf_counter() - inicio
+
+    inicio = time.perf_counter()
+    for valor in amostras:
+        classificar(valor)
+    individual = time.perf_counter() - inicio
+
+    validos = sum(1 for tipo, _ in resultado if tipo)
+    print(f"{quantidade} documentos ({validos} válidos)")
+    print(f"classificar_lista: {lista:.2f} s ({lista / quantidade * 1e6:.2f} µs/documento)")
+    print(f"classificar:       {individual:.2f} s ({individual / quantidade * 1e6:.2f} µs/documento)")
+
+
+if __name__ == '__main__':
+    benchmark(int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000)
@@ -0,0 +1,167 @@
+"""
+Entrega do frontend pré-construído (static/index.html)
+
+O arquivo é lido uma única vez por processo e mantido em memória junto com
+suas versões comprimidas (gzip e, se o pacote brotli estiver instalado, br).
+A versão é escolhida pelo cabeçalho Accept-Encoding; o ETag é derivado do
+conteúdo, permitindo respostas 304 às revalidações do navegador. Nada é
+gravado em disco, de modo que a aplicação funciona em contêineres somente
+leitura.
+"""
+import gzip
+import hashlib
+import os
+import sys
+import sysconfig
+import threading
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Pasta de dados onde o pacote instala o frontend (data_files do setup.py)
+PASTA_INSTALADA = os.path.join('share', 'consulta-ceis', 'static')
+
+
+def _pasta_static():
+    """
+    Localiza a pasta do frontend: ao lado do módulo, no código-fonte, ou na
+    pasta de dados da instalação (prefixo do ambiente ou do usuário)
+    """
+    candidatas = [os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static')]
+    for prefixo in (sys.prefix, sysconfig.get_config_var('userbase')):
+        if prefixo:
+            candidatas.append(os.path.join(prefixo, PASTA_INSTALADA))
+    for pasta in candidatas:
+        if os.path.isfile(os.path.join(pasta, 'index.html')):
+            return pasta
+    return candidatas[0]
+
+
+# Pasta com os arquivos do frontend
+STATIC_FOLDER = _pasta_static()
+
+# Tempo, em segundos, que o navegador pode usar a página sem revalidá-la (0 revalida sempre)
+MAX_AGE = int(os.environ.get('CEIS_STATIC_MAX_AGE', 0))
+
+# Ordem de preferência das codificações, quando o cliente aceita mais de uma com a mesma prioridade
+CODIFICACOES = ('br', 'gzip', 'identity')
+
+
+def aceitas(accept_encoding):
+    """
+    Interpreta o cabeçalho Accept-Encoding, retornando {codificação: prioridade}
+    """
+    prioridades = {}
+    for parte in (accept_encoding or '').split(','):
+        nome, _, parametros = parte.strip().partition(';')
+        nome = nome.strip().lower()
+        if not nome:
+            continue
+        q = 1.0
+        parametros = parametros.strip()
+        if parametros.startswith('q='):
+            try:
+                q = float(parametros[2:])
+            except ValueError:
+                q = 0.0
+        prioridades[nome] = q
+    return prioridades
+
+
+class Recurso:
+    """
+    Arquivo estático mantido em memória com suas variantes comprimidas
+    """
+
+    def __init__(self, nome, mimetype, pasta=STATIC_FOLDER, max_age=MAX_AGE):
+        self.path = os.path.join(pasta, nome)
+        self.mimetype = mimetype
+        self.max_age = max_age
+        self._variantes = None
+        self._lock = threading.Lock()
+
+    def variantes(self):
+        """
+        Retorna {codificação: (conteúdo, etag)}, comprimindo o arquivo na primeira chamada
+        """
+        if self._variantes is None:
+            with self._lock:
+                if self._variantes is None:
+                    with open(self.path, 'rb') as f:
+                        conteudo = f.read()
+                    versao = hashlib.sha256(conteudo).hexdigest()[:20]
+                    variantes = {
+                        'identity': conteudo,
+                        # mtime=0 torna a saída determinística para o mesmo conteúdo
+                        'gzip': gzip.compress(conteudo, compresslevel=9, mtime=0)
+                    }
+                    if brotli is not None:
+                        variantes['br'] = brotli.compress(conteudo, quality=11)
+                    self._variantes = {
+                        codificacao: (dados, f'"{versao}-{codificacao}"' if codificacao != 'identity' else f'"{versao}"')
+                        for codificacao, dados in variantes.items()
+                    }
+        return self._variantes
+
+    def escolher(self, accept_encoding):
+        """
+        Escolhe a variante de maior prioridade aceita pelo cliente
+        """
+        variantes = self.variantes()
+        prioridades = aceitas(accept_encoding)
+        padrao = prioridades.get('*')
+        melhor, melhor_q = 'identity', None
+        for codificacao in CODIFICACOES:
+            if codificacao not in variantes:
+                continue
+            q = prioridades.get(codificacao, padrao)
+            if codificacao == 'identity' and q is None:
+                # identity é aceita, salvo recusa explícita
+                q = 0.001
+            if q is not None and q > 0 and (melhor_q is None or q > melhor_q):
+                melhor, melhor_q = codificacao, q
+        return melhor
+
+    def responder(self, accept_encoding=None, if_none_match=None):
+        """
+        Monta a resposta para uma requisição GET
+
+        Retorna (status HTTP, cabeçalhos, corpo); o status é 304 (sem corpo)
+        quando o ETag informado em If-None-Match corresponde ao conteúdo atual.
+        """
+        codificacao = self.escolher(accept_encoding)
+        conteudo, etag = self.variantes()[codificacao]
+
+        headers = {
+            'Content-Type': self.mimetype,
+            'ETag': etag,
+            'Vary': 'Accept-Encoding',
+            'Cache-Control': f'public, max-age={self.max_age}' if self.max_age > 0 else 'no-cache'
+        }
+        if codificacao != 'identity':
+            headers['Content-Encoding'] = codificacao
+
+        if if_none_match and self._corresponde(if_none_match):
+            return 304, {nome: headers[nome] for nome in ('ETag', 'Vary', 'Cache-Control')}, b''
+
+        headers['Content-Length'] = str(len(conteudo))
+        return 200, headers, conteudo
+
+    def _corresponde(self, if_none_match):
+        if if_none_match.strip() == '*':
+            return True
+        etags = {etag for _, etag in self.variantes().values()}
+        for etag in if_none_match.split(','):
+            etag = etag.strip()
+            # Comparação fraca, como exige o RFC 9110 para If-None-Match
+            if etag.startswith('W/'):
+                etag = etag[2:]
+            if etag in etags:
+                return True
+        return False
+
+
+# Página principal da aplicação
+INDEX = Recurso('index.html', 'text/html; charset=utf-8')
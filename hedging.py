@@ -0,0 +1,221 @@
+"""
+Requisições de reserva (hedging) para reduzir a latência de cauda da API
+
+Quando a API não responde dentro do limiar (um percentil das latências
+recentes deste worker), uma segunda requisição igual é enviada, se possível
+com outro token do pool, e vale a que responder primeiro com sucesso. A
+requisição perdedora segue até o fim, apenas para liberar seu token.
+
+A carga extra é limitada por um orçamento: cada consulta acumula
+CEIS_HEDGE_ORCAMENTO de crédito e cada reserva consome 1, então com 0.05 no
+máximo 5% das chamadas à API são duplicadas (além de uma pequena rajada).
+
+Configuração:
+    CEIS_HEDGE_PERCENTIL=95
+    CEIS_HEDGE_ORCAMENTO=0.05
+"""
+import asyncio
+import contextvars
+import os
+import threading
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from concurrent.futures import TimeoutError as FuturesTimeoutError
+
+import metricas
+
+# Percentil das latências recentes a partir do qual a reserva é enviada (0 desativa)
+PERCENTIL = float(os.environ.get('CEIS_HEDGE_PERCENTIL', 0))
+
+# Fração das chamadas à API que pode ser duplicada por reservas
+ORCAMENTO = float(os.environ.get('CEIS_HEDGE_ORCAMENTO', 0.05))
+
+# Limiar mínimo, em segundos, antes de enviar uma reserva
+MINIMO = float(os.environ.get('CEIS_HEDGE_MINIMO', 0.5))
+
+# Latências recentes consideradas no cálculo do percentil
+AMOSTRAS = int(os.environ.get('CEIS_HEDGE_AMOSTRAS', 1000))
+
+# Se verdadeiro, a reserva usa outro token do pool (e não é enviada se não houver outro)
+OUTRO_TOKEN = os.environ.get('CEIS_HEDGE_OUTRO_TOKEN', '1').lower() in ('1', 'true', 'sim')
+
+# Threads que fazem as chamadas com reserva em cada worker
+WORKERS = int(os.environ.get('CEIS_HEDGE_WORKERS', 64))
+
+# Latências medidas antes de a primeira reserva poder ser enviada
+MIN_AMOSTRAS = 20
+
+# Reservas que o crédito acumulado permite enviar em sequência
+RAJADA = 10.0
+
+# Novas latências medidas entre os recálculos do limiar
+RECALCULO = 50
+
+
+class Hedger:
+    """
+    Limiar de latência, orçamento e execução das requisições com reserva
+
+    As tentativas (primária e reserva) são funções sem argumentos que não
+    levantam exceções; sucesso(resultado) diz se uma tentativa pode ser usada
+    e ao_perder(resultado) recebe o resultado da tentativa descartada.
+    """
+
+    def __init__(self, percentil=PERCENTIL, orcamento=ORCAMENTO, minimo=MINIMO,
+                 amostras=AMOSTRAS, workers=WORKERS):
+        self.percentil = percentil
+        self.orcamento = orcamento
+        self.minimo = minimo
+        self.workers = workers
+        self._latencias = deque(maxlen=max(amostras, MIN_AMOSTRAS))
+        self._limiar = None
+        self._novas = 0
+        self._credito = 0.0
+        self._executor = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def __bool__(self):
+        return self.percentil > 0 and self.orcamento > 0
+
+    def registrar(self, duracao):
+        """
+        Acrescenta a latência de uma chamada à API às amostras do percentil
+        """
+        if not self:
+            return
+        with self._lock:
+            self._latencias.append(duracao)
+            self._novas += 1
+            if len(self._latencias) < MIN_AMOSTRAS:
+                return
+            if self._limiar is None or self._novas >= RECALCULO:
+                ordenadas = sorted(self._latencias)
+                posicao = min(int(len(ordenadas) * self.percentil / 100), len(ordenadas) - 1)
+                self._limiar = max(ordenadas[posicao], self.minimo)
+                self._novas = 0
+
+    def limiar(self):
+        """
+        Retorna o tempo de espera antes da reserva, ou None se o hedging não se aplica
+        """
+        return self._limiar if self else None
+
+    def _creditar(self):
+        with self._lock:
+            self._credito = min(self._credito + self.orcamento, RAJADA)
+
+    def _consumir(self):
+        with self._lock:
+            if self._credito >= 1:
+                self._credito -= 1
+                return True
+        metricas.HEDGES_SKIPPED.inc(motivo='orcamento')
+        return False
+
+    def _get_executor(self):
+        # Recriado após um fork, como os demais pools de threads
+        if self._pid != os.getpid():
+            with self._lock:
+                if self._pid != os.getpid():
+                    self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='ceis-hedge')
+                    self._pid = os.getpid()
+        return self._executor
+
+    def executar(self, primaria, preparar_reserva, sucesso, ao_perder):
+        """
+        Executa a primária e, se ela passar do limiar, também a reserva
+
+        preparar_reserva() é chamada só quando a reserva vai ser enviada e
+        retorna a função da reserva ou (None, motivo) se ela não puder ser
+        enviada. Retorna o resultado da primeira tentativa bem-sucedida (ou o
+        da primária, se nenhuma tiver sucesso).
+        """
+        limiar = self.limiar()
+        if limiar is None:
+            return primaria()
+        self._creditar()
+
+        executor = self._get_executor()
+        iniciada = threading.Event()
+
+        def executar_primaria():
+            iniciada.set()
+            return primaria()
+
+        futuro = executor.submit(contextvars.copy_context().run, executar_primaria)
+        # O limiar conta a partir do início da primária: a espera na fila do executor não gera reservas
+        iniciada.wait()
+        try:
+            return futuro.result(timeout=limiar)
+        except FuturesTimeoutError:
+            pass
+
+        reserva = self._aceitar(preparar_reserva()) if self._consumir() else None
+        if reserva is None:
+            return futuro.result()
+        futuro_reserva = executor.submit(contextvars.copy_context().run, reserva)
+
+        pendentes = {futuro, futuro_reserva}
+        vencedor = None
+        while pendentes and vencedor is None:
+            concluidos, pendentes = wait(pendentes, return_when=FIRST_COMPLETED)
+            # A primária tem preferência quando ambas terminam juntas
+            for candidato in (futuro, futuro_reserva):
+                if candidato in concluidos and sucesso(candidato.result()):
+                    vencedor = candidato
+                    break
+        vencedor = vencedor or futuro
+        perdedor = futuro_reserva if vencedor is futuro else futuro
+        if vencedor is futuro_reserva:
+            metricas.HEDGES_WON.inc()
+        perdedor.add_done_callback(lambda concluido: ao_perder(concluido.result()))
+        return vencedor.result()
+
+    async def executar_async(self, primaria, preparar_reserva, sucesso, ao_perder):
+        """
+        Equivalente assíncrono de executar(), com primaria, preparar_reserva e a reserva como corrotinas
+        """
+        limiar = self.limiar()
+        if limiar is None:
+            return await primaria()
+        self._creditar()
+
+        tarefa = asyncio.ensure_future(primaria())
+        concluidos, _ = await asyncio.wait({tarefa}, timeout=limiar)
+        if concluidos:
+            return tarefa.result()
+
+        reserva = self._aceitar(await preparar_reserva()) if self._consumir() else None
+        if reserva is None:
+            return await tarefa
+        tarefa_reserva = asyncio.ensure_future(reserva())
+
+        pendentes = {tarefa, tarefa_reserva}
+        vencedor = None
+        while pendentes and vencedor is None:
+            concluidos, pendentes = await asyncio.wait(pendentes, return_when=asyncio.FIRST_COMPLETED)
+            for candidato in (tarefa, tarefa_reserva):
+                if candidato in concluidos and sucesso(candidato.result()):
+                    vencedor = candidato
+                    break
+        vencedor = vencedor or tarefa
+        perdedor = tarefa_reserva if vencedor is tarefa else tarefa
+        if vencedor is tarefa_reserva:
+            metricas.HEDGES_WON.inc()
+        perdedor.add_done_callback(lambda concluida: ao_perder(concluida.result()))
+        return await vencedor
+
+    def _aceitar(self, reserva):
+        """
+        Confere a reserva preparada; retorna sua função ou None se ela não puder ser enviada
+        """
+        if isinstance(reserva, tuple):
+            _, motivo = reserva
+            metricas.HEDGES_SKIPPED.inc(motivo=motivo)
+            # A reserva não enviada devolve o crédito consumido
+            with self._lock:
+                self._credito += 1
+            return None
+        metricas.HEDGES_FIRED.inc()
+        return reserva
@@ -0,0 +1,290 @@
+"""
+Fila de consultas assíncronas ao CEIS
+
+Lotes enviados como job retornam um identificador imediatamente; threads
+em segundo plano executam as consultas e gravam o progresso em SQLite, de
+modo que jobs interrompidos (ex.: reinício de um worker) são retomados a
+partir dos documentos ainda não consultados.
+"""
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+
+import lote
+
+# Arquivo SQLite onde os jobs e seus resultados são persistidos
+JOBS_PATH = os.environ.get('CEIS_JOBS_PATH', 'ceis_jobs.sqlite3')
+
+# Threads de execução de jobs por worker (cada job usa a concorrência do lote)
+JOBS_WORKERS = int(os.environ.get('CEIS_JOBS_WORKERS', 1))
+
+# Intervalo, em segundos, entre as buscas por jobs pendentes
+POLL_INTERVAL = float(os.environ.get('CEIS_JOBS_POLL_INTERVAL', 1))
+
+# Jobs em execução sem progresso por este tempo são retomados por outro worker
+# (deve ser maior que o timeout de leitura da API, já que o progresso só avança ao fim de cada consulta)
+STALE_AFTER = float(os.environ.get('CEIS_JOBS_STALE_AFTER', 600))
+
+# Resultados gravados por transação
+COMMIT_EVERY = 100
+
+# Espera máxima, em segundos, após falhas seguidas ao acessar o arquivo de jobs
+MAX_BACKOFF = 60
+
+logger = logging.getLogger(__name__)
+
+PENDENTE = 'pendente'
+EXECUTANDO = 'executando'
+CONCLUIDO = 'concluido'
+FALHOU = 'falhou'
+
+
+class JobStore:
+    """
+    Persistência dos jobs e de seus resultados em SQLite
+    """
+
+    def __init__(self, path=JOBS_PATH):
+        self.path = path
+        self._local = threading.local()
+
+    def _connect(self):
+        # Uma conexão por thread e por processo; as tabelas são criadas na primeira conexão
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.executescript(
+                "CREATE TABLE IF NOT EXISTS jobs ("
+                " id TEXT PRIMARY KEY,"
+                " status TEXT NOT NULL,"
+                " token TEXT NOT NULL,"
+                " total INTEGER NOT NULL,"
+                " processados INTEGER NOT NULL DEFAULT 0,"
+                " erro TEXT,"
+                " criado_em REAL NOT NULL,"
+                " atualizado_em REAL NOT NULL);"
+                "CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, atualizado_em);"
+                "CREATE TABLE IF NOT EXISTS job_itens ("
+                " job_id TEXT NOT NULL,"
+                " indice INTEGER NOT NULL,"
+                " valor TEXT NOT NULL,"
+                " tipo TEXT,"
+                " documento TEXT NOT NULL,"
+                " item TEXT,"
+                " PRIMARY KEY (job_id, indice));"
+            )
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def existe(self):
+        """
+        Indica se o arquivo de jobs já foi criado (há jobs a retomar)
+        """
+        return os.path.exists(self.path)
+
+    def criar(self, token, documentos):
+        """
+        Registra um novo job com seus documentos e retorna o identificador
+        """
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        conn = self._connect()
+        with conn:
+            conn.execute("BEGIN")
+            conn.execute(
+                "INSERT INTO jobs (id, status, token, total, criado_em, atualizado_em)"
+                " VALUES (?, ?, ?, ?, ?, ?)",
+                (job_id, PENDENTE, token, len(documentos), now, now)
+            )
+            conn.executemany(
+                "INSERT INTO job_itens (job_id, indice, valor, tipo, documento) VALUES (?, ?, ?, ?, ?)",
+                ((job_id, i, valor, tipo, documento) for i, (valor, tipo, documento) in enumerate(documentos))
+            )
+        return job_id
+
+    def reservar(self):
+        """
+        Reserva o próximo job pendente (ou abandonado) para este worker
+
+        A reserva é atômica, então cada job é executado por um único worker.
+        """
+        conn = self._connect()
+        now = time.time()
+        row = conn.execute(
+            "SELECT id FROM jobs WHERE status = ? OR (status = ? AND atualizado_em < ?)"
+            " ORDER BY criado_em LIMIT 1",
+            (PENDENTE, EXECUTANDO, now - STALE_AFTER)
+        ).fetchone()
+        if row is None:
+            return None
+        cursor = conn.execute(
+            "UPDATE jobs SET status = ?, atualizado_em = ?"
+            " WHERE id = ? AND (status = ? OR (status = ? AND atualizado_em < ?))",
+            (EXECUTANDO, now, row[0], PENDENTE, EXECUTANDO, now - STALE_AFTER)
+        )
+        return row[0] if cursor.rowcount == 1 else None
+
+    def token(self, job_id):
+        row = self._connect().execute("SELECT token FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return row[0] if row else None
+
+    def pendentes(self, job_id):
+        """
+        Retorna os itens ainda sem resultado como (índice, (valor, tipo, documento))
+        """
+        rows = self._connect().execute(
+            "SELECT indice, valor, tipo, documento FROM job_itens"
+            " WHERE job_id = ? AND item IS NULL ORDER BY indice",
+            (job_id,)
+        ).fetchall()
+        return [(row[0], (row[1], row[2], row[3])) for row in rows]
+
+    def gravar(self, job_id, itens):
+        """
+        Grava um grupo de resultados e atualiza o progresso do job
+
+        Itens que já têm resultado não são regravados nem contados de novo,
+        como quando um job retomado por outro worker ainda estava em execução.
+        """
+        conn = self._connect()
+        with conn:
+            conn.execute("BEGIN")
+            antes = conn.total_changes
+            conn.executemany(
+                "UPDATE job_itens SET item = ? WHERE job_id = ? AND indice = ? AND item IS NULL",
+                ((json.dumps(item), job_id, indice) for indice, item in itens)
+            )
+            conn.execute(
+                "UPDATE jobs SET processados = processados + ?, atualizado_em = ? WHERE id = ?",
+                (conn.total_changes - antes, time.time(), job_id)
+            )
+
+    def finalizar(self, job_id, status, erro=None):
+        """
+        Registra o status final do job e descarta o token, que não é mais necessário
+        """
+        self._connect().execute(
+            "UPDATE jobs SET status = ?, erro = ?, token = '', atualizado_em = ? WHERE id = ?",
+            (status, erro, time.time(), job_id)
+        )
+
+    def obter(self, job_id, offset=0, limit=1000):
+        """
+        Retorna o estado do job e uma página dos resultados já concluídos
+        """
+        conn = self._connect()
+        row = conn.execute(
+            "SELECT status, total, processados, erro, criado_em, atualizado_em FROM jobs WHERE id = ?",
+            (job_id,)
+        ).fetchone()
+        if row is None:
+            return None
+        status, total, processados, erro, criado_em, atualizado_em = row
+        itens = conn.execute(
+            "SELECT indice, item FROM job_itens WHERE job_id = ? AND item IS NOT NULL"
+            " ORDER BY indice LIMIT ? OFFSET ?",
+            (job_id, limit, offset)
+        ).fetchall()
+
+        resultados = []
+        for indice, item in itens:
+            item = json.loads(item)
+            item["indice"] = indice
+            resultados.append(item)
+
+        return {
+            "job_id": job_id,
+            "status": status,
+            "total": total,
+            "processados": processados,
+            "progresso": round(processados / total * 100, 1) if total else 100.0,
+            "erro": erro,
+            "criado_em": criado_em,
+            "atualizado_em": atualizado_em,
+            "offset": offset,
+            "limit": limit,
+            "resultados": resultados
+        }
+
+
+class JobRunner:
+    """
+    Threads em segundo plano que executam os jobs pendentes
+    """
+
+    def __init__(self, store, workers=JOBS_WORKERS):
+        self.store = store
+        self.workers = workers
+        self._pid = None
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+
+    def iniciar(self):
+        """
+        Inicia as threads deste processo, se ainda não estiverem em execução
+
+        Chamado a cada requisição; após um fork, as threads são recriadas no worker.
+        """
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            for _ in range(self.workers):
+                threading.Thread(target=self._loop, daemon=True).start()
+
+    def notificar(self):
+        """
+        Acorda as threads para buscar um job recém-criado
+        """
+        self._wakeup.set()
+
+    def _loop(self):
+        falhas = 0
+        while True:
+            try:
+                self._processar_proximo()
+                falhas = 0
+            except Exception:
+                # Ex.: arquivo de jobs bloqueado; a thread continua após uma espera crescente
+                falhas += 1
+                logger.exception("Falha ao processar a fila de jobs (tentativa %d)", falhas)
+                time.sleep(min(POLL_INTERVAL * 2 ** falhas, MAX_BACKOFF))
+
+    def _processar_proximo(self):
+        job_id = self.store.reservar()
+        if job_id is None:
+            self._wakeup.wait(POLL_INTERVAL)
+            self._wakeup.clear()
+            return
+        try:
+            self._executar(job_id)
+            self.store.finalizar(job_id, CONCLUIDO)
+        except Exception as e:
+            self.store.finalizar(job_id, FALHOU, str(e))
+
+    def _executar(self, job_id):
+        token = self.store.token(job_id)
+        pendentes = self.store.pendentes(job_id)
+        indices = [indice for indice, _ in pendentes]
+        documentos = [documento for _, documento in pendentes]
+
+        grupo = []
+        ultimo_commit = time.monotonic()
+        for posicao, item in lote.executar(token, documentos):
+            grupo.append((indices[posicao], item))
+            # Grava em grupos para reduzir transações, mantendo o progresso atualizado
+            if len(grupo) >= COMMIT_EVERY or time.monotonic() - ultimo_commit > 1:
+                self.store.gravar(job_id, grupo)
+                grupo = []
+                ultimo_commit = time.monotonic()
+        if grupo:
+            self.store.gravar(job_id, grupo)
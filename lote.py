@@ -0,0 +1,228 @@
+"""
+Consulta em lote ao CEIS
+
+Lê listas de documentos (JSON ou CSV), valida e remove duplicados, e
+distribui as consultas entre threads com concorrência e taxa limitadas.
+"""
+import csv
+import io
+import os
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import consulta
+import documentos
+
+# Número máximo de consultas simultâneas por lote
+CONCURRENCY = int(os.environ.get('CEIS_LOTE_CONCURRENCY', 8))
+
+# Limite de chamadas à API por segundo em cada lote (0 desativa)
+RATE = float(os.environ.get('CEIS_LOTE_RATE', 0))
+
+# Quantidade máxima de documentos aceitos em um lote
+MAX_DOCUMENTOS = int(os.environ.get('CEIS_LOTE_MAX', 50000))
+
+# Colunas reconhecidas como documento em arquivos CSV com cabeçalho
+CSV_COLUMNS = ('documento', 'cnpj', 'cpf', 'cpf_cnpj', 'cnpj_cpf')
+
+# Formatos de transmissão do lote e seus tipos de conteúdo
+STREAM_MIMETYPES = {
+    'ndjson': 'application/x-ndjson',
+    'sse': 'text/event-stream'
+}
+
+
+class RateLimiter:
+    """
+    Espaça as chamadas para não ultrapassar uma taxa por segundo
+    """
+
+    def __init__(self, rate):
+        self.interval = 1.0 / rate
+        self._next = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        with self._lock:
+            now = time.monotonic()
+            wait_until = max(self._next, now)
+            self._next = wait_until + self.interval
+        delay = wait_until - now
+        if delay > 0:
+            time.sleep(delay)
+
+
+def ler_csv(stream):
+    """
+    Lê os documentos de um arquivo CSV enviado
+
+    Se a primeira linha for um cabeçalho, usa a coluna de documento
+    reconhecida (ou a primeira coluna); caso contrário, usa a primeira coluna.
+    """
+    text = io.TextIOWrapper(stream, encoding='utf-8-sig', newline='')
+    sample = text.read(4096)
+    text.seek(0)
+    try:
+        dialect = csv.Sniffer().sniff(sample, delimiters=',;\t')
+    except csv.Error:
+        dialect = csv.excel
+
+    reader = csv.reader(text, dialect)
+    column = 0
+    for n, row in enumerate(reader):
+        if not row:
+            continue
+        if n == 0 and not any(ch.isdigit() for ch in ''.join(row)):
+            header = [c.strip().lower() for c in row]
+            for name in CSV_COLUMNS:
+                if name in header:
+                    column = header.index(name)
+                    break
+            continue
+        if column < len(row) and row[column].strip():
+            yield row[column].strip()
+
+
+def preparar_documentos(valores):
+    """
+    Valida e remove duplicados, preservando a ordem de entrada
+
+    Retorna a lista de (documento original, tipo, documento normalizado);
+    documentos inválidos permanecem na lista com tipo None.
+    """
+    valores = [str(valor).strip() for valor in valores]
+    vistos = set()
+    preparados = []
+    # A validação é feita de uma vez sobre a lista inteira
+    for valor, (tipo, documento) in zip(valores, documentos.classificar_lista(valores)):
+        chave = documento if tipo else valor
+        if chave in vistos:
+            continue
+        vistos.add(chave)
+        preparados.append((valor, tipo, documento))
+    return preparados
+
+
+def consultar_item(token, valor, tipo, documento, limiter=None):
+    """
+    Consulta um documento do lote e monta o item de resultado
+    """
+    if tipo is None:
+        return {
+            "documento": valor,
+            "status": 400,
+            "cache": None,
+            "resultado": {
+                "code": 400,
+                "code_message": "Parâmetro inválido",
+                "errors": ["Documento deve ser um CNPJ (14 caracteres) ou CPF (11 dígitos) com dígitos verificadores válidos"]
+            }
+        }
+
+    kwargs = {tipo: documento}
+    payload, status, cache_status, age = consulta.consultar(token, limiter=limiter, **kwargs)
+    return {
+        "documento": documento,
+        "tipo": tipo,
+        "status": status,
+        "cache": cache_status,
+        "idade": int(age),
+        "resultado": payload
+    }
+
+
+def executar(token, documentos, concurrency=CONCURRENCY, rate=RATE):
+    """
+    Consulta os documentos com concorrência limitada
+
+    Gera (índice, item) à medida que cada consulta termina. Apenas um número
+    limitado de consultas fica pendente por vez, de modo que o consumo de
+    memória não cresce com o tamanho do lote.
+    """
+    limiter = RateLimiter(rate) if rate > 0 else None
+    pendentes = {}
+    iterador = iter(enumerate(documentos))
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        def submeter():
+            for indice, (valor, tipo, documento) in iterador:
+                future = executor.submit(consultar_item, token, valor, tipo, documento, limiter)
+                pendentes[future] = indice
+                if len(pendentes) >= concurrency * 2:
+                    break
+
+        submeter()
+        while pendentes:
+            prontos, _ = wait(pendentes, return_when=FIRST_COMPLETED)
+            for future in prontos:
+                yield pendentes.pop(future), future.result()
+            submeter()
+
+
+class Resumo:
+    """
+    Contadores do registro final de um lote
+    """
+
+    def __init__(self):
+        self.inicio = time.monotonic()
+        self.total = 0
+        self.sancionados = 0
+        self.sem_sancao = 0
+        self.erros = 0
+        self.cache_hits = 0
+
+    def adicionar(self, item):
+        self.total += 1
+        if item["status"] != 200:
+            self.erros += 1
+        elif item["resultado"].get("data_count", 0) > 0:
+            self.sancionados += 1
+        else:
+            self.sem_sancao += 1
+        if item["cache"] == 'HIT':
+            self.cache_hits += 1
+
+    def como_dict(self):
+        return {
+            "total": self.total,
+            "sancionados": self.sancionados,
+            "sem_sancao": self.sem_sancao,
+            "erros": self.erros,
+            "cache_hits": self.cache_hits,
+            "duracao_ms": int((time.monotonic() - self.inicio) * 1000)
+        }
+
+
+def transmitir(token, documentos, dumps, formato='ndjson', apresentar=None):
+    """
+    Gera o lote como NDJSON ou Server-Sent Events
+
+    Cada resultado é enviado assim que sua consulta termina (com o campo
+    "indice" indicando a posição na entrada), seguido de um registro final
+    com o resumo do lote. Nenhum resultado fica retido em memória.
+    apresentar, se informado, transforma o resultado de cada item (ex.: projeção de campos).
+    """
+    resumo = Resumo()
+    for indice, item in executar(token, documentos):
+        item["indice"] = indice
+        resumo.adicionar(item)
+        if apresentar is not None:
+            item["resultado"] = apresentar(item["resultado"])
+        yield _registro(dumps(item), formato, 'resultado')
+
+    yield _registro(dumps({
+        "code": 200,
+        "code_message": "Lote processado",
+        "resumo": resumo.como_dict()
+    }), formato, 'resumo')
+
+
+def _registro(dados, formato, evento):
+    """
+    Formata um registro como linha NDJSON ou evento SSE
+    """
+    if formato == 'sse':
+        return f"event: {evento}\ndata: {dados}\n\n"
+    return dados + "\n"
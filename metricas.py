@@ -0,0 +1,208 @@
+"""
+Métricas da aplicação no formato de exposição do Prometheus
+
+Contadores, medidores e histogramas simples, sem dependências externas.
+Os valores são mantidos por processo: com vários workers do Gunicorn, cada
+coleta reflete o worker que atendeu a requisição de /metrics.
+"""
+import contextvars
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+import upstream
+
+# Inclui o cabeçalho Server-Timing nas respostas
+SERVER_TIMING = os.environ.get('CEIS_SERVER_TIMING', '0').lower() in ('1', 'true', 'sim')
+
+# Limites dos histogramas, em segundos (inclui a faixa longa das chamadas à API)
+BUCKETS = (0.0005, 0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+_registry = []
+
+# Tempos da requisição atual, usados no cabeçalho Server-Timing
+_timings = contextvars.ContextVar('ceis_timings', default=None)
+
+
+def _chave(labels):
+    # Valores como texto: o mesmo label pode vir como número ou string (ex.: status)
+    return tuple(sorted((nome, str(valor)) for nome, valor in labels.items()))
+
+
+def _formatar_labels(chave):
+    if not chave:
+        return ''
+    return '{' + ','.join(f'{nome}="{valor}"' for nome, valor in chave) + '}'
+
+
+class _Metrica:
+    tipo = None
+
+    def __init__(self, nome, descricao):
+        self.nome = nome
+        self.descricao = descricao
+        self._valores = {}
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def _linhas(self):
+        with self._lock:
+            return [f"{self.nome}{_formatar_labels(chave)} {valor}" for chave, valor in sorted(self._valores.items())]
+
+    def exportar(self):
+        return [f"# HELP {self.nome} {self.descricao}", f"# TYPE {self.nome} {self.tipo}"] + self._linhas()
+
+
+class Counter(_Metrica):
+    tipo = 'counter'
+
+    def inc(self, valor=1, **labels):
+        chave = _chave(labels)
+        with self._lock:
+            self._valores[chave] = self._valores.get(chave, 0) + valor
+
+    def valor(self, **labels):
+        return self._valores.get(_chave(labels), 0)
+
+
+class Gauge(_Metrica):
+    tipo = 'gauge'
+
+    def __init__(self, nome, descricao, funcao=None):
+        super().__init__(nome, descricao)
+        self.funcao = funcao
+
+    def inc(self, valor=1):
+        with self._lock:
+            self._valores[()] = self._valores.get((), 0) + valor
+
+    def dec(self, valor=1):
+        self.inc(-valor)
+
+    def valor(self):
+        return self._valores.get((), 0)
+
+    def set(self, valor):
+        with self._lock:
+            self._valores[()] = valor
+
+    def _linhas(self):
+        # Medidores calculados no momento da coleta
+        if self.funcao is not None:
+            self.set(self.funcao())
+        return super()._linhas()
+
+
+class Histogram(_Metrica):
+    tipo = 'histogram'
+
+    def __init__(self, nome, descricao, buckets=BUCKETS):
+        super().__init__(nome, descricao)
+        self.buckets = buckets
+
+    def observe(self, valor, **labels):
+        chave = _chave(labels)
+        with self._lock:
+            contagens = self._valores.get(chave)
+            if contagens is None:
+                contagens = self._valores[chave] = [0] * len(self.buckets) + [0, 0.0]
+            for i, limite in enumerate(self.buckets):
+                if valor <= limite:
+                    contagens[i] += 1
+            contagens[-2] += 1
+            contagens[-1] += valor
+
+    def _linhas(self):
+        linhas = []
+        with self._lock:
+            itens = sorted((chave, list(contagens)) for chave, contagens in self._valores.items())
+        for chave, contagens in itens:
+            for limite, contagem in zip(self.buckets, contagens):
+                linhas.append(f"{self.nome}_bucket{_formatar_labels(chave + (('le', limite),))} {contagem}")
+            linhas.append(f"{self.nome}_bucket{_formatar_labels(chave + (('le', '+Inf'),))} {contagens[-2]}")
+            linhas.append(f"{self.nome}_count{_formatar_labels(chave)} {contagens[-2]}")
+            linhas.append(f"{self.nome}_sum{_formatar_labels(chave)} {contagens[-1]}")
+        return linhas
+
+
+def exportar():
+    """
+    Gera o texto de todas as métricas no formato do Prometheus
+    """
+    linhas = []
+    for metrica in _registry:
+        linhas.extend(metrica.exportar())
+    return '\n'.join(linhas) + '\n'
+
+
+def iniciar_timing():
+    """
+    Começa a acumular os tempos da requisição atual (para o Server-Timing)
+    """
+    timings = {}
+    _timings.set(timings)
+    return timings
+
+
+def server_timing(timings):
+    """
+    Formata os tempos acumulados como valor do cabeçalho Server-Timing
+    """
+    return ', '.join(f"{nome};dur={segundos * 1000:.1f}" for nome, segundos in timings.items())
+
+
+@contextmanager
+def medir(histograma, etapa, **labels):
+    """
+    Mede a duração de um trecho no histograma e no Server-Timing da requisição
+    """
+    inicio = time.perf_counter()
+    try:
+        yield
+    finally:
+        duracao = time.perf_counter() - inicio
+        histograma.observe(duracao, **labels)
+        timings = _timings.get()
+        if timings is not None:
+            timings[etapa] = timings.get(etapa, 0) + duracao
+
+
+def _razao_cache():
+    hits = CACHE.valor(resultado='hit')
+    total = hits + CACHE.valor(resultado='miss')
+    return round(hits / total, 4) if total else 0
+
+
+def _saturacao_pool():
+    return round(UPSTREAM_INFLIGHT.valor() / upstream.POOL_SIZE, 4)
+
+
+REQUESTS = Counter('ceis_requests_total', "Requisições atendidas, por rota e status HTTP")
+LOOKUPS = Counter('ceis_lookups_total', "Consultas de documentos, por resultado (cache, desatualizado, local, api, invalido, indisponivel, limite, erro)")
+REQUEST_SECONDS = Histogram('ceis_request_duration_seconds', "Duração total das requisições, por rota")
+UPSTREAM_SECONDS = Histogram('ceis_upstream_duration_seconds', "Duração das chamadas à API da Infosimples")
+UPSTREAM_RESPONSES = Counter('ceis_upstream_responses_total', "Respostas da API da Infosimples, por status HTTP")
+PARSE_SECONDS = Histogram('ceis_json_parse_duration_seconds', "Tempo de leitura do JSON retornado pela API")
+SERIALIZE_SECONDS = Histogram('ceis_json_serialize_duration_seconds', "Tempo de serialização das respostas")
+REFRESHES = Counter('ceis_cache_refreshes_total', "Atualizações de resultados em cache feitas em segundo plano")
+CACHE = Counter('ceis_cache_total', "Consultas ao cache de resultados, por resultado (hit, miss)")
+CACHE_SNAPSHOT_HITS = Counter('ceis_cache_snapshot_hits_total', "Resultados carregados do snapshot do cache após uma falta na memória")
+CACHE_SNAPSHOT_WRITES = Counter('ceis_cache_snapshot_writes_total', "Gravações do snapshot do cache, por resultado (ok, erro)")
+CACHE_HIT_RATIO = Gauge('ceis_cache_hit_ratio', "Proporção de acertos no cache de resultados", _razao_cache)
+AUDIT_WRITES = Counter('ceis_audit_writes_total', "Consultas gravadas no histórico")
+AUDIT_DROPPED = Counter('ceis_audit_dropped_total', "Consultas descartadas por excesso de registros pendentes no histórico")
+AUDIT_ERRORS = Counter('ceis_audit_errors_total', "Falhas ao gravar lotes do histórico")
+SHARED_STATE_ERRORS = Counter('ceis_shared_state_errors_total', "Falhas no arquivo de estado compartilhado; o limitador e o disjuntor passam a valer só para o worker")
+TOKEN_CALLS = Counter('ceis_token_calls_total', "Chamadas à API por token do pool (pelo nome, nunca o token) e resultado")
+TOKEN_REMOVALS = Counter('ceis_token_removals_total', "Tokens retirados do pool, por motivo (autenticacao, cota)")
+UPSTREAM_INFLIGHT = Gauge('ceis_upstream_inflight', "Chamadas à API da Infosimples em andamento")
+HEDGES_FIRED = Counter('ceis_upstream_hedges_total', "Requisições de reserva enviadas à API por demora na resposta (hedging)")
+HEDGES_WON = Counter('ceis_upstream_hedges_won_total', "Requisições de reserva que responderam antes da original")
+HEDGES_SKIPPED = Counter('ceis_upstream_hedges_skipped_total', "Requisições de reserva não enviadas, por motivo (orcamento, token, limite)")
+POOL_SATURATION = Gauge('ceis_upstream_pool_saturation', "Chamadas em andamento em relação ao tamanho do pool de conexões", _saturacao_pool)
+WATCH_CHECKS = Counter('ceis_watch_checks_total', "Documentos monitorados verificados, por fonte (base_local, api)")
+WATCH_EVENTS = Counter('ceis_watch_events_total', "Mudanças de veredito detectadas no monitoramento")
+WATCH_WEBHOOK_ERRORS = Counter('ceis_watch_webhook_errors_total', "Falhas ao enviar eventos do monitoramento ao webhook")
+WATCH_ERRORS = Counter('ceis_watch_errors_total', "Ciclos de verificação do monitoramento interrompidos por erro")
+WATCH_UNVERIFIABLE = Gauge('ceis_watch_unverifiable', "Documentos monitorados sem fonte de verificação (CPFs sem CEIS_TOKENS)")
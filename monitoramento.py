@@ -0,0 +1,496 @@
+"""
+Monitoramento contínuo de documentos (lista de acompanhamento)
+
+Guarda, para cada documento monitorado, apenas o último veredito conhecido
+em forma compacta (situação, quantidade de sanções e uma assinatura das
+sanções e suas datas) e gera um evento somente quando esse veredito muda.
+
+As verificações evitam consultas desnecessárias:
+- CNPJs são verificados pela base local, quando importada: a cada nova
+  versão da base, só os documentos com sanções alteradas são reavaliados,
+  de modo que o custo de uma verificação acompanha a quantidade de mudanças;
+- os demais documentos (CPFs, ou todos sem base local) são consultados
+  pelo núcleo de consulta, com cache, a cada CEIS_MONITORAMENTO_INTERVALO
+  segundos, usando os tokens do servidor (CEIS_TOKENS). Sem eles, esses
+  documentos não podem ser verificados e são informados como não
+  verificáveis (GET /api/monitoramento e ceis_watch_unverifiable).
+
+Os eventos ficam em um feed NDJSON (GET /api/monitoramento/eventos) e podem
+ser enviados a um webhook.
+
+Uso:
+    python monitoramento.py adicionar fornecedores.csv
+    python monitoramento.py verificar
+    python monitoramento.py eventos --desde 120
+"""
+import argparse
+import hashlib
+import os
+import sqlite3
+import sys
+import threading
+import time
+
+import requests
+
+import auditoria
+import base_local
+import consulta
+import lote
+import metricas
+import projecao
+import serializacao
+
+# Arquivo SQLite da lista de acompanhamento e dos eventos
+MONITORAMENTO_PATH = os.environ.get('CEIS_MONITORAMENTO_PATH', 'ceis_monitoramento.sqlite3')
+
+# Intervalo, em segundos, entre verificações de um documento pela consulta (sem base local)
+INTERVALO = float(os.environ.get('CEIS_MONITORAMENTO_INTERVALO', 86400))
+
+# Intervalo, em segundos, entre os ciclos de verificação em cada worker (0 desativa; use o comando verificar)
+CICLO = float(os.environ.get('CEIS_MONITORAMENTO_CICLO', 300))
+
+# Documentos verificados pela consulta por rodada
+LOTE = int(os.environ.get('CEIS_MONITORAMENTO_LOTE', 1000))
+
+# Endereço que recebe os eventos de cada ciclo (POST em NDJSON)
+WEBHOOK = os.environ.get('CEIS_MONITORAMENTO_WEBHOOK', '')
+WEBHOOK_TIMEOUT = float(os.environ.get('CEIS_MONITORAMENTO_WEBHOOK_TIMEOUT', 10))
+
+# Situação compacta do último veredito (NULL = ainda não verificado)
+SITUACOES = {auditoria.SEM_SANCAO: 0, auditoria.SANCIONADO: 1}
+NOMES_SITUACAO = {valor: nome for nome, valor in SITUACOES.items()}
+
+
+def veredito_de(payload):
+    """
+    Resume uma resposta em (situação, data_count, assinatura, veredito)
+
+    A assinatura cobre o tipo, o órgão e as datas de cada sanção, sem
+    depender da ordem dos registros. Retorna None para respostas de erro.
+    """
+    if payload.get('code') != 200:
+        return None
+    veredito = projecao.veredito(payload)
+    sancoes = sorted(serializacao.dumps(sancao) for sancao in veredito["sancoes"])
+    assinatura = hashlib.sha256(b'\n'.join(sancoes)).digest()[:8]
+    situacao = SITUACOES[auditoria.SANCIONADO if veredito["data_count"] > 0 else auditoria.SEM_SANCAO]
+    return situacao, veredito["data_count"], assinatura, veredito
+
+
+def tipo_de(documento):
+    return 'cpf' if len(documento) == 11 else 'cnpj'
+
+
+class WatchStore:
+    """
+    Lista de acompanhamento e feed de eventos em SQLite
+    """
+
+    def __init__(self, path=MONITORAMENTO_PATH):
+        self.path = path
+        self._local = threading.local()
+
+    def existe(self):
+        """
+        Indica se o arquivo do monitoramento já foi criado (há documentos a verificar)
+        """
+        return os.path.exists(self.path)
+
+    def _connect(self):
+        # Uma conexão por thread e por processo; as tabelas são criadas na primeira conexão
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.executescript(
+                "CREATE TABLE IF NOT EXISTS monitorados ("
+                " documento TEXT PRIMARY KEY,"
+                " situacao INTEGER,"
+                " data_count INTEGER,"
+                " assinatura BLOB,"
+                " verificado_em REAL,"
+                " proxima_em REAL NOT NULL) WITHOUT ROWID;"
+                "CREATE INDEX IF NOT EXISTS monitorados_proxima ON monitorados (proxima_em);"
+                "CREATE TABLE IF NOT EXISTS eventos ("
+                " id INTEGER PRIMARY KEY AUTOINCREMENT,"
+                " documento TEXT NOT NULL,"
+                " em REAL NOT NULL,"
+                " dados TEXT NOT NULL);"
+                "CREATE TABLE IF NOT EXISTS meta (chave TEXT PRIMARY KEY, valor TEXT NOT NULL);"
+            )
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def adicionar(self, docs):
+        """
+        Inclui documentos normalizados na lista; retorna quantos eram novos
+        """
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            antes = conn.total_changes
+            conn.executemany(
+                "INSERT OR IGNORE INTO monitorados (documento, proxima_em) VALUES (?, 0)",
+                ((documento,) for documento in docs)
+            )
+            adicionados = conn.total_changes - antes
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return adicionados
+
+    def remover(self, docs):
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            antes = conn.total_changes
+            conn.executemany("DELETE FROM monitorados WHERE documento = ?", ((documento,) for documento in docs))
+            removidos = conn.total_changes - antes
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return removidos
+
+    def listar(self, offset=0, limit=100):
+        conn = self._connect()
+        total = conn.execute("SELECT COUNT(*) FROM monitorados").fetchone()[0]
+        rows = conn.execute(
+            "SELECT documento, situacao, data_count, verificado_em FROM monitorados"
+            " ORDER BY documento LIMIT ? OFFSET ?",
+            (limit, offset)
+        ).fetchall()
+        return total, [{
+            "documento": documento,
+            "tipo": tipo_de(documento),
+            "situacao": NOMES_SITUACAO.get(situacao),
+            "data_count": data_count,
+            "verificado_em": verificado_em
+        } for documento, situacao, data_count, verificado_em in rows]
+
+    def eventos(self, desde=0, limit=1000):
+        """
+        Retorna os eventos com id maior que desde, em ordem
+        """
+        rows = self._connect().execute(
+            "SELECT id, dados FROM eventos WHERE id > ? ORDER BY id LIMIT ?", (desde, limit)
+        ).fetchall()
+        return [dict(serializacao.loads(dados), id=id_) for id_, dados in rows]
+
+    def reservar(self, agora, intervalo, limite, cnpj=True):
+        """
+        Reserva documentos com verificação vencida, adiando a próxima verificação
+
+        A reserva é atômica, então cada documento é verificado por um único
+        worker. Com cnpj=False, reserva apenas CPFs (os CNPJs seguem a base local).
+        """
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            filtro = "" if cnpj else " AND length(documento) = 11"
+            docs = [row[0] for row in conn.execute(
+                f"SELECT documento FROM monitorados WHERE proxima_em <= ?{filtro} ORDER BY proxima_em LIMIT ?",
+                (agora, limite)
+            )]
+            conn.executemany(
+                "UPDATE monitorados SET proxima_em = ? WHERE documento = ?",
+                ((agora + intervalo, documento) for documento in docs)
+            )
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return docs
+
+    def aplicar(self, conn, resultados, agora):
+        """
+        Grava os novos vereditos (dentro da transação da chamada) e retorna os eventos gerados
+
+        resultados é uma lista de (documento, veredito_de(...), fonte).
+        """
+        docs = [documento for documento, _, _ in resultados]
+        anteriores = {}
+        for inicio in range(0, len(docs), 500):
+            parte = docs[inicio:inicio + 500]
+            anteriores.update((row[0], row[1:]) for row in conn.execute(
+                "SELECT documento, situacao, data_count, assinatura FROM monitorados"
+                f" WHERE documento IN ({','.join('?' * len(parte))})", parte
+            ))
+
+        eventos = []
+        for documento, resultado, fonte in resultados:
+            if resultado is None or documento not in anteriores:
+                # Erros mantêm o último veredito; documentos removidos no meio tempo são ignorados
+                continue
+            situacao, data_count, assinatura, veredito = resultado
+            situacao_anterior, data_count_anterior, assinatura_anterior = anteriores[documento]
+            conn.execute(
+                "UPDATE monitorados SET situacao = ?, data_count = ?, assinatura = ?, verificado_em = ?"
+                " WHERE documento = ?",
+                (situacao, data_count, assinatura, agora, documento)
+            )
+            # A primeira verificação registra o veredito inicial, sem evento
+            if situacao_anterior is None or assinatura == assinatura_anterior:
+                continue
+            evento = {
+                "documento": documento,
+                "tipo": tipo_de(documento),
+                "em": agora,
+                "fonte": fonte,
+                "de": {"situacao": NOMES_SITUACAO[situacao_anterior], "data_count": data_count_anterior},
+                "para": dict(veredito, situacao=NOMES_SITUACAO[situacao])
+            }
+            cursor = conn.execute(
+                "INSERT INTO eventos (documento, em, dados) VALUES (?, ?, ?)",
+                (documento, agora, serializacao.dumps(evento).decode('utf-8'))
+            )
+            evento["id"] = cursor.lastrowid
+            eventos.append(evento)
+        return eventos
+
+    def contar(self, cnpj=True):
+        """
+        Quantidade de documentos monitorados (com cnpj=False, apenas os CPFs)
+        """
+        filtro = "" if cnpj else " WHERE length(documento) = 11"
+        return self._connect().execute("SELECT COUNT(*) FROM monitorados" + filtro).fetchone()[0]
+
+    def cnpjs(self, verificados=None):
+        """
+        Lista os CNPJs monitorados (com verificados=True/False, só os já verificados ou os ainda não)
+        """
+        filtro = {None: "", True: " AND situacao IS NOT NULL", False: " AND situacao IS NULL"}[verificados]
+        return [row[0] for row in self._connect().execute(
+            "SELECT documento FROM monitorados WHERE length(documento) = 14" + filtro
+        )]
+
+    def transacao(self):
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        return conn
+
+    def versao_base(self, conn=None):
+        row = (conn or self._connect()).execute("SELECT valor FROM meta WHERE chave = 'versao_base'").fetchone()
+        return int(row[0]) if row else 0
+
+
+class Monitor:
+    """
+    Verificação periódica da lista de acompanhamento, em uma thread de cada worker
+    """
+
+    def __init__(self, store, ciclo=CICLO, intervalo=INTERVALO, lote=LOTE, webhook=WEBHOOK):
+        self.store = store
+        self.ciclo = ciclo
+        self.intervalo = intervalo
+        self.lote = lote
+        self.webhook = webhook
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def iniciar(self):
+        """
+        Inicia o agendador deste processo, se ainda não estiver em execução
+
+        Após um fork, a thread é recriada no worker.
+        """
+        if self._pid == os.getpid() or self.ciclo <= 0:
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            threading.Thread(target=self._loop, daemon=True).start()
+
+    def _loop(self):
+        while True:
+            time.sleep(self.ciclo)
+            try:
+                self.verificar()
+            except Exception:
+                # Uma falha no ciclo (ex.: base local sendo substituída) é tentada de novo no próximo
+                metricas.WATCH_ERRORS.inc()
+
+    def verificar(self):
+        """
+        Executa um ciclo de verificação e retorna os eventos gerados
+        """
+        eventos = []
+        local = consulta.base.disponivel()
+        if local:
+            eventos.extend(self.verificar_base_local())
+        if consulta.pool:
+            # Sem base local, todos os documentos seguem pela consulta; com ela, só os CPFs
+            while True:
+                docs = self.store.reservar(time.time(), self.intervalo, self.lote, cnpj=not local)
+                if not docs:
+                    break
+                eventos.extend(self.verificar_consulta(docs))
+        metricas.WATCH_UNVERIFIABLE.set(self.nao_verificaveis(local))
+        self.notificar(eventos)
+        return eventos
+
+    def nao_verificaveis(self, local=None):
+        """
+        Quantidade de documentos que nenhuma fonte configurada consegue verificar
+
+        Sem tokens do servidor, os CPFs (ou todos os documentos, sem base local)
+        ficam sem verificação: a consulta à API exige um token.
+        """
+        if consulta.pool:
+            return 0
+        if local is None:
+            local = consulta.base.disponivel()
+        return self.store.contar(cnpj=not local)
+
+    def verificar_base_local(self):
+        """
+        Reavalia pela base local os CNPJs ainda não verificados e os alterados desde a última versão
+
+        Uma reconstrução completa da base reavalia todos os CNPJs monitorados.
+        Os vereditos são calculados fora da transação, que fica aberta só para
+        gravá-los, sem bloquear o restante do monitoramento durante o ciclo.
+        """
+        conn_base = sqlite3.connect(consulta.base.path)
+        try:
+            meta = dict(conn_base.execute("SELECT chave, valor FROM meta"))
+        finally:
+            conn_base.close()
+        versao = int(meta.get('versao', 0))
+        carga_completa = int(meta.get('carga_completa', versao))
+
+        processada = self.store.versao_base()
+        if carga_completa > processada:
+            docs = self.store.cnpjs()
+        else:
+            docs = self.store.cnpjs(verificados=False)
+            alterados = {item["documento"] for item in base_local.listar_alteracoes(processada, consulta.base.path)}
+            if alterados:
+                docs.extend(alterados & set(self.store.cnpjs(verificados=True)))
+
+        agora = time.time()
+        resultados = []
+        for documento in docs:
+            payload, status, _, _ = consulta.consultar_local(cnpj=documento)
+            resultados.append((documento, veredito_de(payload) if status == 200 else None, 'base_local'))
+        metricas.WATCH_CHECKS.inc(len(resultados), fonte='base_local')
+
+        conn = self.store.transacao()
+        try:
+            eventos = []
+            # Outro worker pode ter gravado, no meio tempo, os vereditos de uma versão mais nova da base
+            if self.store.versao_base(conn) <= versao:
+                eventos = self.store.aplicar(conn, resultados, agora)
+                conn.execute("INSERT OR REPLACE INTO meta (chave, valor) VALUES ('versao_base', ?)", (str(versao),))
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return eventos
+
+    def verificar_consulta(self, docs):
+        """
+        Verifica documentos pelo núcleo de consulta (cache primeiro, API quando expirado)
+        """
+        preparados = [(documento, tipo_de(documento), documento) for documento in docs]
+        resultados = []
+        for indice, item in lote.executar(None, preparados):
+            payload = item["resultado"]
+            resultados.append((docs[indice], veredito_de(payload) if item["status"] == 200 else None, 'api'))
+        metricas.WATCH_CHECKS.inc(len(resultados), fonte='api')
+
+        conn = self.store.transacao()
+        try:
+            eventos = self.store.aplicar(conn, resultados, time.time())
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return eventos
+
+    def notificar(self, eventos):
+        """
+        Envia os eventos do ciclo ao webhook, se configurado
+
+        O feed de eventos continua disponível se o envio falhar.
+        """
+        metricas.WATCH_EVENTS.inc(len(eventos))
+        if not self.webhook or not eventos:
+            return
+        try:
+            requests.post(
+                self.webhook,
+                data=b''.join(serializacao.dumps(evento) + b'\n' for evento in eventos),
+                headers={'Content-Type': 'application/x-ndjson'},
+                timeout=WEBHOOK_TIMEOUT
+            ).raise_for_status()
+        except requests.exceptions.RequestException:
+            metricas.WATCH_WEBHOOK_ERRORS.inc()
+
+
+def preparar(preparados):
+    """
+    Separa os documentos validados por lote.preparar_documentos
+
+    Retorna (documentos normalizados válidos, documentos inválidos).
+    """
+    validos, invalidos = [], []
+    for valor, tipo, documento in preparados:
+        if tipo is None:
+            invalidos.append(valor)
+        else:
+            validos.append(documento)
+    return validos, invalidos
+
+
+store = WatchStore()
+monitor = Monitor(store)
+
+
+def main(argv=None):
+    """
+    Linha de comando da lista de acompanhamento
+    """
+    parser = argparse.ArgumentParser(prog='consulta-ceis monitoramento', description="Monitoramento de documentos")
+    sub = parser.add_subparsers(dest='comando', required=True)
+
+    for nome, ajuda in (('adicionar', "Inclui os documentos de um arquivo CSV na lista"),
+                        ('remover', "Retira da lista os documentos de um arquivo CSV")):
+        cmd = sub.add_parser(nome, help=ajuda)
+        cmd.add_argument('arquivo', help="Arquivo CSV com os documentos (mesmas regras do lote)")
+
+    sub.add_parser('verificar', help="Executa um ciclo de verificação e imprime os eventos gerados")
+
+    cmd = sub.add_parser('eventos', help="Imprime o feed de eventos em NDJSON")
+    cmd.add_argument('--desde', type=int, default=0, help="Último id de evento já processado (padrão: %(default)s)")
+
+    args = parser.parse_args(argv)
+
+    if args.comando in ('adicionar', 'remover'):
+        with open(args.arquivo, 'rb') as f:
+            validos, invalidos = preparar(lote.preparar_documentos(lote.ler_csv(f)))
+        if args.comando == 'adicionar':
+            resultado = {"adicionados": store.adicionar(validos)}
+        else:
+            resultado = {"removidos": store.remover(validos)}
+        resultado["invalidos"] = invalidos
+        print(serializacao.dumps(resultado).decode('utf-8'))
+        return 0
+
+    eventos = monitor.verificar() if args.comando == 'verificar' else store.eventos(args.desde, limit=sys.maxsize)
+    for evento in eventos:
+        print(serializacao.dumps(evento).decode('utf-8'))
+    if args.comando == 'verificar':
+        nao_verificaveis = monitor.nao_verificaveis()
+        if nao_verificaveis:
+            print(f"{nao_verificaveis} documentos não puderam ser verificados: configure CEIS_TOKENS "
+                  "(e a base local para os CNPJs)", file=sys.stderr)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,406 @@
+"""
+Busca aproximada por nome nas sanções da base local
+
+Muitas vezes só se tem o nome da empresa, e não o CNPJ. Este módulo monta,
+a partir da base local, um índice de trigramas dos nomes sancionados (razão
+social, nome fantasia e nomes informados), sem acentos nem pontuação, e
+responde buscas por semelhança com os documentos candidatos em ordem de
+relevância.
+
+O índice é um arquivo binário gravado ao lado da base local e aberto com
+mmap: o worker não lê o arquivo inteiro ao iniciar, e o sistema operacional
+compartilha as mesmas páginas entre todos os workers.
+
+Uso:
+    python nomes.py construir
+    python nomes.py buscar "acao comercio ltda"
+"""
+import argparse
+import bisect
+import heapq
+import json
+import math
+import mmap
+import os
+import re
+import sqlite3
+import struct
+import sys
+import threading
+import time
+import unicodedata
+from array import array
+from collections import Counter
+
+import base_local
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# Arquivo do índice de nomes
+NOMES_PATH = os.environ.get('CEIS_NOMES_PATH', 'ceis_nomes.idx')
+
+# Semelhança mínima (0 a 1) e quantidade padrão de candidatos retornados
+SEMELHANCA_MINIMA = float(os.environ.get('CEIS_NOMES_SEMELHANCA', 0.5))
+LIMITE = 10
+
+# Máximo de ocorrências de trigramas percorridas para reunir candidatos em uma busca
+ORCAMENTO = int(os.environ.get('CEIS_NOMES_ORCAMENTO', 200000))
+
+# Campos dos registros indexados
+CAMPOS = ('cadastro_receita', 'nome_fantasia', 'nome', 'nome_informado')
+
+# Formato do arquivo: cabeçalho, códigos dos trigramas (ordenados), início da
+# lista de cada trigrama, listas de entradas, primeira entrada de cada
+# quantidade de trigramas e textos das entradas. As entradas são numeradas
+# em ordem de quantidade de trigramas, então cada faixa de tamanho é um
+# intervalo de números em todas as listas.
+MAGICO = b'CEISNOME'
+VERSAO_FORMATO = 2
+CABECALHO = struct.Struct('<8sBBxxIQdIIII')
+
+# Texto de cada entrada: tamanhos do documento e do nome, seguidos do
+# documento, do nome original e do nome normalizado (o restante), de modo
+# que o nome pode conter qualquer caractere
+ENTRADA = struct.Struct('<BI')
+
+# Os nomes normalizados usam apenas letras, dígitos e espaço: 37 símbolos,
+# então cada trigrama cabe em um inteiro de 16 bits
+ALFABETO = ' 0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZ'
+_CODIGOS = {ch: i for i, ch in enumerate(ALFABETO)}
+_NAO_ALFANUMERICO = re.compile(r'[^0-9A-Z]+')
+
+
+def normalizar(texto):
+    """
+    Remove acentos e pontuação, em maiúsculas e com espaços simples
+    """
+    texto = unicodedata.normalize('NFKD', texto or '')
+    texto = ''.join(ch for ch in texto if not unicodedata.combining(ch)).upper()
+    return _NAO_ALFANUMERICO.sub(' ', texto).strip()
+
+
+def trigramas(normalizado):
+    """
+    Códigos dos trigramas de um nome normalizado (com espaços nas bordas)
+    """
+    texto = f'  {normalizado} '
+    return {
+        _CODIGOS[texto[i]] * 1369 + _CODIGOS[texto[i + 1]] * 37 + _CODIGOS[texto[i + 2]]
+        for i in range(len(texto) - 2)
+    }
+
+
+def _alinhar(f):
+    # As seções numéricas começam em posições múltiplas de 4
+    f.write(b'\0' * (-f.tell() % 4))
+
+
+def construir(base=base_local.LOCAL_PATH, destino=NOMES_PATH):
+    """
+    Monta o índice de nomes a partir da base local
+
+    O arquivo é gravado ao lado e trocado de uma vez, de modo que os workers
+    com o índice anterior aberto continuam a usá-lo até recarregar.
+    Retorna um resumo com a versão da base, entradas e trigramas.
+    """
+    conn = sqlite3.connect(base)
+    try:
+        versao = int(dict(conn.execute("SELECT chave, valor FROM meta")).get('versao', 0))
+        vistas = set()
+        entradas = []
+        for documento, dados in conn.execute("SELECT documento, dados FROM sancoes ORDER BY documento"):
+            registro = json.loads(dados)
+            for campo in CAMPOS:
+                nome = (registro.get(campo) or '').strip()
+                normalizado = normalizar(nome)
+                if normalizado and (documento, normalizado) not in vistas:
+                    vistas.add((documento, normalizado))
+                    entradas.append((documento, nome, normalizado))
+    finally:
+        conn.close()
+
+    conjuntos = [trigramas(normalizado) for _, _, normalizado in entradas]
+    ordem = sorted(range(len(entradas)), key=lambda i: (len(conjuntos[i]), entradas[i][0]))
+    entradas = [entradas[i] for i in ordem]
+    conjuntos = [conjuntos[i] for i in ordem]
+
+    postings = {}
+    faixas = array('I', [0])
+    for indice, conjunto in enumerate(conjuntos):
+        while len(faixas) <= len(conjunto):
+            faixas.append(indice)
+        for codigo in conjunto:
+            postings.setdefault(codigo, array('I')).append(indice)
+    faixas.append(len(entradas))
+    codigos = sorted(postings)
+
+    inicios = array('I', [0])
+    for codigo in codigos:
+        inicios.append(inicios[-1] + len(postings[codigo]))
+    textos = array('I', [0])
+    bloco = bytearray()
+    for documento, nome, normalizado in entradas:
+        documento_bytes, nome_bytes = documento.encode('utf-8'), nome.encode('utf-8')
+        bloco += ENTRADA.pack(len(documento_bytes), len(nome_bytes))
+        bloco += documento_bytes + nome_bytes + normalizado.encode('utf-8')
+        textos.append(len(bloco))
+
+    temporario = destino + '.tmp'
+    with open(temporario, 'wb') as f:
+        f.write(CABECALHO.pack(
+            MAGICO, VERSAO_FORMATO, sys.byteorder == 'little', len(entradas), versao, time.time(),
+            len(codigos), inicios[-1], len(faixas), len(bloco)
+        ))
+        array('H', codigos).tofile(f)
+        _alinhar(f)
+        inicios.tofile(f)
+        for codigo in codigos:
+            postings[codigo].tofile(f)
+        faixas.tofile(f)
+        textos.tofile(f)
+        f.write(bloco)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temporario, destino)
+    return {"versao": versao, "entradas": len(entradas), "trigramas": len(codigos)}
+
+
+class IndiceNomes:
+    """
+    Índice de nomes aberto com mmap, reaberto quando o arquivo é substituído
+    """
+
+    def __init__(self, path=NOMES_PATH):
+        self.path = path
+        self._secoes = None
+        self._mtime = None
+        self._lock = threading.Lock()
+
+    def disponivel(self):
+        return os.path.exists(self.path)
+
+    def _abrir(self):
+        """
+        Mapeia o arquivo na primeira busca e sempre que ele muda
+        """
+        mtime = os.stat(self.path).st_mtime
+        if self._secoes is not None and self._mtime == mtime:
+            return self._secoes
+        with self._lock:
+            if self._secoes is not None and self._mtime == mtime:
+                return self._secoes
+            with open(self.path, 'rb') as f:
+                mapa = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            (magico, formato, little, n_entradas, versao, construido_em,
+             n_trigramas, n_postings, n_faixas, n_textos) = CABECALHO.unpack_from(mapa)
+            if magico != MAGICO or formato != VERSAO_FORMATO or little != (sys.byteorder == 'little'):
+                raise ValueError("Índice de nomes incompatível: reconstrua com python nomes.py construir")
+
+            visao = memoryview(mapa)
+            posicao = CABECALHO.size
+
+            def secao(formato_item, quantidade, tamanho):
+                nonlocal posicao
+                inicio = posicao
+                posicao += quantidade * tamanho
+                posicao += -posicao % 4 if formato_item else 0
+                return visao[inicio:inicio + quantidade * tamanho].cast(formato_item) if formato_item \
+                    else visao[inicio:inicio + quantidade]
+
+            secoes = {
+                "codigos": secao('H', n_trigramas, 2),
+                "inicios": secao('I', n_trigramas + 1, 4),
+                "postings": secao('I', n_postings, 4),
+                "faixas": secao('I', n_faixas, 4),
+                "textos": secao('I', n_entradas + 1, 4),
+                "bloco": secao(None, n_textos, 1),
+                "versao": versao,
+                "construido_em": construido_em
+            }
+            if numpy is not None:
+                # Quantidade de trigramas de cada entrada, para calcular a semelhança de todas de uma vez
+                faixas = numpy.frombuffer(secoes["faixas"], dtype=numpy.uint32)
+                secoes["tamanhos"] = numpy.repeat(
+                    numpy.arange(len(faixas) - 1, dtype=numpy.uint16), numpy.diff(faixas)
+                )
+
+            # A troca da referência é atômica para as threads que estão buscando
+            self._secoes = secoes
+            self._mtime = mtime
+            return secoes
+
+    def _entrada(self, secoes, indice):
+        # Retorna (documento, nome original, nome normalizado)
+        inicio, fim = secoes["textos"][indice], secoes["textos"][indice + 1]
+        dados = bytes(secoes["bloco"][inicio:fim])
+        tamanho_documento, tamanho_nome = ENTRADA.unpack_from(dados)
+        fim_documento = ENTRADA.size + tamanho_documento
+        fim_nome = fim_documento + tamanho_nome
+        return (dados[ENTRADA.size:fim_documento].decode('utf-8'), dados[fim_documento:fim_nome].decode('utf-8'),
+                dados[fim_nome:].decode('utf-8'))
+
+    def buscar(self, nome, limite=LIMITE, minimo=SEMELHANCA_MINIMA):
+        """
+        Busca os documentos com nomes semelhantes ao informado
+
+        A semelhança é o coeficiente de Dice entre os trigramas dos nomes, e
+        só são considerados nomes com quantidade de trigramas compatível com
+        a semelhança mínima. Com o numpy instalado (pip install
+        consulta-ceis[busca]), as listas dos trigramas são contadas de uma vez;
+        sem ele, os candidatos vêm dos trigramas mais raros da busca.
+        Retorna (candidatos, versão da base indexada).
+        """
+        secoes = self._abrir()
+        normalizado = normalizar(nome)
+        if not normalizado:
+            return [], secoes["versao"]
+        consulta = trigramas(normalizado)
+
+        # Faixa de tamanhos (em trigramas) que pode atingir a semelhança mínima
+        faixas = secoes["faixas"]
+        menor = math.ceil(len(consulta) * minimo / (2 - minimo))
+        maior = min(int(len(consulta) * (2 - minimo) / minimo), len(faixas) - 2)
+        if menor > maior:
+            return [], secoes["versao"]
+        primeira, ultima = faixas[menor], faixas[maior + 1]
+
+        codigos, inicios, postings = secoes["codigos"], secoes["inicios"], secoes["postings"]
+        listas = []
+        for codigo in consulta:
+            posicao = bisect.bisect_left(codigos, codigo)
+            if posicao < len(codigos) and codigos[posicao] == codigo:
+                lista = postings[inicios[posicao]:inicios[posicao + 1]]
+                lista = lista[bisect.bisect_left(lista, primeira):bisect.bisect_left(lista, ultima)]
+                if len(lista):
+                    listas.append(lista)
+
+        # Trigramas em comum necessários para atingir a semelhança mínima com o menor nome da faixa
+        necessarios = max(1, math.ceil(minimo * (len(consulta) + menor) / 2))
+        if len(listas) < necessarios:
+            melhores = {}
+        elif numpy is not None:
+            melhores = self._pontuar_numpy(secoes, listas, len(consulta), primeira, ultima, limite, minimo)
+        else:
+            melhores = self._pontuar(secoes, listas, len(consulta), necessarios, limite, minimo)
+
+        ordenados = sorted(melhores.items(), key=lambda item: (-item[1][0], item[0]))[:limite]
+        return [{
+            "documento": documento,
+            "tipo": 'cpf' if len(documento) == 11 else 'cnpj',
+            "nome": original,
+            "semelhanca": round(semelhanca, 4)
+        } for documento, (semelhanca, original) in ordenados], secoes["versao"]
+
+    def _pontuar_numpy(self, secoes, listas, tamanho_consulta, primeira, ultima, limite, minimo):
+        """
+        Conta os trigramas em comum de todos os nomes da faixa de uma vez
+        """
+        entradas = numpy.concatenate([numpy.frombuffer(lista, dtype=numpy.uint32) for lista in listas])
+        comuns = numpy.bincount(entradas - primeira, minlength=ultima - primeira)
+        semelhancas = 2 * comuns / (tamanho_consulta + secoes["tamanhos"][primeira:ultima])
+        candidatos = numpy.flatnonzero(semelhancas >= minimo)
+        candidatos = candidatos[numpy.argsort(-semelhancas[candidatos], kind='stable')]
+
+        melhores = {}
+        for posicao in candidatos:
+            documento, original, _ = self._entrada(secoes, primeira + int(posicao))
+            if documento not in melhores:
+                melhores[documento] = (float(semelhancas[posicao]), original)
+                if len(melhores) >= limite:
+                    break
+        return melhores
+
+    def _pontuar(self, secoes, listas, tamanho_consulta, necessarios, limite, minimo):
+        """
+        Confere os candidatos dos trigramas mais raros nas listas restantes
+
+        Um nome com a semelhança mínima contém pelo menos um dos trigramas
+        mais raros. Os candidatos são conferidos em ordem decrescente de
+        trigramas em comum, até que nenhum dos que faltam possa superar os já
+        encontrados. Se até os trigramas mais raros forem muito comuns (ex.:
+        "comercio ltda"), os candidatos vêm apenas das listas que cabem em
+        CEIS_NOMES_ORCAMENTO ocorrências.
+        """
+        listas = sorted(listas, key=len)
+        quantidade, percorridas = 0, 0
+        for lista in listas[:len(listas) - necessarios + 1]:
+            if quantidade and percorridas + len(lista) > ORCAMENTO:
+                break
+            percorridas += len(lista)
+            quantidade += 1
+        contagem = Counter()
+        for lista in listas[:quantidade]:
+            contagem.update(lista)
+        restantes = listas[quantidade:]
+
+        niveis = {}
+        for indice, comuns in contagem.items():
+            niveis.setdefault(comuns, []).append(indice)
+
+        faixas = secoes["faixas"]
+        melhores = {}
+        piso = minimo
+        for comuns in sorted(niveis, reverse=True):
+            maximo = comuns + len(restantes)
+            if 2 * maximo / (tamanho_consulta + maximo) < piso:
+                break
+            for indice in niveis[comuns]:
+                tamanho = bisect.bisect_right(faixas, indice) - 1
+                if 2 * min(maximo, tamanho) / (tamanho_consulta + tamanho) < piso:
+                    continue
+                total = comuns
+                for lista in restantes:
+                    posicao = bisect.bisect_left(lista, indice)
+                    total += posicao < len(lista) and lista[posicao] == indice
+                semelhanca = 2 * total / (tamanho_consulta + tamanho)
+                if semelhanca < piso or (len(melhores) >= limite and semelhanca <= piso):
+                    continue
+                documento, original, _ = self._entrada(secoes, indice)
+                if semelhanca <= melhores.get(documento, (0,))[0]:
+                    continue
+                melhores[documento] = (semelhanca, original)
+                if len(melhores) >= limite:
+                    piso = max(piso, heapq.nlargest(limite, (s for s, _ in melhores.values()))[-1])
+        return melhores
+
+
+indice = IndiceNomes()
+
+
+def main(argv=None):
+    """
+    Linha de comando para construir o índice e testar buscas
+    """
+    parser = argparse.ArgumentParser(prog='nomes.py', description="Índice de nomes da base local")
+    sub = parser.add_subparsers(dest='comando', required=True)
+
+    cmd = sub.add_parser('construir', help="Monta o índice de nomes a partir da base local")
+    cmd.add_argument('--base', default=base_local.LOCAL_PATH, help="Arquivo da base local (padrão: %(default)s)")
+    cmd.add_argument('--destino', default=NOMES_PATH, help="Arquivo do índice (padrão: %(default)s)")
+
+    cmd = sub.add_parser('buscar', help="Busca documentos pelo nome")
+    cmd.add_argument('nome')
+    cmd.add_argument('--limite', type=int, default=LIMITE, help="Quantidade de candidatos (padrão: %(default)s)")
+
+    args = parser.parse_args(argv)
+
+    if args.comando == 'buscar':
+        candidatos, _ = indice.buscar(args.nome, args.limite)
+        for candidato in candidatos:
+            print(json.dumps(candidato, ensure_ascii=False))
+        return 0
+
+    inicio = time.time()
+    resumo = construir(args.base, args.destino)
+    print(
+        f"Índice de nomes da versão {resumo['versao']}: {resumo['entradas']} nomes, "
+        f"{resumo['trigramas']} trigramas em {time.time() - inicio:.1f} s"
+    )
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,283 @@
+"""
+Projeção de campos e modos "veredito" e "resumo" das respostas de consulta
+
+Permite que clientes de alto volume recebam apenas os campos que usam
+(fields=data_count,data.sancao.fim_data), um resumo compacto com a
+indicação de sanção e as datas principais (modo=veredito) ou apenas os
+totais calculados sobre todas as sanções do documento (modo=resumo). As
+sanções podem ser paginadas com offset e limit. Os campos code,
+code_message e errors são sempre mantidos, preservando o formato de erro
+dos endpoints.
+"""
+import re
+import unicodedata
+from datetime import date, datetime
+from functools import lru_cache
+
+MODOS = ('completo', 'veredito', 'resumo')
+
+# Campos mantidos em qualquer projeção (parcial só existe na consulta em vários cadastros,
+# paginacao só quando as sanções são paginadas)
+SEMPRE = ('code', 'code_message', 'errors', 'parcial', 'paginacao')
+
+# Quantidade máxima de campos em fields
+MAX_CAMPOS = 50
+
+# Quantidade máxima de sanções por página (limit)
+MAX_LIMITE = 1000
+
+# Gravidade dos tipos de sanção, do mais grave ao mais leve, pelo início do
+# nome da categoria (sem acentos); os demais tipos (multa, publicação...) vêm depois
+GRAVIDADE = ('inidoneidade', 'declaracao de inidoneidade', 'proibicao', 'impedimento', 'suspensao')
+
+_caminho = re.compile(r'[A-Za-z_]\w*(\.[A-Za-z_]\w*)*')
+
+
+@lru_cache(maxsize=256)
+def ler_campos(fields):
+    """
+    Interpreta o parâmetro fields (caminhos separados por vírgula)
+
+    Retorna a tupla de caminhos, cada um como tupla de chaves, ou None se inválido.
+    """
+    caminhos = [campo.strip() for campo in fields.split(',') if campo.strip()]
+    if not caminhos or len(caminhos) > MAX_CAMPOS or not all(_caminho.fullmatch(c) for c in caminhos):
+        return None
+    return tuple(tuple(caminho.split('.')) for caminho in caminhos)
+
+
+def ler_parametros(modo=None, fields=None):
+    """
+    Valida os parâmetros de apresentação da resposta
+
+    Retorna ((modo, caminhos), None) ou (None, (dados do erro, status HTTP)).
+    """
+    modo = modo or 'completo'
+    if modo not in MODOS:
+        return None, ({
+            "code": 400,
+            "code_message": "Parâmetro inválido",
+            "errors": [f"Modo desconhecido: {modo} (use {', '.join(MODOS)})"]
+        }, 400)
+
+    caminhos = None
+    if fields:
+        caminhos = ler_campos(fields)
+        if caminhos is None:
+            return None, ({
+                "code": 400,
+                "code_message": "Parâmetro inválido",
+                "errors": [f"fields deve listar até {MAX_CAMPOS} campos separados por vírgula (ex.: data_count,data.sancao.fim_data)"]
+            }, 400)
+    return (modo, caminhos), None
+
+
+def ler_pagina(offset=None, limit=None):
+    """
+    Valida a paginação das sanções (offset e limit)
+
+    Retorna ((offset, limit), None), (None, None) sem paginação ou
+    (None, (dados do erro, status HTTP)).
+    """
+    if offset in (None, '') and limit in (None, ''):
+        return None, None
+    try:
+        offset = int(offset or 0)
+        limit = int(limit) if limit not in (None, '') else MAX_LIMITE
+    except ValueError:
+        offset = limit = -1
+    if offset < 0 or not 0 <= limit <= MAX_LIMITE:
+        return None, ({
+            "code": 400,
+            "code_message": "Parâmetro inválido",
+            "errors": [f"offset deve ser um inteiro não negativo e limit um inteiro entre 0 e {MAX_LIMITE}"]
+        }, 400)
+    return (offset, limit), None
+
+
+def aplicar(payload, modo='completo', caminhos=None, pagina=None):
+    """
+    Aplica o modo, a paginação e a projeção a uma resposta, sem alterar o dicionário original
+
+    No modo completo, o resumo é incluído quando pedido em fields (ex.:
+    fields=resumo,data.sancao); ele é sempre calculado sobre todas as
+    sanções, antes da paginação.
+    """
+    if modo == 'veredito':
+        payload = veredito(payload)
+    elif modo == 'resumo':
+        payload = resumido(payload)
+    elif caminhos and any(caminho[0] == 'resumo' for caminho in caminhos) and payload.get('code') == 200:
+        payload = dict(payload, resumo=resumir(payload.get('data') or []))
+    if pagina:
+        payload = paginar(payload, *pagina)
+    if caminhos:
+        payload = projetar(payload, caminhos)
+    return payload
+
+
+def paginar(payload, offset, limit):
+    """
+    Mantém apenas uma página das sanções (data, ou sancoes no modo veredito)
+
+    data_count continua com o total; a página retornada fica em "paginacao".
+    """
+    chave = 'sancoes' if 'sancoes' in payload else 'data'
+    linhas = payload.get(chave)
+    if not isinstance(linhas, list):
+        return payload
+    return dict(
+        payload,
+        **{chave: linhas[offset:offset + limit]},
+        paginacao={"offset": offset, "limit": limit, "total": len(linhas)}
+    )
+
+
+def projetar(payload, caminhos):
+    """
+    Mantém apenas os caminhos informados; listas (como data) são projetadas item a item
+    """
+    resultado = {chave: payload[chave] for chave in SEMPRE if chave in payload}
+    for caminho in caminhos:
+        _copiar(payload, resultado, caminho)
+    return resultado
+
+
+def _copiar(origem, destino, caminho):
+    chave = caminho[0]
+    if not isinstance(origem, dict) or chave not in origem:
+        return
+    valor = origem[chave]
+    if len(caminho) == 1:
+        destino[chave] = valor
+    elif isinstance(valor, list):
+        itens = destino.get(chave)
+        if not isinstance(itens, list):
+            itens = destino[chave] = [{} for _ in valor]
+        for item_origem, item_destino in zip(valor, itens):
+            _copiar(item_origem, item_destino, caminho[1:])
+    elif isinstance(valor, dict):
+        _copiar(valor, destino.setdefault(chave, {}), caminho[1:])
+
+
+def veredito(payload):
+    """
+    Resumo da consulta: se há sanção e, para cada uma, o tipo, o órgão e as datas
+
+    Respostas de erro são mantidas como estão.
+    """
+    if payload.get('code') != 200:
+        return payload
+
+    data = payload.get('data') or []
+    sancoes = []
+    for item in data:
+        sancao = item.get('sancao') or {}
+        orgao = item.get('orgao_sancionador') or {}
+        resumo = {
+            "tipo": sancao.get('tipo'),
+            "orgao_sancionador": orgao.get('nome'),
+            "inicio_data": sancao.get('inicio_data'),
+            "fim_data": sancao.get('fim_data'),
+            "publicacao_data": sancao.get('publicacao_data')
+        }
+        # Na consulta em vários cadastros, cada registro indica de qual cadastro veio
+        if 'fonte' in item:
+            resumo["fonte"] = item['fonte']
+        sancoes.append(resumo)
+
+    data_count = payload.get('data_count', len(data))
+    resultado = {
+        "code": 200,
+        "code_message": payload.get('code_message'),
+        "sancionado": data_count > 0,
+        "data_count": data_count,
+        "sancoes": sancoes,
+        "errors": payload.get('errors', [])
+    }
+    if 'parcial' in payload:
+        resultado["parcial"] = payload['parcial']
+    return resultado
+
+
+def _data(valor):
+    # Datas da Infosimples e do arquivo do CEIS (dd/mm/aaaa); outros valores contam como não informados
+    try:
+        return datetime.strptime((valor or '').strip(), '%d/%m/%Y').date()
+    except ValueError:
+        return None
+
+
+def gravidade(tipo):
+    """
+    Posição do tipo de sanção em GRAVIDADE (menor é mais grave)
+    """
+    texto = unicodedata.normalize('NFKD', tipo or '')
+    texto = ''.join(ch for ch in texto if not unicodedata.combining(ch)).strip().lower()
+    for posicao, inicio in enumerate(GRAVIDADE):
+        if texto.startswith(inicio):
+            return posicao
+    return len(GRAVIDADE)
+
+
+def resumir(data, hoje=None):
+    """
+    Totais calculados sobre todas as sanções de um documento
+
+    Uma sanção está ativa se não tem data final ou se ela ainda não passou;
+    sanções sem data final também são contadas em sem_prazo.
+    """
+    hoje = hoje or date.today()
+    ativas = sem_prazo = 0
+    fim_mais_recente = None
+    orgaos = set()
+    tipo_mais_grave = None
+    for item in data:
+        sancao = item.get('sancao') or {}
+        fim = _data(sancao.get('fim_data'))
+        if fim is None:
+            sem_prazo += 1
+        if fim is None or fim >= hoje:
+            ativas += 1
+        if fim is not None and (fim_mais_recente is None or fim > fim_mais_recente[0]):
+            fim_mais_recente = (fim, sancao.get('fim_data').strip())
+        nome = (item.get('orgao_sancionador') or {}).get('nome')
+        if nome:
+            orgaos.add(nome)
+        tipo = sancao.get('tipo')
+        if tipo and (tipo_mais_grave is None or gravidade(tipo) < gravidade(tipo_mais_grave)):
+            tipo_mais_grave = tipo
+    return {
+        "total": len(data),
+        "ativas": ativas,
+        "expiradas": len(data) - ativas,
+        "sem_prazo": sem_prazo,
+        "fim_mais_recente": fim_mais_recente[1] if fim_mais_recente else None,
+        "orgaos": sorted(orgaos),
+        "tipo_mais_grave": tipo_mais_grave
+    }
+
+
+def resumido(payload):
+    """
+    Apenas os totais da consulta, sem as sanções
+
+    Respostas de erro são mantidas como estão.
+    """
+    if payload.get('code') != 200:
+        return payload
+
+    data = payload.get('data') or []
+    resumo = resumir(data)
+    resultado = {
+        "code": 200,
+        "code_message": payload.get('code_message'),
+        "sancionado": payload.get('data_count', len(data)) > 0,
+        "ativo": resumo["ativas"] > 0,
+        "data_count": payload.get('data_count', len(data)),
+        "resumo": resumo,
+        "errors": payload.get('errors', [])
+    }
+    if 'parcial' in payload:
+        resultado["parcial"] = payload['parcial']
+    return resultado
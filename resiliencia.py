@@ -0,0 +1,309 @@
+"""
+Limitador de taxa e disjuntor (circuit breaker) das chamadas à API
+
+O estado é guardado em um arquivo SQLite local, compartilhado por todos os
+workers do Gunicorn: o limite de requisições vale para o conjunto dos
+workers e, quando a API falha repetidamente, todos param de chamá-la ao
+mesmo tempo até o fim do período de espera.
+
+Se o arquivo não puder ser usado (sistema de arquivos somente leitura,
+banco bloqueado além do timeout), limitador e disjuntor passam a valer só
+para o worker, com estado em memória, até o arquivo voltar a responder.
+"""
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+import metricas
+
+# Arquivo SQLite com o estado compartilhado entre os workers
+STATE_PATH = os.environ.get('CEIS_RESILIENCIA_PATH', 'ceis_resiliencia.sqlite3')
+
+# Limite padrão de chamadas por segundo por token (0 desativa) e rajada máxima
+RATE_LIMIT = float(os.environ.get('CEIS_RATE_LIMIT', 0))
+RATE_BURST = float(os.environ.get('CEIS_RATE_BURST', 10))
+
+# Limites específicos por token, em JSON: {"<token>": <chamadas por segundo>}
+RATE_LIMITS = json.loads(os.environ.get('CEIS_RATE_LIMITS', '{}'))
+
+# Tempo máximo, em segundos, que uma consulta aguarda por uma vaga no limite
+RATE_MAX_WAIT = float(os.environ.get('CEIS_RATE_MAX_WAIT', 5))
+
+# Falhas consecutivas que abrem o disjuntor (0 desativa) e tempo de espera até nova tentativa
+BREAKER_THRESHOLD = int(os.environ.get('CEIS_BREAKER_THRESHOLD', 5))
+BREAKER_COOLDOWN = float(os.environ.get('CEIS_BREAKER_COOLDOWN', 30))
+
+# Por quanto tempo, após uma falha no arquivo de estado, o estado em memória do worker é usado
+FALLBACK_INTERVAL = float(os.environ.get('CEIS_RESILIENCIA_FALLBACK', 30))
+
+FECHADO = 'fechado'
+ABERTO = 'aberto'
+SEMIABERTO = 'semiaberto'
+
+logger = logging.getLogger(__name__)
+
+
+class SharedState:
+    """
+    Acesso ao arquivo SQLite de estado, com transações exclusivas entre processos
+    """
+
+    def __init__(self, path=STATE_PATH, fallback=FALLBACK_INTERVAL):
+        self.path = path
+        self.fallback = fallback
+        self._local = threading.local()
+        self._indisponivel_ate = 0.0
+
+    def disponivel(self):
+        """
+        Indica se o arquivo deve ser usado (False logo após uma falha)
+        """
+        return time.monotonic() >= self._indisponivel_ate
+
+    def falhou(self, erro):
+        """
+        Registra uma falha no arquivo; o estado em memória é usado por FALLBACK_INTERVAL segundos
+        """
+        if self.disponivel():
+            logger.warning("Estado compartilhado indisponível (%s); usando o estado do worker", erro)
+        self._indisponivel_ate = time.monotonic() + self.fallback
+        self._local.conn = None
+        metricas.SHARED_STATE_ERRORS.inc()
+
+    def connect(self):
+        # Uma conexão por thread e por processo; as tabelas são criadas na primeira conexão
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.executescript(
+                "CREATE TABLE IF NOT EXISTS buckets ("
+                " chave TEXT PRIMARY KEY,"
+                " fichas REAL NOT NULL,"
+                " atualizado_em REAL NOT NULL);"
+                "CREATE TABLE IF NOT EXISTS disjuntores ("
+                " chave TEXT PRIMARY KEY,"
+                " estado TEXT NOT NULL,"
+                " falhas INTEGER NOT NULL,"
+                " aberto_em REAL NOT NULL);"
+            )
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def transacao(self):
+        """
+        Inicia uma transação exclusiva (BEGIN IMMEDIATE) e retorna a conexão
+        """
+        conn = self.connect()
+        conn.execute("BEGIN IMMEDIATE")
+        return conn
+
+
+class TokenBucket:
+    """
+    Limitador de taxa por token, com fichas compartilhadas entre os workers
+    """
+
+    def __init__(self, state, rate=RATE_LIMIT, burst=RATE_BURST, limites=None):
+        self.state = state
+        self.rate = rate
+        self.burst = burst
+        self.limites = RATE_LIMITS if limites is None else limites
+        # Fichas em memória, usadas enquanto o arquivo de estado está indisponível
+        self._locais = {}
+        self._lock = threading.Lock()
+
+    def taxa(self, token):
+        return float(self.limites.get(token, self.rate))
+
+    def _consumir(self, anterior, taxa, now):
+        """
+        Consome uma ficha a partir do estado anterior (fichas, atualizado_em) ou None
+
+        Retorna (fichas restantes, espera até a próxima ficha).
+        """
+        capacidade = max(self.burst, 1)
+        fichas = capacidade if anterior is None else min(capacidade, anterior[0] + (now - anterior[1]) * taxa)
+        if fichas >= 1:
+            return fichas - 1, 0.0
+        return fichas, (1 - fichas) / taxa
+
+    def _tentar(self, token, taxa):
+        """
+        Tenta consumir uma ficha; retorna 0 se conseguiu ou o tempo até a próxima ficha
+        """
+        # O token não é gravado em disco, apenas seu hash
+        chave = hashlib.sha256(token.encode('utf-8')).hexdigest()
+        now = time.time()
+        if self.state.disponivel():
+            try:
+                return self._tentar_compartilhado(chave, taxa, now)
+            except sqlite3.Error as e:
+                self.state.falhou(e)
+        with self._lock:
+            fichas, espera = self._consumir(self._locais.get(chave), taxa, now)
+            self._locais[chave] = (fichas, now)
+        return espera
+
+    def _tentar_compartilhado(self, chave, taxa, now):
+        conn = self.state.transacao()
+        try:
+            row = conn.execute("SELECT fichas, atualizado_em FROM buckets WHERE chave = ?", (chave,)).fetchone()
+            fichas, espera = self._consumir(row, taxa, now)
+            conn.execute(
+                "INSERT OR REPLACE INTO buckets (chave, fichas, atualizado_em) VALUES (?, ?, ?)",
+                (chave, fichas, now)
+            )
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return espera
+
+    def acquire(self, token, max_wait=RATE_MAX_WAIT):
+        """
+        Aguarda uma vaga no limite do token por até max_wait segundos
+
+        Retorna True se a chamada pode seguir ou False se o limite foi excedido.
+        """
+        taxa = self.taxa(token)
+        if taxa <= 0:
+            return True
+        limite = time.monotonic() + max_wait
+        while True:
+            espera = self._tentar(token, taxa)
+            if espera == 0:
+                return True
+            if time.monotonic() + espera > limite:
+                return False
+            time.sleep(espera)
+
+
+class CircuitBreaker:
+    """
+    Disjuntor das chamadas à API, compartilhado entre os workers
+
+    Após BREAKER_THRESHOLD falhas consecutivas, o disjuntor abre e as
+    consultas falham imediatamente. Passado o período de espera, uma única
+    chamada de teste é liberada: se funcionar, o disjuntor fecha; senão,
+    abre novamente.
+    """
+
+    def __init__(self, state, threshold=BREAKER_THRESHOLD, cooldown=BREAKER_COOLDOWN, chave='infosimples'):
+        self.state = state
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.chave = chave
+        # Estado em memória (estado, falhas, aberto_em), usado enquanto o arquivo está indisponível
+        self._local = (FECHADO, 0, 0.0)
+        self._lock = threading.Lock()
+
+    def permitir(self):
+        """
+        Indica se uma chamada à API pode ser feita agora
+
+        Retorna (permitido, segundos até nova tentativa).
+        """
+        if self.threshold <= 0:
+            return True, 0
+        if self.state.disponivel():
+            try:
+                return self._permitir_compartilhado()
+            except sqlite3.Error as e:
+                self.state.falhou(e)
+        return self._permitir_local()
+
+    def _permitir_compartilhado(self):
+        row = self.state.connect().execute(
+            "SELECT estado, aberto_em FROM disjuntores WHERE chave = ?", (self.chave,)
+        ).fetchone()
+        if row is None or row[0] == FECHADO:
+            return True, 0
+
+        restante = row[1] + self.cooldown - time.time()
+        if restante > 0:
+            return False, restante
+
+        # Período de espera encerrado: apenas um worker obtém a chamada de teste
+        conn = self.state.transacao()
+        try:
+            cursor = conn.execute(
+                "UPDATE disjuntores SET estado = ?, aberto_em = ? WHERE chave = ? AND aberto_em = ?",
+                (SEMIABERTO, time.time(), self.chave, row[1])
+            )
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        if cursor.rowcount == 1:
+            return True, 0
+        return False, self.cooldown
+
+    def _permitir_local(self):
+        with self._lock:
+            estado, falhas, aberto_em = self._local
+            if estado == FECHADO:
+                return True, 0
+            restante = aberto_em + self.cooldown - time.time()
+            if restante > 0:
+                return False, restante
+            self._local = (SEMIABERTO, falhas, time.time())
+            return True, 0
+
+    def _apos_falha(self, estado, falhas):
+        """
+        Novo (estado, falhas, aberto_em) após uma falha, a partir do estado atual
+        """
+        falhas += 1
+        if estado == SEMIABERTO or falhas >= self.threshold:
+            return ABERTO, falhas, time.time()
+        return estado, falhas, 0
+
+    def registrar(self, sucesso):
+        """
+        Registra o resultado de uma chamada à API
+        """
+        if self.threshold <= 0:
+            return
+        if self.state.disponivel():
+            try:
+                return self._registrar_compartilhado(sucesso)
+            except sqlite3.Error as e:
+                self.state.falhou(e)
+        with self._lock:
+            if sucesso:
+                self._local = (FECHADO, 0, 0.0)
+            else:
+                self._local = self._apos_falha(*self._local[:2])
+
+    def _registrar_compartilhado(self, sucesso):
+        conn = self.state.connect()
+        if sucesso:
+            # Evita escritas no caminho comum (disjuntor já fechado e sem falhas)
+            row = conn.execute("SELECT estado, falhas FROM disjuntores WHERE chave = ?", (self.chave,)).fetchone()
+            if row is None or (row[0] == FECHADO and row[1] == 0):
+                return
+            conn.execute(
+                "INSERT OR REPLACE INTO disjuntores (chave, estado, falhas, aberto_em) VALUES (?, ?, 0, 0)",
+                (self.chave, FECHADO)
+            )
+            return
+
+        conn = self.state.transacao()
+        try:
+            row = conn.execute("SELECT estado, falhas FROM disjuntores WHERE chave = ?", (self.chave,)).fetchone()
+            estado, falhas, aberto_em = self._apos_falha(row[0] if row else FECHADO, row[1] if row else 0)
+            conn.execute(
+                "INSERT OR REPLACE INTO disjuntores (chave, estado, falhas, aberto_em) VALUES (?, ?, ?, ?)",
+                (self.chave, estado, falhas, aberto_em)
+            )
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
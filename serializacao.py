@@ -0,0 +1,59 @@
+"""
+Serialização JSON das respostas
+
+Usa o orjson, bem mais rápido que o módulo json, quando estiver instalado
+(pip install consulta-ceis[json]); sem ele, recorre ao json da biblioteca
+padrão com a mesma saída compacta e chaves ordenadas.
+"""
+import json
+
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+if orjson is not None:
+    _OPCOES = orjson.OPT_SORT_KEYS | orjson.OPT_NON_STR_KEYS
+
+    def dumps(obj):
+        """
+        Serializa para bytes UTF-8, com chaves ordenadas e sem espaços
+        """
+        try:
+            return orjson.dumps(obj, option=_OPCOES)
+        except TypeError:
+            # Tipos não suportados pelo orjson (ex.: inteiros acima de 64 bits)
+            return json.dumps(obj, sort_keys=True, separators=(',', ':')).encode('utf-8')
+
+    loads = orjson.loads
+else:
+    def dumps(obj):
+        """
+        Serializa para bytes UTF-8, com chaves ordenadas e sem espaços
+        """
+        return json.dumps(obj, sort_keys=True, separators=(',', ':')).encode('utf-8')
+
+    loads = json.loads
+
+
+class JSONProvider(DefaultJSONProvider):
+    """
+    Provedor JSON do Flask (jsonify, app.json) baseado em dumps/loads deste módulo
+    """
+
+    def dumps(self, obj, **kwargs):
+        if kwargs:
+            return super().dumps(obj, **kwargs)
+        return dumps(obj).decode('utf-8')
+
+    def loads(self, s, **kwargs):
+        if kwargs:
+            return super().loads(s, **kwargs)
+        return loads(s)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(dumps(obj) + b"\n", mimetype=self.mimetype)
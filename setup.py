@@ -16,6 +16,7 @@ setup(
     long_description_content_type="text/markdown",
     url="https://github.com/seu-usuario/consulta-ceis",
     packages=find_packages(),
+    py_modules=["app", "asgi", "atualizacao", "auditoria", "base_local", "cache", "cadastros", "consulta", "documentos", "estaticos", "hedging", "jobs", "lote", "metricas", "monitoramento", "nomes", "projecao", "resiliencia", "serializacao", "singleflight", "snapshot", "tokens", "triagem", "upstream"],
     classifiers=[
         "Programming Language :: Python :: 3",
         "License :: OSI Approved :: MIT License",
@@ -23,10 +24,21 @@ setup(
     ],
     python_requires=">=3.7",
     install_requires=requirements,
+    extras_require={
+        "brotli": ["brotli>=1.0"],
+        "json": ["orjson>=3.8"],
+        "excel": ["openpyxl>=3.0"],
+        "parquet": ["pyarrow>=10"],
+        "busca": ["numpy>=1.20"],
+        "asgi": ["starlette>=0.27", "python-multipart>=0.0.6", "httpx>=0.24", "uvicorn>=0.23"],
+    },
     include_package_data=True,
+    # O frontend não pertence a um pacote: é instalado como dado e localizado por estaticos.py
+    data_files=[("share/consulta-ceis/static", ["static/index.html"])],
     entry_points={
         "console_scripts": [
             "consulta-ceis=app:run",
+            "consulta-ceis-base=base_local:main",
         ],
     },
 )
@@ -0,0 +1,112 @@
+"""
+Agrupamento de consultas idênticas simultâneas (single-flight)
+
+Consultas concorrentes ao mesmo documento compartilham uma única chamada à
+API da Infosimples: a primeira executa a chamada e as demais aguardam o
+resultado dela.
+"""
+import asyncio
+import hashlib
+import os
+import threading
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows: o bloqueio entre processos fica desativado
+    fcntl = None
+
+# Diretório dos arquivos de bloqueio usados para coordenar os workers (vazio desativa)
+LOCK_DIR = os.environ.get('CEIS_SINGLEFLIGHT_LOCK_DIR', '')
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """
+    Coordena chamadas em andamento por chave entre as threads de um processo
+    """
+
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def do(self, key, fn):
+        """
+        Executa fn() uma única vez para as chamadas simultâneas com a mesma chave
+
+        Retorna (resultado, compartilhado), onde compartilhado indica que o
+        resultado veio de uma chamada feita por outra thread.
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+
+        try:
+            call.result = fn()
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result, False
+
+
+class AsyncSingleFlight:
+    """
+    Equivalente do SingleFlight para corrotinas de um mesmo event loop
+
+    A chamada é executada em uma tarefa própria, de modo que o cancelamento
+    de um cliente (ex.: conexão encerrada) não cancela a consulta dos demais.
+    """
+
+    def __init__(self):
+        self._calls = {}
+
+    async def do(self, key, fn):
+        """
+        Executa fn() uma única vez para as corrotinas simultâneas com a mesma chave
+        """
+        task = self._calls.get(key)
+        if task is None:
+            task = self._calls[key] = asyncio.ensure_future(fn())
+            task.add_done_callback(lambda _: self._calls.pop(key, None))
+        return await asyncio.shield(task)
+
+
+@contextmanager
+def lock_entre_processos(key, lock_dir=None):
+    """
+    Bloqueio exclusivo por chave entre os workers, via arquivo de bloqueio
+
+    Sem diretório configurado (ou fora de sistemas POSIX) não faz nada.
+    """
+    lock_dir = LOCK_DIR if lock_dir is None else lock_dir
+    if not lock_dir or fcntl is None:
+        yield
+        return
+
+    os.makedirs(lock_dir, exist_ok=True)
+    # Um arquivo por chave, para que consultas a documentos diferentes não esperem umas pelas outras
+    name = hashlib.sha1(key.encode('utf-8')).hexdigest() + '.lock'
+    with open(os.path.join(lock_dir, name), 'a') as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
@@ -0,0 +1,398 @@
+"""
+Snapshot do cache de resultados para iniciar workers já aquecidos
+
+Periodicamente (e ao encerrar), cada worker grava os resultados válidos do
+seu cache em memória em um arquivo compacto, mesclados aos do snapshot
+anterior, para que workers novos ou reiniciados não comecem com o cache
+vazio. O arquivo é aberto com mmap na primeira consulta e nada é lido além
+do cabeçalho: a cada falta no cache, o documento é procurado por busca
+binária no índice do snapshot e, se ainda válido, copiado para a memória.
+O tempo de inicialização não cresce, portanto, com o tamanho do snapshot.
+Resultados expirados há menos de CEIS_CACHE_STALE_MAX também ficam no
+snapshot, para o último resultado conhecido (get_stale) e a revalidação.
+
+As gravações dos workers são serializadas por um flock no arquivo
+<snapshot>.lock, para que a leitura, a mescla e a troca do arquivo de um
+worker não descartem as entradas gravadas por outro no meio tempo.
+
+Formato (versão 1, little-endian):
+    cabeçalho   magic "CEISSNAP", versão u16, flags u16, entradas u32, criado_em f64
+    índice      por entrada, ordenado pelo hash: hash u64, posição u64,
+                tamanho da chave u32, tamanho do valor u32, armazenado_em f64, expira_em f64
+    dados       chave UTF-8 seguida do valor em JSON (comprimido com zlib na flag 1)
+
+Configuração (desativado por padrão):
+    CEIS_CACHE_SNAPSHOT_PATH=ceis_cache.snapshot
+    CEIS_CACHE_SNAPSHOT_INTERVAL=300
+"""
+import atexit
+import hashlib
+import mmap
+import os
+import struct
+import threading
+import time
+import zlib
+
+try:
+    import fcntl
+except ImportError:  # Windows: as gravações dos workers não são serializadas
+    fcntl = None
+
+import cache
+import metricas
+import serializacao
+
+# Caminho do snapshot do cache (vazio desativa)
+SNAPSHOT_PATH = os.environ.get('CEIS_CACHE_SNAPSHOT_PATH', '')
+
+# Intervalo, em segundos, entre as gravações do snapshot por worker (0 grava só ao encerrar)
+SNAPSHOT_INTERVAL = float(os.environ.get('CEIS_CACHE_SNAPSHOT_INTERVAL', 300))
+
+# Número máximo de resultados mantidos no snapshot (os armazenados mais recentemente)
+SNAPSHOT_MAX = int(os.environ.get('CEIS_CACHE_SNAPSHOT_MAX', cache.CACHE_MAXSIZE))
+
+MAGIC = b'CEISSNAP'
+FORMATO = 1
+FLAG_ZLIB = 1
+
+_CABECALHO = struct.Struct('<8sHHId')
+_ENTRADA = struct.Struct('<QQIIdd')
+_HASH = struct.Struct('<Q')
+
+# Intervalo mínimo, em segundos, entre as verificações de um snapshot mais novo no disco
+_VERIFICACAO = 1.0
+
+# Remoções lembradas por um worker entre duas gravações; acima disso, o
+# snapshot anterior deixa de ser usado por ele até a próxima gravação
+MAX_REMOVIDAS = 10000
+
+
+def hash_chave(chave):
+    return _HASH.unpack(hashlib.blake2b(chave, digest_size=8).digest())[0]
+
+
+def gravar(entradas, destino, agora=None):
+    """
+    Grava o snapshot de forma atômica (arquivo temporário + os.replace)
+
+    entradas é uma sequência de (chave, valor, armazenado_em, expira_em);
+    entradas expiradas há mais de STALE_MAX são ignoradas. Retorna o número
+    de entradas gravadas.
+    """
+    agora = time.time() if agora is None else agora
+    registros = []
+    for chave, valor, armazenado_em, expira_em in entradas:
+        if expira_em + cache.STALE_MAX <= agora:
+            continue
+        chave = chave.encode('utf-8')
+        registros.append((hash_chave(chave), chave, zlib.compress(serializacao.dumps(valor)),
+                          armazenado_em, expira_em))
+    registros.sort(key=lambda registro: registro[0])
+
+    posicao = _CABECALHO.size + _ENTRADA.size * len(registros)
+    indice = []
+    for hash_, chave, valor, armazenado_em, expira_em in registros:
+        indice.append(_ENTRADA.pack(hash_, posicao, len(chave), len(valor), armazenado_em, expira_em))
+        posicao += len(chave) + len(valor)
+
+    temporario = f'{destino}.{os.getpid()}.tmp'
+    try:
+        with open(temporario, 'wb') as arquivo:
+            arquivo.write(_CABECALHO.pack(MAGIC, FORMATO, FLAG_ZLIB, len(registros), agora))
+            arquivo.writelines(indice)
+            for _, chave, valor, _, _ in registros:
+                arquivo.write(chave)
+                arquivo.write(valor)
+        os.replace(temporario, destino)
+    except BaseException:
+        try:
+            os.unlink(temporario)
+        except OSError:
+            pass
+        raise
+    return len(registros)
+
+
+class Snapshot:
+    """
+    Leitura sob demanda de um snapshot mapeado em memória
+
+    O arquivo só é aberto na primeira busca e é reaberto quando outro worker
+    grava um snapshot mais novo. Arquivos ausentes, corrompidos ou de outra
+    versão do formato são tratados como vazios.
+    """
+
+    def __init__(self, path=SNAPSHOT_PATH):
+        self.path = path
+        # (mapa, entradas, flags), trocado de uma vez para as buscas que não tomam o lock
+        self._estado = (None, 0, 0)
+        self._identidade = None
+        self._verificado_em = None
+        self._lock = threading.Lock()
+
+    def _abrir(self):
+        agora = time.monotonic()
+        verificado_em = self._verificado_em
+        if verificado_em is not None and agora - verificado_em < _VERIFICACAO:
+            return self._estado
+        with self._lock:
+            try:
+                info = os.stat(self.path)
+            except OSError:
+                self._estado, self._identidade = (None, 0, 0), None
+            else:
+                identidade = (info.st_ino, info.st_mtime_ns, info.st_size)
+                if identidade != self._identidade:
+                    self._estado = self._mapear()
+                    self._identidade = identidade
+            self._verificado_em = agora
+            return self._estado
+
+    def invalidar(self):
+        """
+        Faz a próxima busca verificar o arquivo, sem esperar o intervalo entre verificações
+        """
+        self._verificado_em = None
+
+    def _mapear(self):
+        try:
+            with open(self.path, 'rb') as arquivo:
+                mapa = mmap.mmap(arquivo.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError):
+            return None, 0, 0
+        if len(mapa) < _CABECALHO.size:
+            return None, 0, 0
+        magic, formato, flags, n, _ = _CABECALHO.unpack_from(mapa, 0)
+        if magic != MAGIC or formato != FORMATO or len(mapa) < _CABECALHO.size + _ENTRADA.size * n:
+            return None, 0, 0
+        return mapa, n, flags
+
+    def _ler(self, mapa, flags, posicao, tamanho_chave, tamanho_valor):
+        inicio = posicao + tamanho_chave
+        valor = mapa[inicio:inicio + tamanho_valor]
+        if flags & FLAG_ZLIB:
+            valor = zlib.decompress(valor)
+        return serializacao.loads(valor)
+
+    def buscar(self, chave, agora=None, desatualizado=False):
+        """
+        Retorna (valor, armazenado_em, expira_em) da chave ou None se ausente ou expirada
+
+        Com desatualizado=True, aceita também entradas expiradas há menos de STALE_MAX.
+        """
+        mapa, n, flags = self._abrir()
+        if not n:
+            return None
+        agora = time.time() if agora is None else agora
+        chave = chave.encode('utf-8')
+        alvo = hash_chave(chave)
+        inicio, fim = 0, n
+        while inicio < fim:
+            meio = (inicio + fim) // 2
+            if _HASH.unpack_from(mapa, _CABECALHO.size + meio * _ENTRADA.size)[0] < alvo:
+                inicio = meio + 1
+            else:
+                fim = meio
+        # Chaves com o mesmo hash ficam lado a lado no índice
+        for i in range(inicio, n):
+            hash_, posicao, tamanho_chave, tamanho_valor, armazenado_em, expira_em = \
+                _ENTRADA.unpack_from(mapa, _CABECALHO.size + i * _ENTRADA.size)
+            if hash_ != alvo:
+                break
+            if mapa[posicao:posicao + tamanho_chave] != chave:
+                continue
+            if expira_em + (cache.STALE_MAX if desatualizado else 0) <= agora:
+                return None
+            try:
+                return self._ler(mapa, flags, posicao, tamanho_chave, tamanho_valor), armazenado_em, expira_em
+            except (zlib.error, ValueError):
+                return None
+        return None
+
+    def entradas(self, agora=None):
+        """
+        Percorre as entradas como (chave, valor, armazenado_em, expira_em),
+        inclusive as expiradas há menos de STALE_MAX
+        """
+        mapa, n, flags = self._abrir()
+        agora = time.time() if agora is None else agora
+        for i in range(n):
+            _, posicao, tamanho_chave, tamanho_valor, armazenado_em, expira_em = \
+                _ENTRADA.unpack_from(mapa, _CABECALHO.size + i * _ENTRADA.size)
+            if expira_em + cache.STALE_MAX <= agora:
+                continue
+            try:
+                valor = self._ler(mapa, flags, posicao, tamanho_chave, tamanho_valor)
+            except (zlib.error, ValueError):
+                continue
+            yield mapa[posicao:posicao + tamanho_chave].decode('utf-8'), valor, armazenado_em, expira_em
+
+
+class SnapshotCache:
+    """
+    Envolve o cache do worker, completando as faltas a partir do snapshot
+
+    Resultados encontrados no snapshot são copiados para o cache com o
+    instante original de armazenamento e a mesma validade; get_stale e
+    expiracao também recorrem ao snapshot. O snapshot é regravado a cada
+    intervalo e ao encerrar o worker.
+    """
+
+    def __init__(self, cache_obj, snapshot=None, intervalo=SNAPSHOT_INTERVAL, maximo=SNAPSHOT_MAX):
+        self.cache = cache_obj
+        self.snapshot = snapshot or Snapshot()
+        self.intervalo = intervalo
+        self.maximo = maximo
+        # Chaves removidas neste worker, que não devem voltar do snapshot, com a geração
+        # da remoção; são esquecidas quando uma gravação já as deixou de fora do arquivo
+        self._removidas = {}
+        # Geração do último clear (ou do excesso de remoções): o snapshot anterior não é usado
+        self._descartado = None
+        self._geracao = 0
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def iniciar(self):
+        """
+        Agenda as gravações do snapshot neste processo (recriadas após um fork)
+        """
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            atexit.register(self.salvar, os.getpid())
+            if self.intervalo > 0:
+                threading.Thread(target=self._loop, daemon=True).start()
+
+    def _promover(self, key, desatualizado=False):
+        """
+        Copia a entrada do snapshot para o cache; retorna (valor, armazenado_em, expira_em) ou None
+        """
+        if self._descartado or key in self._removidas:
+            return None
+        encontrado = self.snapshot.buscar(key, desatualizado=desatualizado)
+        if encontrado is None:
+            return None
+        value, stored_at, expires_at = encontrado
+        self.cache.set(key, value, expires_at - stored_at, stored_at=stored_at)
+        metricas.CACHE_SNAPSHOT_HITS.inc()
+        return encontrado
+
+    def get(self, key):
+        self.iniciar()
+        hit = self.cache.get(key)
+        if hit is not None:
+            return hit
+        encontrado = self._promover(key)
+        return None if encontrado is None else encontrado[:2]
+
+    def get_stale(self, key):
+        self.iniciar()
+        hit = self.cache.get_stale(key)
+        if hit is not None:
+            return hit
+        encontrado = self._promover(key, desatualizado=True)
+        return None if encontrado is None else encontrado[:2]
+
+    def expiracao(self, key):
+        self.iniciar()
+        expira_em = self.cache.expiracao(key)
+        if expira_em is not None:
+            return expira_em
+        encontrado = self._promover(key, desatualizado=True)
+        return None if encontrado is None else encontrado[2]
+
+    def set(self, key, value, ttl, stored_at=None):
+        self.iniciar()
+        self._removidas.pop(key, None)
+        self.cache.set(key, value, ttl, stored_at)
+
+    def delete(self, key):
+        with self._lock:
+            self._geracao += 1
+            if len(self._removidas) >= MAX_REMOVIDAS:
+                # Em vez de lembrar cada remoção, deixa de usar o snapshot anterior
+                self._removidas.clear()
+                self._descartado = self._geracao
+            else:
+                self._removidas[key] = self._geracao
+        self.cache.delete(key)
+
+    def clear(self):
+        # O próximo snapshot gravado deixa de incluir o conteúdo do anterior
+        with self._lock:
+            self._geracao += 1
+            self._removidas.clear()
+            self._descartado = self._geracao
+        self.cache.clear()
+
+    def salvar(self, pid=None):
+        """
+        Grava o snapshot com os resultados deste worker e os do snapshot atual
+
+        Leitura, mescla e troca do arquivo ficam sob um bloqueio exclusivo,
+        para que gravações simultâneas de outros workers não se percam.
+        Retorna o número de entradas gravadas, ou None se a gravação falhou.
+        """
+        if pid is not None and pid != os.getpid():
+            # Registro herdado do processo pai por um fork
+            return None
+        try:
+            with open(self.snapshot.path + '.lock', 'a') as trava:
+                if fcntl is not None:
+                    fcntl.flock(trava, fcntl.LOCK_EX)
+                try:
+                    gravadas = self._mesclar_e_gravar()
+                finally:
+                    if fcntl is not None:
+                        fcntl.flock(trava, fcntl.LOCK_UN)
+        except Exception:
+            metricas.CACHE_SNAPSHOT_WRITES.inc(resultado='erro')
+            return None
+        metricas.CACHE_SNAPSHOT_WRITES.inc(resultado='ok')
+        return gravadas
+
+    def _mesclar_e_gravar(self):
+        agora = time.time()
+        # As remoções até esta geração ficam de fora do arquivo (o cache é lido depois delas)
+        with self._lock:
+            geracao = self._geracao
+            removidas = set(self._removidas)
+            descartado = self._descartado
+        entradas = {}
+        # Leitura direta do arquivo, sem o intervalo entre verificações: outro worker pode tê-lo acabado de trocar
+        anteriores = () if descartado else Snapshot(self.snapshot.path).entradas(agora)
+        for chave, valor, armazenado_em, expira_em in anteriores:
+            if chave not in removidas:
+                entradas[chave] = (chave, valor, armazenado_em, expira_em)
+        for entrada in self.cache.itens():
+            atual = entradas.get(entrada[0])
+            if atual is None or atual[2] <= entrada[2]:
+                entradas[entrada[0]] = entrada
+        mantidas = sorted(entradas.values(), key=lambda entrada: entrada[2], reverse=True)[:self.maximo]
+        gravadas = gravar(mantidas, self.snapshot.path, agora)
+
+        # O novo arquivo já não tem as entradas removidas nem as descartadas
+        with self._lock:
+            self._removidas = {chave: g for chave, g in self._removidas.items() if g > geracao}
+            if self._descartado is not None and self._descartado <= geracao:
+                self._descartado = None
+        self.snapshot.invalidar()
+        return gravadas
+
+    def _loop(self):
+        while True:
+            time.sleep(self.intervalo)
+            self.salvar()
+
+
+def aquecido(cache_obj, path=SNAPSHOT_PATH):
+    """
+    Acrescenta o snapshot ao cache configurado, se houver cache e caminho para o snapshot
+    """
+    if cache_obj is None or not path:
+        return cache_obj
+    return SnapshotCache(cache_obj, Snapshot(path))
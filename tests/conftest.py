@@ -0,0 +1,54 @@
+"""
+Configuração comum dos testes
+
+Os módulos leem a configuração do ambiente ao serem importados, então os
+arquivos de estado apontam para um diretório temporário antes de qualquer
+importação, e o servidor falso da Infosimples fica disponível para os testes.
+"""
+import os
+import socket
+import sys
+import tempfile
+
+import pytest
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+sys.path.insert(0, os.path.join(RAIZ, 'benchmarks'))
+
+_ESTADO = tempfile.mkdtemp(prefix='ceis-testes-')
+for variavel, arquivo in (
+    ('CEIS_RESILIENCIA_PATH', 'resiliencia.sqlite3'),
+    ('CEIS_CACHE_PATH', 'cache.sqlite3'),
+    ('CEIS_JOBS_PATH', 'jobs.sqlite3'),
+    ('CEIS_AUDITORIA_PATH', 'auditoria.sqlite3'),
+    ('CEIS_LOCAL_PATH', 'local.sqlite3'),
+    ('CEIS_NOMES_PATH', 'nomes.idx'),
+    ('CEIS_MONITORAMENTO_PATH', 'monitoramento.sqlite3'),
+    ('CEIS_CACHE_SNAPSHOT_PATH', 'cache.snapshot'),
+):
+    os.environ.setdefault(variavel, os.path.join(_ESTADO, arquivo))
+os.environ.setdefault('CEIS_REFRESH_INTERVAL', '0')
+os.environ.setdefault('CEIS_BACKOFF_FACTOR', '0')
+
+import upstream_falso  # noqa: E402
+
+
+def porta_livre():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+@pytest.fixture
+def servidor_falso():
+    """
+    Servidor falso da Infosimples; config pode ser alterada durante o teste
+    """
+    config = upstream_falso.Configuracao()
+    servidor = upstream_falso.iniciar(porta_livre(), config)
+    servidor.config = config
+    servidor.url = f'http://127.0.0.1:{servidor.server_address[1]}/'
+    yield servidor
+    servidor.shutdown()
+    servidor.server_close()
@@ -0,0 +1,53 @@
+import threading
+
+import pytest
+
+pytest.importorskip('starlette')
+pytest.importorskip('httpx')
+
+from starlette.testclient import TestClient  # noqa: E402
+
+import asgi  # noqa: E402
+import cadastros  # noqa: E402
+import consulta  # noqa: E402
+
+
+@pytest.fixture
+def cliente(servidor_falso, monkeypatch):
+    monkeypatch.setitem(cadastros.URLS, 'ceis', servidor_falso.url)
+    consulta.result_cache.clear()
+    with TestClient(asgi.app) as cliente:
+        yield cliente
+
+
+def test_trechos_com_sqlite_rodam_fora_do_event_loop(cliente, monkeypatch):
+    threads = {}
+
+    def espiar(nome, funcao):
+        def espia(*args, **kwargs):
+            threads.setdefault(nome, set()).add(threading.get_ident())
+            return funcao(*args, **kwargs)
+        return espia
+
+    async def consultar_api(*args, **kwargs):
+        # Executada no event loop
+        threads['loop'] = threading.get_ident()
+        return await consultar_api_original(*args, **kwargs)
+
+    consultar_api_original = asgi._consultar_api
+    monkeypatch.setattr(asgi, '_consultar_api', consultar_api)
+    for nome in ('verificar_disponibilidade', 'liberar_token', 'registrar', 'buscar_cache', 'processar_resposta'):
+        monkeypatch.setattr(consulta, nome, espiar(nome, getattr(consulta, nome)))
+    disjuntor = consulta.disjuntor('ceis')
+    monkeypatch.setattr(disjuntor, 'registrar', espiar('disjuntor', disjuntor.registrar))
+
+    response = cliente.post('/api/consulta-ceis', data={"token": "t", "cnpj": "11.222.333/0001-81"})
+    assert response.status_code == 200
+    assert response.headers['X-Cache'] == 'MISS'
+    loop = threads.pop('loop')
+    assert {'verificar_disponibilidade', 'registrar', 'buscar_cache', 'processar_resposta', 'disjuntor'} <= set(threads)
+    for nome, usadas in threads.items():
+        assert loop not in usadas, nome
+
+    response = cliente.post('/api/consulta-ceis', data={"token": "t", "cnpj": "11222333000181"})
+    assert response.headers['X-Cache'] == 'HIT'
@@ -0,0 +1,143 @@
+import threading
+import time
+
+import pytest
+
+import atualizacao
+import cache
+import cadastros
+import consulta
+import resiliencia
+import tokens
+
+DOCUMENTO = '11222333000181'
+
+
+@pytest.fixture
+def api(servidor_falso, monkeypatch):
+    monkeypatch.setitem(cadastros.URLS, 'ceis', servidor_falso.url)
+    consulta.result_cache.clear()
+    enviados = []
+    post = consulta.upstream.post
+
+    def registrar_token(params, url=None, timeout=None):
+        enviados.append(params['token'])
+        return post(params, url=url, timeout=timeout)
+
+    monkeypatch.setattr(consulta.upstream, 'post', registrar_token)
+    servidor_falso.enviados = enviados
+    return servidor_falso
+
+
+@pytest.fixture
+def pool_servidor(tmp_path, monkeypatch):
+    pool = tokens.TokenPool([{"nome": "servidor", "token": "token-servidor", "cota": 1000}],
+                            resiliencia.SharedState(str(tmp_path)), intervalo=0)
+    monkeypatch.setattr(consulta, 'pool', pool)
+    return pool
+
+
+def expirado(segundos=20):
+    # Resultado obtido há 'segundos' segundos, que expirou na metade desse tempo
+    chave = cache.chave_cache(DOCUMENTO)
+    consulta.result_cache.set(chave, {"code": 200, "data_count": 0, "data": []}, segundos / 2,
+                              stored_at=time.time() - segundos)
+    return chave
+
+
+def aguardar(condicao, limite=5):
+    fim = time.time() + limite
+    while not condicao() and time.time() < fim:
+        time.sleep(0.01)
+    return condicao()
+
+
+def test_desativado_por_padrao():
+    assert atualizacao.SWR_WINDOW == 0
+    assert atualizacao.REFRESH_TOP == 0
+
+
+def test_expirado_e_servido_e_atualizado_com_token_do_servidor(api, pool_servidor, monkeypatch):
+    monkeypatch.setattr(atualizacao, 'SWR_WINDOW', 3600)
+    chave = expirado()
+    _, status, cache_status, idade = consulta.consultar('token-da-consulta', cnpj=DOCUMENTO)
+    assert (status, cache_status) == (200, 'STALE') and idade >= 20
+
+    assert aguardar(lambda: consulta.result_cache.get(chave) is not None)
+    assert api.enviados == ['token-servidor']
+    _, _, cache_status, idade = consulta.consultar('token-da-consulta', cnpj=DOCUMENTO)
+    assert cache_status == 'HIT' and idade < 5
+
+
+def test_sem_pool_nao_serve_expirado_nem_atualiza(api, monkeypatch):
+    monkeypatch.setattr(atualizacao, 'SWR_WINDOW', 3600)
+    assert not consulta.pool
+    chave = expirado()
+    _, status, cache_status, _ = consulta.consultar('token-da-consulta', cnpj=DOCUMENTO)
+    # A consulta vai à API com o próprio token, em primeiro plano
+    assert (status, cache_status) == (200, 'MISS')
+    assert api.enviados == ['token-da-consulta']
+    # Sem tokens no servidor, a atualização não chama a API
+    assert consulta.atualizar(DOCUMENTO, None, chave, antecedencia=7200) is None
+    assert api.enviados == ['token-da-consulta']
+
+
+def test_expirado_alem_da_janela_vai_a_api(api, pool_servidor, monkeypatch):
+    monkeypatch.setattr(atualizacao, 'SWR_WINDOW', 5)
+    expirado(20)
+    _, _, cache_status, _ = consulta.consultar('token-da-consulta', cnpj=DOCUMENTO)
+    assert cache_status == 'MISS'
+
+
+def test_atualizar_ignora_documento_que_ainda_nao_vai_expirar(api, pool_servidor):
+    chave = cache.chave_cache(DOCUMENTO)
+    consulta.result_cache.set(chave, {"code": 200, "data_count": 0, "data": []}, 3600)
+    assert consulta.atualizar(DOCUMENTO, None, chave, antecedencia=900) is None
+    assert api.enviados == []
+    consulta.atualizar(DOCUMENTO, None, chave, antecedencia=7200)
+    assert api.enviados == ['token-servidor']
+
+
+def test_registro_nao_guarda_o_token():
+    atualizador = atualizacao.Atualizador(lambda *args: None, top=2, intervalo=0)
+    atualizador.registrar('cnpj:1', cnpj='1')
+    assert atualizador._documentos == {'cnpj:1': ('1', None, 'ceis')}
+
+
+def test_seleciona_os_mais_consultados():
+    atualizador = atualizacao.Atualizador(lambda *args: None, top=2, intervalo=0)
+    for chave, vezes in (('cnpj:1', 1), ('cnpj:2', 5), ('cnpj:3', 3)):
+        for _ in range(vezes):
+            atualizador.registrar(chave, cnpj=chave[5:])
+    assert atualizador.mais_consultados() == ['cnpj:2', 'cnpj:3']
+
+
+def test_agendar_nao_duplica_atualizacao_em_andamento():
+    liberar = threading.Event()
+    chamadas = []
+
+    def atualizar(*args):
+        chamadas.append(args)
+        liberar.wait(5)
+
+    atualizador = atualizacao.Atualizador(atualizar, workers=2, top=2, intervalo=0)
+    atualizador.registrar('cnpj:1', cnpj='1')
+    assert not atualizador.agendar('cnpj:2')
+    assert atualizador.agendar('cnpj:1', antecedencia=60)
+    assert not atualizador.agendar('cnpj:1')
+    liberar.set()
+    assert aguardar(lambda: not atualizador._pendentes)
+    assert chamadas == [('1', None, 'cnpj:1', 60, 'ceis')]
+    assert atualizador.agendar('cnpj:1')
+
+
+def test_ciclo_atualiza_apenas_os_mais_consultados():
+    chamadas = []
+    atualizador = atualizacao.Atualizador(lambda *args: chamadas.append(args), top=1,
+                                          intervalo=0.05, antecedencia=900)
+    for _ in range(3):
+        atualizador.registrar('cnpj:2', cnpj='2')
+    atualizador.registrar('cnpj:1', cnpj='1')
+    assert aguardar(lambda: chamadas)
+    assert chamadas[0] == ('2', None, 'cnpj:2', 900, 'ceis')
+    assert all(chamada[2] == 'cnpj:2' for chamada in chamadas)
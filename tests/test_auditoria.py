@@ -0,0 +1,79 @@
+import sqlite3
+import time
+
+import pytest
+
+import auditoria
+import cadastros
+import consulta
+
+SEM_SANCAO = {"code": 200, "data_count": 0, "data": []}
+SANCIONADO = {"code": 200, "data_count": 1, "data": [{"sancao": {"codigo": "1"}}]}
+
+
+@pytest.fixture
+def store(tmp_path):
+    return auditoria.AuditStore(str(tmp_path / 'auditoria.sqlite3'))
+
+
+def test_desativada_por_padrao(servidor_falso, monkeypatch):
+    assert auditoria.AUDITORIA is False
+    monkeypatch.setitem(cadastros.URLS, 'ceis', servidor_falso.url)
+    consulta.result_cache.clear()
+    registros = []
+    monkeypatch.setattr(auditoria.writer, 'registrar', lambda *args: registros.append(args))
+    consulta.consultar('t', cnpj='11222333000181')
+    assert registros == []
+
+    monkeypatch.setattr(auditoria, 'AUDITORIA', True)
+    consulta.consultar('t', cnpj='11222333000181')
+    assert [(documento, cache_status) for documento, _, _, cache_status, _ in registros] == \
+        [('cnpj:11222333000181', 'HIT')]
+
+
+@pytest.mark.parametrize('comando', [
+    "UPDATE consultas SET situacao = 'sem_sancao'",
+    "DELETE FROM consultas",
+    "UPDATE resultados SET valor = '{}'",
+    "DELETE FROM resultados",
+])
+def test_historico_nao_pode_ser_alterado(store, comando):
+    store.gravar([('cnpj:1', time.time(), 0, 'MISS', SANCIONADO, 200)])
+    conn = store._connect()
+    with pytest.raises(sqlite3.IntegrityError, match='não pode ser alterado'):
+        conn.execute(comando)
+    # Nem por outra conexão ao mesmo arquivo
+    with pytest.raises(sqlite3.IntegrityError):
+        sqlite3.connect(store.path).execute(comando)
+    assert store.historico('cnpj:1', incluir_resultado=True)["consultas"][0]["resultado"] == SANCIONADO
+
+
+def test_resultados_repetidos_sao_guardados_uma_vez(store):
+    agora = time.time()
+    store.gravar([('cnpj:1', agora + i, 0, 'MISS', SEM_SANCAO, 200) for i in range(3)])
+    conn = store._connect()
+    assert conn.execute("SELECT COUNT(*) FROM consultas").fetchone()[0] == 3
+    assert conn.execute("SELECT COUNT(*) FROM resultados").fetchone()[0] == 1
+
+
+def test_transicoes_ignoram_erros(store):
+    agora = time.time()
+    store.gravar([
+        ('cnpj:1', agora, 5, 'MISS', SEM_SANCAO, 200),
+        ('cnpj:1', agora + 1, 0, 'MISS', {"code": 500}, 500),
+        ('cnpj:1', agora + 2, 0, 'MISS', SANCIONADO, 200),
+        ('cnpj:1', agora + 3, 0, 'HIT', SANCIONADO, 200),
+    ])
+    historico = store.historico('cnpj:1', limit=2)
+    assert historico["total"] == 4
+    assert [c["fonte"] for c in historico["consultas"]] == ['cache', 'api']
+    assert [(t["de"], t["para"]) for t in historico["transicoes"]] == [('sem_sancao', 'sancionado')]
+    assert store.historico('cnpj:1', ate=agora)["consultas"][0]["obtido_em"] == agora - 5
+
+
+def test_fila_cheia_descarta_sem_bloquear(store):
+    writer = auditoria.AuditWriter(store, batch_size=10, intervalo=3600, max_pendentes=2)
+    for _ in range(3):
+        writer.registrar('cnpj:1', SEM_SANCAO, 200, 'MISS', 0)
+    writer.esvaziar()
+    assert store.historico('cnpj:1')["total"] == 2
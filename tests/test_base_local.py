@@ -0,0 +1,108 @@
+import os
+
+import base_local
+
+CABECALHO = ["CPF OU CNPJ DO SANCIONADO", "TIPO DE PESSOA", "NOME DO SANCIONADO", "CÓDIGO DA SANÇÃO",
+             "CATEGORIA DA SANÇÃO", "DATA INÍCIO SANÇÃO", "DATA FINAL SANÇÃO", "ÓRGÃO SANCIONADOR"]
+
+
+def escrever_csv(caminho, linhas):
+    with open(caminho, 'w', encoding='latin-1', newline='') as f:
+        f.write(';'.join(CABECALHO) + '\r\n')
+        for linha in linhas:
+            f.write(';'.join(linha) + '\r\n')
+    return str(caminho)
+
+
+def sancao(documento, codigo, nome='EMPRESA', fim='01/01/2030'):
+    return [documento, 'J', nome, codigo, 'Impedimento', '01/01/2020', fim, 'CGU']
+
+
+def test_importacao_incremental_registra_apenas_as_diferencas(tmp_path):
+    destino = str(tmp_path / 'local.sqlite3')
+    v1 = escrever_csv(tmp_path / 'v1.csv', [
+        sancao('11.222.333/0001-81', 'A1'),
+        sancao('11.444.777/0001-61', 'B1'),
+        sancao('***.982.247-**', 'C1'),
+    ])
+    resumo = base_local.importar(v1, destino)
+    # Documentos mascarados não podem ser consultados e são ignorados
+    assert resumo == {"versao": 1, "inseridas": 2, "alteradas": 0, "removidas": 0, "total": 2}
+    assert base_local.listar_alteracoes(0, destino) == []
+
+    v2 = escrever_csv(tmp_path / 'v2.csv', [
+        sancao('11.222.333/0001-81', 'A1', fim='01/01/2031'),
+        sancao('12.ABC.345/01DE-35', 'D1'),
+    ])
+    resumo = base_local.importar(v2, destino)
+    assert resumo == {"versao": 2, "inseridas": 1, "alteradas": 1, "removidas": 1, "total": 2}
+    alteracoes = {(a["documento"], a["operacao"]) for a in base_local.listar_alteracoes(1, destino)}
+    assert alteracoes == {('11222333000181', 'alterada'), ('11444777000161', 'removida'), ('12ABC34501DE35', 'inserida')}
+
+    # Reimportar o mesmo arquivo não gera alterações
+    assert base_local.importar(v2, destino)["versao"] == 3
+    assert base_local.listar_alteracoes(2, destino) == []
+
+
+def test_indice_em_memoria_aplica_so_os_documentos_alterados(tmp_path, monkeypatch):
+    destino = str(tmp_path / 'local.sqlite3')
+    base_local.importar(escrever_csv(tmp_path / 'v1.csv', [
+        sancao('11.222.333/0001-81', 'A1'),
+        sancao('11.444.777/0001-61', 'B1'),
+    ]), destino)
+    base = base_local.BaseLocal(destino)
+    registros, _ = base.consultar('11444777000161')
+    intocado = base.consultar('11222333000181')[0]
+    assert [r["sancao"]["codigo"] for r in registros] == ['B1']
+
+    base_local.importar(escrever_csv(tmp_path / 'v2.csv', [
+        sancao('11.222.333/0001-81', 'A1'),
+        sancao('11.444.777/0001-61', 'B2'),
+    ]), destino)
+    os.utime(destino, (1, 1))
+
+    relidos = []
+    aplicar = base._aplicar_alteracoes
+    monkeypatch.setattr(base, '_aplicar_alteracoes', lambda *args: relidos.append(args[2]) or aplicar(*args))
+    registros, _ = base.consultar('11444777000161')
+    assert relidos == [1]
+    assert sorted(r["sancao"]["codigo"] for r in registros) == ['B2']
+    # Documentos sem alteração mantêm os mesmos objetos da versão anterior
+    assert base.consultar('11222333000181')[0] is intocado
+
+
+def test_reconstrucao_completa_recarrega_o_indice(tmp_path):
+    destino = str(tmp_path / 'local.sqlite3')
+    base_local.importar(escrever_csv(tmp_path / 'v1.csv', [sancao('11.222.333/0001-81', 'A1')]), destino)
+    base = base_local.BaseLocal(destino)
+    assert base.consultar('11222333000181')[0]
+
+    resumo = base_local.importar(escrever_csv(tmp_path / 'v2.csv', [sancao('11.444.777/0001-61', 'B1')]),
+                                 destino, completo=True)
+    os.utime(destino, (2, 2))
+    assert resumo["versao"] == 2
+    assert base.consultar('11222333000181')[0] == []
+    assert base.consultar('11444777000161')[0]
+
+
+def test_reordenar_o_arquivo_nao_gera_alteracoes(tmp_path):
+    destino = str(tmp_path / 'local.sqlite3')
+    linhas = [
+        # Sem código: identificadas pelos campos estáveis
+        sancao('11.222.333/0001-81', '', fim='01/01/2030'),
+        ['11.222.333/0001-81', 'J', 'EMPRESA', '', 'Suspensão', '01/06/2021', '01/01/2025', 'CGU'],
+        # Código repetido com conteúdos diferentes, e uma linha duplicada
+        sancao('11.444.777/0001-61', 'R1', nome='FILIAL'),
+        sancao('11.444.777/0001-61', 'R1', nome='MATRIZ'),
+        sancao('11.444.777/0001-61', 'R1', nome='MATRIZ'),
+    ]
+    base_local.importar(escrever_csv(tmp_path / 'v1.csv', linhas), destino)
+    resumo = base_local.importar(escrever_csv(tmp_path / 'v2.csv', linhas[::-1]), destino)
+    assert (resumo["inseridas"], resumo["alteradas"], resumo["removidas"]) == (0, 0, 0)
+    assert base_local.listar_alteracoes(1, destino) == []
+
+    # Prorrogar uma sanção sem código é uma alteração da mesma sanção
+    linhas[0] = sancao('11.222.333/0001-81', '', fim='01/01/2035')
+    resumo = base_local.importar(escrever_csv(tmp_path / 'v3.csv', linhas[1:] + linhas[:1]), destino)
+    assert (resumo["inseridas"], resumo["alteradas"], resumo["removidas"]) == (0, 1, 0)
+    assert [a["operacao"] for a in base_local.listar_alteracoes(2, destino)] == ['alterada']
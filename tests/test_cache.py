@@ -0,0 +1,95 @@
+import time
+
+import pytest
+
+import cache
+import cadastros
+import consulta
+
+
+def chamadas(servidor):
+    return servidor.estatisticas.exportar()["chamadas"]
+
+
+@pytest.fixture
+def api(servidor_falso, monkeypatch):
+    monkeypatch.setitem(cadastros.URLS, 'ceis', servidor_falso.url)
+    consulta.result_cache.clear()
+    return servidor_falso
+
+
+def test_chave_ignora_a_formatacao_do_documento():
+    assert cache.chave_cache('11.222.333/0001-81') == cache.chave_cache('11222333000181') == 'cnpj:11222333000181'
+    assert cache.chave_cache('12.abc.345/01de-35') == 'cnpj:12ABC34501DE35'
+    assert cache.chave_cache(cpf='529.982.247-25', cadastro='cnep') == 'cnep/cpf:52998224725'
+
+
+def test_segunda_consulta_vem_do_cache_com_a_idade(api):
+    payload, status, cache_status, idade = consulta.consultar('t', cnpj='11.222.333/0001-81')
+    assert (status, cache_status, idade) == (200, 'MISS', 0)
+    time.sleep(0.05)
+    novo, status, cache_status, idade = consulta.consultar('t', cnpj='11222333000181')
+    assert (status, cache_status) == (200, 'HIT') and novo == payload
+    assert 0.05 <= idade < 5
+    assert chamadas(api) == 1
+
+
+@pytest.mark.parametrize('sancionados, ttl', [(1.0, cache.TTL_POSITIVE), (0.0, cache.TTL_NEGATIVE)])
+def test_validade_depende_de_haver_sancao(api, sancionados, ttl):
+    api.config.sancionados = sancionados
+    antes = time.time()
+    payload, _, _, _ = consulta.consultar('t', cnpj='11.444.777/0001-61')
+    assert (payload["data_count"] > 0) == (sancionados == 1.0)
+    expira_em = consulta.result_cache.expiracao(cache.chave_cache('11444777000161'))
+    assert antes + ttl <= expira_em <= time.time() + ttl
+
+
+def test_erros_da_api_nao_entram_no_cache(api):
+    api.config.erros = 1.0
+    _, status, _, _ = consulta.consultar('t', cnpj='11.222.333/0001-81')
+    assert status == 500
+    assert consulta.result_cache.get_stale(cache.chave_cache('11222333000181')) is None
+
+
+def test_memoria_expira_e_respeita_o_limite_de_desatualizados(monkeypatch):
+    memoria = cache.MemoryCache(maxsize=2)
+    agora = time.time()
+    memoria.set('valido', {"v": 1}, 60)
+    memoria.set('expirado', {"v": 2}, 10, stored_at=agora - 20)
+    assert memoria.get('valido')[0] == {"v": 1}
+    assert memoria.get('expirado') is None
+    assert memoria.get_stale('expirado') == ({"v": 2}, agora - 20)
+    assert memoria.expiracao('expirado') == agora - 10
+
+    monkeypatch.setattr(cache, 'STALE_MAX', 5)
+    assert memoria.get_stale('expirado') is None
+    # Além do limite, a entrada é descartada na próxima leitura
+    assert memoria.get('expirado') is None
+    assert memoria.expiracao('expirado') is None
+
+
+def test_memoria_descarta_o_menos_usado():
+    memoria = cache.MemoryCache(maxsize=2)
+    memoria.set('a', 1, 60)
+    memoria.set('b', 2, 60)
+    memoria.get('a')
+    memoria.set('c', 3, 60)
+    assert memoria.get('b') is None
+    assert memoria.get('a')[0] == 1 and memoria.get('c')[0] == 3
+
+
+def test_sqlite_compartilhado_mantem_idade_e_limite(tmp_path, monkeypatch):
+    caminho = str(tmp_path / 'cache.sqlite3')
+    agora = time.time()
+    compartilhado = cache.SQLiteCache(caminho)
+    compartilhado.set('cnpj:1', {"code": 200, "data_count": 0}, 60, stored_at=agora - 30)
+    compartilhado.set('cnpj:2', {"code": 200, "data_count": 0}, 10, stored_at=agora - 20)
+
+    # Outro worker: a memória local é preenchida com o instante original
+    outro = cache.TieredCache(cache.MemoryCache(), cache.SQLiteCache(caminho))
+    assert outro.get('cnpj:1') == ({"code": 200, "data_count": 0}, agora - 30)
+    assert outro.local.get('cnpj:1')[1] == agora - 30
+    assert outro.get('cnpj:2') is None
+    assert outro.get_stale('cnpj:2')[1] == agora - 20
+    monkeypatch.setattr(cache, 'STALE_MAX', 5)
+    assert outro.get_stale('cnpj:2') is None
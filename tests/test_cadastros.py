@@ -0,0 +1,85 @@
+import time
+
+import pytest
+
+import atualizacao
+import cache
+import cadastros
+import consulta
+import upstream
+import upstream_falso
+
+
+@pytest.fixture
+def servidor_lento():
+    config = upstream_falso.Configuracao(latencia=2000)
+    servidor = upstream_falso.iniciar(0, config)
+    yield f'http://127.0.0.1:{servidor.server_address[1]}/'
+    servidor.shutdown()
+    servidor.server_close()
+
+
+@pytest.fixture
+def chamadas_http(monkeypatch):
+    """
+    Registra o timeout de leitura e a duração de cada chamada à API
+    """
+    registros = []
+    post = upstream.post
+
+    def espiar(params, url=None, timeout=None):
+        inicio = time.monotonic()
+        try:
+            return post(params, url=url, timeout=timeout)
+        finally:
+            registros.append((url, timeout, time.monotonic() - inicio))
+
+    monkeypatch.setattr(upstream, 'post', espiar)
+    return registros
+
+
+def test_prazo_do_cadastro_vale_para_a_chamada_http(monkeypatch, servidor_falso, servidor_lento, chamadas_http):
+    monkeypatch.setitem(cadastros.URLS, 'ceis', servidor_falso.url)
+    monkeypatch.setitem(cadastros.URLS, 'cnep', servidor_lento)
+    monkeypatch.setitem(cadastros.TIMEOUTS, 'cnep', 0.3)
+
+    inicio = time.monotonic()
+    payload, status, _, _ = consulta.consultar_cadastros('t', cnpj='11.222.333/0001-81', nomes=['ceis', 'cnep'])
+    assert time.monotonic() - inicio < 1.5
+    assert status == 200 and payload["parcial"]
+    assert not payload["cadastros"]["ceis"]["parcial"]
+    assert payload["cadastros"]["cnep"]["parcial"] and payload["cadastros"]["cnep"]["data_count"] is None
+
+    # A chamada lenta é encerrada pelo timeout de leitura, sem esperar os 2 s do servidor
+    for _ in range(20):
+        if len(chamadas_http) == 2:
+            break
+        time.sleep(0.1)
+    lenta = [registro for registro in chamadas_http if registro[0] == servidor_lento]
+    assert lenta and lenta[0][1] == 0.3 and lenta[0][2] < 1.5
+
+
+def test_falha_com_resultado_anterior_e_parcial(monkeypatch, servidor_falso):
+    monkeypatch.setitem(cadastros.URLS, 'cnep', servidor_falso.url)
+    monkeypatch.setattr(atualizacao, 'SWR_WINDOW', 0)
+    anterior = {"code": 200, "code_message": "ok", "data_count": 1, "data": [{"sancao": {"codigo": "antiga"}}], "errors": []}
+    chave = cache.chave_cache('11.444.777/0001-61', None, 'cnep')
+    consulta.result_cache.set(chave, anterior, 1, stored_at=time.time() - 60)
+    servidor_falso.config.erros = 1.0
+
+    payload, status, cache_status, _ = consulta.consultar_cadastros('t', cnpj='11.444.777/0001-61', nomes=['cnep'])
+    assert status == 200 and cache_status == 'STALE'
+    assert payload["parcial"]
+    assert payload["code_message"].startswith("Resultado parcial")
+    assert payload["cadastros"]["cnep"]["cache"] == 'STALE' and payload["cadastros"]["cnep"]["parcial"]
+    assert payload["data"] == [{"sancao": {"codigo": "antiga"}, "fonte": "cnep"}]
+
+
+def test_combinar_sem_falhas_nao_e_parcial():
+    resultado = {"code": 200, "code_message": "ok", "data_count": 0, "data": [], "errors": []}
+    payload, status, cache_status, _ = cadastros.combinar({
+        'ceis': (resultado, 200, 'HIT', 10),
+        'cnep': (resultado, 200, 'MISS', 0)
+    })
+    assert status == 200 and not payload["parcial"]
+    assert not any(item["parcial"] for item in payload["cadastros"].values())
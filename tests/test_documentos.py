@@ -0,0 +1,82 @@
+import random
+
+import pytest
+
+import documentos
+
+
+def dv_cnpj_referencia(base):
+    # Cálculo da Receita Federal, caractere a caractere (valor = código ASCII - 48)
+    valores = [ord(c) - 48 for c in base]
+    for pesos in (documentos.PESOS_CNPJ_1, documentos.PESOS_CNPJ_2):
+        resto = sum(v * p for v, p in zip(valores, pesos)) % 11
+        valores.append(0 if resto < 2 else 11 - resto)
+    return ''.join(str(v) for v in valores[12:])
+
+
+@pytest.mark.parametrize('valor', [
+    '11.222.333/0001-81', '11222333000181',
+    '12.ABC.345/01DE-35', '12abc34501de35', ' 12.ABC.345/01DE-35 ',
+])
+def test_cnpj_valido(valor):
+    assert documentos.classificar(valor)[0] == 'cnpj'
+
+
+@pytest.mark.parametrize('valor', [
+    '11.222.333/0001-82',        # dígito verificador errado
+    '12.ABC.345/01DE-36',
+    '12.ABC.345/01DE-3A',        # letra na posição do dígito verificador
+    '00000000000000', 'AAAAAAAAAAAAAA',
+    '12.ABC.345/01DÉ-35',        # letras fora de A-Z
+    '1122233300018',
+])
+def test_cnpj_invalido(valor):
+    assert documentos.classificar(valor)[0] is None
+
+
+@pytest.mark.parametrize('valor, tipo', [
+    ('529.982.247-25', 'cpf'), ('52998224725', 'cpf'),
+    ('529.982.247-24', None), ('111.111.111-11', None), ('5299822472A', None),
+])
+def test_cpf(valor, tipo):
+    assert documentos.classificar(valor)[0] == tipo
+
+
+def test_digitos_conferem_com_o_calculo_de_referencia():
+    aleatorio = random.Random(14)
+    alfabeto = '0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZ'
+    for _ in range(2000):
+        base = ''.join(aleatorio.choice(alfabeto) for _ in range(12))
+        esperado = dv_cnpj_referencia(base)
+        assert documentos.gerar_cnpj(base) == base + esperado
+        if base != base[0] * 12:
+            assert documentos.cnpj_valido(base + esperado)
+        errado = f"{(int(esperado) + 1) % 100:02d}"
+        assert not documentos.cnpj_valido(base + errado)
+
+
+def test_gerar_cpf():
+    assert documentos.gerar_cpf('529982247') == '52998224725'
+    assert documentos.cpf_valido(documentos.gerar_cpf('123456789'))
+
+
+def test_normalizacao_mantem_a_mesma_chave():
+    assert documentos.normalizar('11.222.333/0001-81') == documentos.normalizar('11222333000181')
+    assert documentos.normalizar('12.abc.345/01de-35') == '12ABC34501DE35'
+    assert documentos.normalizar(None) == ''
+
+
+def test_classificar_lista_igual_a_classificar():
+    valores = ['11.222.333/0001-81', '12abc34501de35', '529.982.247-25', '529.982.247-24', 'abc', '', '1' * 14]
+    assert documentos.classificar_lista(valores) == [documentos.classificar(v) for v in valores]
+
+
+def test_validar_retorna_erro_no_formato_dos_endpoints():
+    assert documentos.validar(cnpj='11.222.333/0001-81', cpf='529.982.247-25') is None
+    erro, status = documentos.validar(cnpj='11.222.333/0001-82', cpf='529.982.247-24')
+    assert status == 400
+    assert erro == {
+        "code": 400,
+        "code_message": "Parâmetro inválido",
+        "errors": ["CNPJ inválido: 11.222.333/0001-82", "CPF inválido: 529.982.247-24"]
+    }
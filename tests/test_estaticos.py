@@ -0,0 +1,59 @@
+import gzip
+import os
+
+import pytest
+
+import estaticos
+
+
+@pytest.fixture
+def cliente():
+    import app as aplicacao
+    return aplicacao.app.test_client()
+
+
+def test_pagina_com_etag_e_revalidacao(cliente):
+    resposta = cliente.get('/', headers={'Accept-Encoding': 'identity'})
+    assert resposta.status_code == 200
+    assert resposta.mimetype == 'text/html'
+    assert 'Content-Encoding' not in resposta.headers
+    etag = resposta.headers['ETag']
+    with open(os.path.join(estaticos.STATIC_FOLDER, 'index.html'), 'rb') as f:
+        assert resposta.data == f.read()
+
+    revalidacao = cliente.get('/', headers={'Accept-Encoding': 'identity', 'If-None-Match': etag})
+    assert revalidacao.status_code == 304
+    assert revalidacao.data == b''
+    assert revalidacao.headers['ETag'] == etag
+    # Comparação fraca
+    assert cliente.get('/', headers={'If-None-Match': f'W/{etag}'}).status_code == 304
+    assert cliente.get('/', headers={'If-None-Match': '"outro"'}).status_code == 200
+
+
+def test_pagina_comprimida_conforme_accept_encoding(cliente):
+    original = cliente.get('/', headers={'Accept-Encoding': 'identity'})
+    resposta = cliente.get('/', headers={'Accept-Encoding': 'gzip;q=1, br;q=0'})
+    assert resposta.headers['Content-Encoding'] == 'gzip'
+    assert resposta.headers['Vary'] == 'Accept-Encoding'
+    assert resposta.headers['ETag'] != original.headers['ETag']
+    assert int(resposta.headers['Content-Length']) == len(resposta.data) < len(original.data)
+    assert gzip.decompress(resposta.data) == original.data
+
+    revalidacao = cliente.get('/', headers={'Accept-Encoding': 'gzip;q=1, br;q=0',
+                                            'If-None-Match': resposta.headers['ETag']})
+    assert revalidacao.status_code == 304
+
+
+def test_prioridades_do_accept_encoding():
+    assert estaticos.aceitas('gzip;q=0.5, br , *;q=0') == {'gzip': 0.5, 'br': 1.0, '*': 0.0}
+    assert estaticos.INDEX.escolher('deflate') == 'identity'
+    assert estaticos.INDEX.escolher('gzip;q=0, identity;q=0.1') == 'identity'
+
+
+def test_pasta_instalada_quando_nao_ha_static_ao_lado_do_modulo(tmp_path, monkeypatch):
+    pasta = tmp_path / 'share' / 'consulta-ceis' / 'static'
+    pasta.mkdir(parents=True)
+    (pasta / 'index.html').write_text('<html></html>')
+    monkeypatch.setattr(estaticos, '__file__', str(tmp_path / 'site-packages' / 'estaticos.py'))
+    monkeypatch.setattr(estaticos.sys, 'prefix', str(tmp_path))
+    assert estaticos._pasta_static() == str(pasta)
@@ -0,0 +1,179 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+import cadastros
+import consulta
+import hedging
+import metricas
+import resiliencia
+import tokens
+
+
+def aquecido(percentil=50, orcamento=1.0, minimo=0.05, workers=4, latencia=0.01):
+    # Hedger já com amostras suficientes para calcular o limiar
+    hedger = hedging.Hedger(percentil=percentil, orcamento=orcamento, minimo=minimo, workers=workers)
+    for _ in range(hedging.MIN_AMOSTRAS):
+        hedger.registrar(latencia)
+    return hedger
+
+
+def lenta(resultado, segundos):
+    def tentativa():
+        time.sleep(segundos)
+        return resultado
+    return tentativa
+
+
+def test_limiar_pelo_percentil_com_minimo():
+    hedger = hedging.Hedger(percentil=90, orcamento=0.05, minimo=0)
+    for i in range(1, hedging.MIN_AMOSTRAS):
+        hedger.registrar(i / 100)
+    # Poucas amostras: ainda sem reservas
+    assert hedger.limiar() is None
+    hedger.registrar(0.20)
+    assert hedger.limiar() == pytest.approx(0.19)
+
+    # O limiar só é recalculado a cada RECALCULO novas latências
+    for _ in range(hedging.RECALCULO - 1):
+        hedger.registrar(5.0)
+    assert hedger.limiar() == pytest.approx(0.19)
+    hedger.registrar(5.0)
+    assert hedger.limiar() == 5.0
+
+    assert aquecido(minimo=0.5).limiar() == 0.5
+
+
+def test_desativado_sem_percentil_ou_orcamento():
+    for hedger in (hedging.Hedger(percentil=0, orcamento=0.05), hedging.Hedger(percentil=95, orcamento=0)):
+        hedger.registrar(1.0)
+        assert not hedger and hedger.limiar() is None
+        assert hedger.executar(lambda: 'primaria', None, None, None) == 'primaria'
+
+
+def test_credito_acumula_pelo_orcamento_e_limita_a_rajada():
+    hedger = hedging.Hedger(percentil=95, orcamento=0.25)
+    for _ in range(3):
+        hedger._creditar()
+    assert not hedger._consumir()
+    hedger._creditar()
+    assert hedger._consumir()
+    assert not hedger._consumir()
+
+    hedger = hedging.Hedger(percentil=95, orcamento=1)
+    for _ in range(int(hedging.RAJADA) * 3):
+        hedger._creditar()
+    assert hedger._credito == hedging.RAJADA
+    assert sum(hedger._consumir() for _ in range(int(hedging.RAJADA) * 2)) == hedging.RAJADA
+
+
+def test_primaria_rapida_nao_envia_reserva():
+    hedger = aquecido()
+    preparadas = []
+    resultado = hedger.executar(lambda: 'primaria', lambda: preparadas.append(1), bool, None)
+    assert resultado == 'primaria' and preparadas == []
+
+
+def test_reserva_vence_e_a_primaria_e_descartada():
+    hedger = aquecido()
+    perdedores = []
+    descartada = threading.Event()
+    vitorias = metricas.HEDGES_WON.valor()
+
+    def ao_perder(resultado):
+        perdedores.append(resultado)
+        descartada.set()
+
+    resultado = hedger.executar(lenta('primaria', 0.5), lambda: lenta('reserva', 0.01), bool, ao_perder)
+    assert resultado == 'reserva'
+    assert metricas.HEDGES_WON.valor() == vitorias + 1
+    # O token da perdedora é liberado quando ela termina
+    assert descartada.wait(5) and perdedores == ['primaria']
+
+
+def test_primaria_com_falha_espera_a_reserva():
+    hedger = aquecido()
+    perdedores = []
+    resultado = hedger.executar(lenta(None, 0.1), lambda: lenta('reserva', 0.2), bool, perdedores.append)
+    assert resultado == 'reserva'
+    time.sleep(0.05)
+    assert perdedores == [None]
+
+
+def test_sem_credito_a_reserva_nao_e_enviada():
+    hedger = aquecido(orcamento=0.5)
+    puladas = metricas.HEDGES_SKIPPED.valor(motivo='orcamento')
+    preparadas = []
+    resultado = hedger.executar(lenta('primaria', 0.1), lambda: preparadas.append(1), bool, None)
+    assert resultado == 'primaria' and preparadas == []
+    assert metricas.HEDGES_SKIPPED.valor(motivo='orcamento') == puladas + 1
+
+
+def test_reserva_nao_preparada_devolve_o_credito():
+    hedger = aquecido()
+    puladas = metricas.HEDGES_SKIPPED.valor(motivo='token')
+    resultado = hedger.executar(lenta('primaria', 0.1), lambda: (None, 'token'), bool, None)
+    assert resultado == 'primaria'
+    assert hedger._credito == 1
+    assert metricas.HEDGES_SKIPPED.valor(motivo='token') == puladas + 1
+
+
+def test_espera_na_fila_do_executor_nao_conta_no_limiar():
+    hedger = aquecido(workers=1)
+    liberar = threading.Event()
+    # A única thread do executor fica ocupada por mais tempo que o limiar
+    ocupada = hedger._get_executor().submit(liberar.wait)
+    threading.Timer(0.3, liberar.set).start()
+    preparadas = []
+    resultado = hedger.executar(lenta('primaria', 0.01), lambda: preparadas.append(1), bool, None)
+    assert resultado == 'primaria' and preparadas == []
+    assert ocupada.result() is True
+
+
+def test_executar_async():
+    hedger = aquecido()
+    perdedores = []
+
+    def tentativa(resultado, segundos):
+        async def executar():
+            await asyncio.sleep(segundos)
+            return resultado
+        return executar
+
+    async def preparar(segundos):
+        return tentativa('reserva', segundos)
+
+    async def cenario():
+        rapida = await hedger.executar_async(tentativa('primaria', 0), lambda: preparar(0), bool, None)
+        vencida = await hedger.executar_async(tentativa('primaria', 0.3), lambda: preparar(0.01), bool,
+                                              perdedores.append)
+        await asyncio.sleep(0.4)
+        return rapida, vencida
+
+    assert asyncio.run(cenario()) == ('primaria', 'reserva')
+    assert perdedores == ['primaria']
+
+
+def test_reserva_com_outro_token_libera_o_perdedor(servidor_falso, tmp_path, monkeypatch):
+    monkeypatch.setitem(cadastros.URLS, 'ceis', servidor_falso.url)
+    consulta.result_cache.clear()
+    pool = tokens.TokenPool([{"nome": "a", "token": "token-a", "cota": 1000},
+                             {"nome": "b", "token": "token-b", "cota": 1000}],
+                            resiliencia.SharedState(str(tmp_path)), intervalo=0)
+    monkeypatch.setattr(consulta, 'pool', pool)
+    monkeypatch.setattr(consulta, 'hedger', aquecido())
+    servidor_falso.config.latencia = 200
+    disparadas = metricas.HEDGES_FIRED.valor()
+
+    _, status, _, _ = consulta.consultar(None, cnpj='11222333000181')
+    assert status == 200
+    assert metricas.HEDGES_FIRED.valor() == disparadas + 1
+
+    fim = time.time() + 5
+    while any(c.em_andamento for c in pool.credenciais) and time.time() < fim:
+        time.sleep(0.01)
+    assert [c.em_andamento for c in pool.credenciais] == [0, 0]
+    assert sorted(c.usados for c in pool.credenciais) == [1, 1]
+    assert servidor_falso.estatisticas.exportar()["chamadas"] == 2
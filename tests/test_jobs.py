@@ -0,0 +1,53 @@
+import sqlite3
+import threading
+
+import jobs
+
+
+def criar_job(tmp_path, quantidade=3):
+    store = jobs.JobStore(str(tmp_path / 'jobs.sqlite3'))
+    documentos = [(f'doc{i}', 'cnpj', f'doc{i}') for i in range(quantidade)]
+    return store, store.criar('token', documentos)
+
+
+def test_itens_regravados_nao_sao_contados_de_novo(tmp_path):
+    store, job_id = criar_job(tmp_path)
+    store.gravar(job_id, [(0, {"status": 200}), (1, {"status": 200})])
+    # Um worker que perdeu a reserva do job ainda grava os mesmos itens
+    store.gravar(job_id, [(1, {"status": 200}), (2, {"status": 200})])
+    store.gravar(job_id, [(0, {"status": 500})])
+
+    job = store.obter(job_id)
+    assert job["processados"] == 3
+    assert job["progresso"] == 100.0
+    assert [item["status"] for item in job["resultados"]] == [200, 200, 200]
+
+
+def test_job_abandonado_e_retomado_sem_contar_duas_vezes(tmp_path, monkeypatch):
+    store, job_id = criar_job(tmp_path)
+    assert store.reservar() == job_id
+    store.gravar(job_id, [(0, {"status": 200})])
+
+    monkeypatch.setattr(jobs, 'STALE_AFTER', -1)
+    assert store.reservar() == job_id
+    assert [indice for indice, _ in store.pendentes(job_id)] == [1, 2]
+    store.gravar(job_id, [(0, {"status": 200}), (1, {"status": 200}), (2, {"status": 200})])
+    assert store.obter(job_id)["processados"] == 3
+
+
+def test_falha_ao_reservar_nao_encerra_a_thread(tmp_path, monkeypatch):
+    monkeypatch.setattr(jobs, 'POLL_INTERVAL', 0.001)
+    store = jobs.JobStore(str(tmp_path / 'jobs.sqlite3'))
+    chamadas = []
+    recuperou = threading.Event()
+
+    def reservar():
+        chamadas.append(1)
+        if len(chamadas) <= 2:
+            raise sqlite3.OperationalError("database is locked")
+        recuperou.set()
+        return None
+
+    monkeypatch.setattr(store, 'reservar', reservar)
+    jobs.JobRunner(store).iniciar()
+    assert recuperou.wait(5)
@@ -0,0 +1,119 @@
+import io
+import json
+import threading
+import time
+
+import pytest
+
+import app as aplicacao
+import cadastros
+import consulta
+import lote
+
+VALIDOS = ['11.222.333/0001-81', '11444777000161', '529.982.247-25']
+
+
+@pytest.fixture
+def cliente(servidor_falso, monkeypatch):
+    monkeypatch.setitem(cadastros.URLS, 'ceis', servidor_falso.url)
+    consulta.result_cache.clear()
+    return aplicacao.app.test_client()
+
+
+def test_resultados_na_ordem_de_entrada_sem_duplicados(cliente):
+    documentos = VALIDOS + ['11222333000181', '123']
+    resposta = cliente.post('/api/consulta-ceis/lote', json={"token": "t", "documentos": documentos})
+    assert resposta.status_code == 200
+    dados = resposta.get_json()
+    assert dados["total"] == 4
+    assert [item["documento"] for item in dados["resultados"]] == ['11222333000181', '11444777000161', '52998224725', '123']
+    assert [item["status"] for item in dados["resultados"]] == [200, 200, 200, 400]
+    assert dados["resultados"][2]["tipo"] == 'cpf'
+
+
+def test_csv_com_cabecalho(cliente):
+    arquivo = io.BytesIO('nome;cnpj\nEmpresa A;11.222.333/0001-81\nEmpresa B;11.444.777/0001-61\n'.encode('utf-8'))
+    resposta = cliente.post('/api/consulta-ceis/lote', data={"token": "t", "arquivo": (arquivo, 'lista.csv')})
+    assert [item["documento"] for item in resposta.get_json()["resultados"]] == ['11222333000181', '11444777000161']
+
+
+@pytest.mark.parametrize('corpo, status', [
+    ({"documentos": VALIDOS}, 400),        # sem token e sem tokens no servidor
+    ({"token": "t"}, 400),                  # sem documentos
+    ({"token": "t", "documentos": "11222333000181"}, 400),
+])
+def test_parametros_invalidos(cliente, corpo, status):
+    resposta = cliente.post('/api/consulta-ceis/lote', json=corpo)
+    assert resposta.status_code == status
+    assert set(resposta.get_json()) == {"code", "code_message", "errors"}
+
+
+def test_limite_de_documentos(cliente, monkeypatch):
+    monkeypatch.setattr(lote, 'MAX_DOCUMENTOS', 2)
+    resposta = cliente.post('/api/consulta-ceis/lote', json={"token": "t", "documentos": VALIDOS})
+    assert resposta.status_code == 413
+    # Duplicados não contam para o limite
+    resposta = cliente.post('/api/consulta-ceis/lote', json={"token": "t", "documentos": VALIDOS[:2] * 3})
+    assert resposta.status_code == 200
+
+
+def test_concorrencia_e_pendencias_limitadas(monkeypatch):
+    ativos, maximo, submetidos = [0], [0], []
+    trava = threading.Lock()
+
+    def consultar(token, limiter=None, **kwargs):
+        with trava:
+            ativos[0] += 1
+            maximo[0] = max(maximo[0], ativos[0])
+        time.sleep(0.01)
+        with trava:
+            ativos[0] -= 1
+        return {"code": 200, "data_count": 0}, 200, 'MISS', 0
+
+    def classificados(n):
+        for i in range(n):
+            submetidos.append(i)
+            yield (str(i), 'cnpj', f'{i:014d}')
+
+    monkeypatch.setattr(consulta, 'consultar', consultar)
+    recebidos = []
+    for indice, item in lote.executar('t', classificados(40), concurrency=3):
+        recebidos.append(indice)
+        # Nunca há mais que 2 x concorrência consultas pendentes à frente do consumidor
+        assert len(submetidos) - len(recebidos) <= 6
+    assert sorted(recebidos) == list(range(40))
+    assert maximo[0] <= 3
+
+
+def test_taxa_do_lote_espaca_as_chamadas():
+    limitador = lote.RateLimiter(20)
+    inicio = time.monotonic()
+    for _ in range(5):
+        limitador.acquire()
+    assert time.monotonic() - inicio >= 0.19
+
+
+def test_ndjson_uma_linha_por_resultado_e_resumo_no_fim(cliente):
+    resposta = cliente.post('/api/consulta-ceis/lote?formato=ndjson',
+                            json={"token": "t", "documentos": VALIDOS + ['123']})
+    assert resposta.mimetype == 'application/x-ndjson'
+    assert resposta.headers['Cache-Control'] == 'no-cache'
+    corpo = resposta.get_data(as_text=True)
+    assert corpo.endswith('\n')
+    linhas = [json.loads(linha) for linha in corpo.splitlines()]
+    assert sorted(linha["indice"] for linha in linhas[:-1]) == [0, 1, 2, 3]
+    resumo = linhas[-1]["resumo"]
+    assert resumo["total"] == 4 and resumo["erros"] == 1
+    assert resumo["sancionados"] + resumo["sem_sancao"] == 3
+
+
+def test_sse_pelo_cabecalho_accept(cliente):
+    resposta = cliente.post('/api/consulta-ceis/lote', json={"token": "t", "documentos": VALIDOS[:2]},
+                            headers={"Accept": "text/event-stream"})
+    assert resposta.mimetype == 'text/event-stream'
+    eventos = resposta.get_data(as_text=True).split('\n\n')
+    assert eventos[-1] == ''
+    eventos = [evento.split('\n') for evento in eventos[:-1]]
+    assert [evento[0] for evento in eventos] == ['event: resultado', 'event: resultado', 'event: resumo']
+    assert all(evento[1].startswith('data: ') and len(evento) == 2 for evento in eventos)
+    assert json.loads(eventos[-1][1][len('data: '):])["resumo"]["total"] == 2
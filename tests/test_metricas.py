@@ -0,0 +1,99 @@
+import pytest
+
+import cadastros
+import consulta
+import metricas
+
+
+@pytest.fixture
+def registro(monkeypatch):
+    # Métricas criadas no teste ficam fora do registro global de /metrics
+    monkeypatch.setattr(metricas, '_registry', [])
+
+
+@pytest.fixture
+def cliente(servidor_falso, monkeypatch):
+    import app as aplicacao
+    monkeypatch.setitem(cadastros.URLS, 'ceis', servidor_falso.url)
+    consulta.result_cache.clear()
+    return aplicacao.app.test_client()
+
+
+def test_contador_exporta_labels_ordenados(registro):
+    contador = metricas.Counter('teste_total', "Contador de teste")
+    contador.inc(status=200, endpoint='a')
+    contador.inc(2, endpoint='a', status=200)
+    contador.inc(endpoint='b', status=500)
+    assert contador.valor(status=200, endpoint='a') == 3
+    assert metricas.exportar().splitlines() == [
+        '# HELP teste_total Contador de teste',
+        '# TYPE teste_total counter',
+        'teste_total{endpoint="a",status="200"} 3',
+        'teste_total{endpoint="b",status="500"} 1',
+    ]
+
+
+def test_histograma_acumula_buckets_contagem_e_soma(registro):
+    histograma = metricas.Histogram('teste_seconds', "Histograma de teste", buckets=(0.1, 1))
+    histograma.observe(0.05, etapa='x')
+    histograma.observe(0.5, etapa='x')
+    histograma.observe(3, etapa='x')
+    linhas = metricas.exportar().splitlines()
+    assert linhas[2:] == [
+        'teste_seconds_bucket{etapa="x",le="0.1"} 1',
+        'teste_seconds_bucket{etapa="x",le="1"} 2',
+        'teste_seconds_bucket{etapa="x",le="+Inf"} 3',
+        'teste_seconds_count{etapa="x"} 3',
+        'teste_seconds_sum{etapa="x"} 3.55',
+    ]
+
+
+def test_medidor_calculado_na_coleta(registro):
+    valores = iter([1, 7])
+    medidor = metricas.Gauge('teste_gauge', "Medidor de teste", funcao=lambda: next(valores))
+    assert 'teste_gauge 1' in metricas.exportar()
+    assert 'teste_gauge 7' in metricas.exportar()
+    assert medidor.valor() == 7
+
+
+def test_medir_acumula_no_server_timing(registro):
+    histograma = metricas.Histogram('teste_seconds', "Histograma de teste")
+    timings = metricas.iniciar_timing()
+    with metricas.medir(histograma, 'parse'):
+        pass
+    with metricas.medir(histograma, 'parse'):
+        pass
+    assert list(timings) == ['parse']
+    assert histograma.exportar()[-2] == 'teste_seconds_count 2'
+    assert metricas.server_timing({'parse': 0.0015, 'total': 0.25}) == 'parse;dur=1.5, total;dur=250.0'
+
+
+def test_endpoint_metrics_no_formato_do_prometheus(cliente):
+    antes = metricas.REQUESTS.valor(endpoint='consulta_ceis', status=200)
+    hits = metricas.CACHE.valor(resultado='hit')
+    for _ in range(2):
+        resposta = cliente.post('/api/consulta-ceis', data={'token': 't', 'cnpj': '11222333000181'})
+        assert resposta.status_code == 200
+    assert metricas.REQUESTS.valor(endpoint='consulta_ceis', status=200) == antes + 2
+    assert metricas.CACHE.valor(resultado='hit') == hits + 1
+
+    resposta = cliente.get('/metrics')
+    assert resposta.status_code == 200
+    assert resposta.mimetype == 'text/plain'
+    texto = resposta.get_data(as_text=True)
+    assert '# TYPE ceis_requests_total counter' in texto
+    assert 'ceis_requests_total{endpoint="consulta_ceis",status="200"}' in texto
+    assert 'ceis_upstream_duration_seconds_count' in texto
+
+
+def test_server_timing_detalha_as_etapas(cliente, monkeypatch):
+    monkeypatch.setattr(metricas, 'SERVER_TIMING', True)
+    resposta = cliente.post('/api/consulta-ceis', data={'token': 't', 'cnpj': '11222333000181'})
+    etapas = [item.split(';')[0] for item in resposta.headers['Server-Timing'].split(', ')]
+    assert {'upstream', 'parse', 'serialize', 'total'} <= set(etapas)
+
+
+def test_server_timing_desligado_por_padrao(cliente):
+    assert metricas.SERVER_TIMING is False
+    resposta = cliente.post('/api/consulta-ceis', data={'token': 't', 'cnpj': '11222333000181'})
+    assert 'Server-Timing' not in resposta.headers
@@ -0,0 +1,82 @@
+import sqlite3
+
+import base_local
+import consulta
+import monitoramento
+from test_base_local import escrever_csv, sancao
+
+
+def test_base_local_calcula_vereditos_fora_da_transacao(tmp_path, monkeypatch):
+    destino = str(tmp_path / 'local.sqlite3')
+    base_local.importar(escrever_csv(tmp_path / 'v1.csv', [sancao('11.222.333/0001-81', 'A1')]), destino)
+    monkeypatch.setattr(consulta, 'base', base_local.BaseLocal(destino))
+
+    store = monitoramento.WatchStore(str(tmp_path / 'monitoramento.sqlite3'))
+    store.adicionar(['11222333000181', '11444777000161'])
+    monitor = monitoramento.Monitor(store, ciclo=0, webhook='')
+
+    consultar_local = consulta.consultar_local
+    bloqueios = []
+
+    def consultar_sem_transacao_aberta(cnpj=None, cpf=None):
+        # Outro worker consegue gravar no monitoramento enquanto os vereditos são calculados
+        outra = sqlite3.connect(store.path, timeout=0, isolation_level=None)
+        try:
+            outra.execute("BEGIN IMMEDIATE")
+            outra.execute("ROLLBACK")
+        except sqlite3.OperationalError as e:
+            bloqueios.append(e)
+        finally:
+            outra.close()
+        return consultar_local(cnpj=cnpj, cpf=cpf)
+
+    monkeypatch.setattr(consulta, 'consultar_local', consultar_sem_transacao_aberta)
+
+    # A primeira verificação registra os vereditos iniciais, sem eventos
+    assert monitor.verificar_base_local() == []
+    situacoes = {item["documento"]: item["situacao"] for item in store.listar()[1]}
+    assert situacoes == {'11222333000181': 'sancionado', '11444777000161': 'sem_sancao'}
+    assert store.versao_base() == 1
+
+    base_local.importar(escrever_csv(tmp_path / 'v2.csv', [sancao('11.444.777/0001-61', 'B1')]), destino)
+    eventos = monitor.verificar_base_local()
+    assert {(evento["documento"], evento["para"]["situacao"]) for evento in eventos} == {
+        ('11222333000181', 'sem_sancao'), ('11444777000161', 'sancionado')
+    }
+    assert [evento["id"] for evento in store.eventos()] == [evento["id"] for evento in eventos]
+    assert store.versao_base() == 2
+    assert not bloqueios
+    # Nada mudou na base: nenhum documento é reavaliado
+    assert monitor.verificar_base_local() == []
+
+
+def test_cpfs_sem_tokens_do_servidor_sao_informados_como_nao_verificaveis(tmp_path, monkeypatch):
+    import app as aplicacao
+    import metricas
+
+    destino = str(tmp_path / 'local.sqlite3')
+    base_local.importar(escrever_csv(tmp_path / 'v1.csv', [sancao('11.222.333/0001-81', 'A1')]), destino)
+    monkeypatch.setattr(consulta, 'base', base_local.BaseLocal(destino))
+    assert not consulta.pool
+
+    store = monitoramento.WatchStore(str(tmp_path / 'monitoramento.sqlite3'))
+    store.adicionar(['11222333000181', '52998224725', '11144477735'])
+    monitor = monitoramento.Monitor(store, ciclo=0, webhook='')
+    monkeypatch.setattr(monitoramento, 'monitor', monitor)
+    monkeypatch.setattr(monitoramento, 'store', store)
+
+    monitor.verificar()
+    situacoes = {item["documento"]: item["situacao"] for item in store.listar()[1]}
+    assert situacoes == {'11222333000181': 'sancionado', '52998224725': None, '11144477735': None}
+    assert metricas.WATCH_UNVERIFIABLE.valor() == 2
+
+    dados = aplicacao.app.test_client().get('/api/monitoramento').get_json()
+    assert (dados["total"], dados["nao_verificaveis"]) == (3, 2)
+
+    # Sem a base local, nenhum documento pode ser verificado
+    monkeypatch.setattr(consulta, 'base', base_local.BaseLocal(str(tmp_path / 'inexistente.sqlite3')))
+    assert monitor.nao_verificaveis() == 3
+
+    # Com tokens do servidor, os CPFs seguem pela consulta
+    monkeypatch.setattr(consulta, 'pool', ['token'])
+    assert monitor.nao_verificaveis() == 0
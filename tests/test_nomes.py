@@ -0,0 +1,124 @@
+import random
+
+import pytest
+
+import base_local
+import documentos
+import nomes
+from test_base_local import escrever_csv, sancao
+
+PALAVRAS = ['ACAO', 'COMERCIO', 'CONSTRUTORA', 'SERVICOS', 'ALIMENTOS', 'ENGENHARIA', 'NORTE', 'SUL',
+            'BRASIL', 'PAULISTA', 'MINEIRA', 'TRANSPORTES', 'DISTRIBUIDORA', 'TECNOLOGIA', 'SAUDE', 'OBRAS']
+SUFIXOS = ['LTDA', 'EIRELI', 'S A', 'ME', '']
+
+
+@pytest.fixture(scope='module')
+def indice(tmp_path_factory):
+    pasta = tmp_path_factory.mktemp('nomes')
+    aleatorio = random.Random(22)
+    linhas, cadastrados = [], {}
+    for i in range(400):
+        documento = documentos.gerar_cnpj(f'{aleatorio.randrange(10 ** 8):08d}0001')
+        nome = ' '.join(aleatorio.sample(PALAVRAS, aleatorio.randint(2, 4)) + [aleatorio.choice(SUFIXOS)]).strip()
+        linhas.append(sancao(documento, f'S{i}', nome=nome))
+        cadastrados.setdefault(documento, set()).add(nomes.normalizar(nome))
+    # Nome com acentos e pontuação, que deve ser encontrado sem eles
+    linhas.append(sancao('11.222.333/0001-81', 'S-ACENTO', nome='Ação & Comércio de Peças Ltda.'))
+    cadastrados['11222333000181'] = {nomes.normalizar('Ação & Comércio de Peças Ltda.')}
+
+    base = str(pasta / 'local.sqlite3')
+    base_local.importar(escrever_csv(pasta / 'v1.csv', linhas), base)
+    destino = str(pasta / 'nomes.idx')
+    resumo = nomes.construir(base, destino)
+    assert resumo["versao"] == 1 and resumo["entradas"] == sum(len(v) for v in cadastrados.values())
+    return nomes.IndiceNomes(destino), cadastrados
+
+
+def referencia(cadastrados, nome, limite, minimo):
+    # Coeficiente de Dice contra todos os nomes, sem índice
+    consulta = nomes.trigramas(nomes.normalizar(nome))
+    melhores = {}
+    for documento, normalizados in cadastrados.items():
+        for normalizado in normalizados:
+            alvo = nomes.trigramas(normalizado)
+            semelhanca = 2 * len(consulta & alvo) / (len(consulta) + len(alvo))
+            if semelhanca >= minimo and semelhanca > melhores.get(documento, 0):
+                melhores[documento] = semelhanca
+    ordenados = sorted(melhores.items(), key=lambda item: (-item[1], item[0]))[:limite]
+    return [(documento, round(semelhanca, 4)) for documento, semelhanca in ordenados]
+
+
+CONSULTAS = ['acao comercio ltda', 'CONSTRUTORA NORTE', 'construtora nort engenharia', 'distribuidora de alimentos sul',
+             'tecnologia saude brasil eireli', 'obras', 'xyz']
+
+
+@pytest.fixture(params=['puro', 'numpy'])
+def modo(request, monkeypatch):
+    if request.param == 'numpy':
+        pytest.importorskip('numpy')
+    else:
+        monkeypatch.setattr(nomes, 'numpy', None)
+    return request.param
+
+
+@pytest.mark.parametrize('consulta', CONSULTAS)
+@pytest.mark.parametrize('minimo', [0.3, 0.5, 0.8])
+def test_busca_igual_a_comparacao_com_todos_os_nomes(indice, modo, consulta, minimo):
+    indice_nomes, cadastrados = indice
+    indice_nomes._secoes = None
+    candidatos, versao = indice_nomes.buscar(consulta, limite=1000, minimo=minimo)
+    assert versao == 1
+    assert [(c["documento"], c["semelhanca"]) for c in candidatos] == referencia(cadastrados, consulta, 1000, minimo)
+
+
+def test_limite_mantem_as_maiores_semelhancas(indice, modo):
+    indice_nomes, cadastrados = indice
+    indice_nomes._secoes = None
+    for consulta in CONSULTAS:
+        candidatos, _ = indice_nomes.buscar(consulta, limite=3, minimo=0.3)
+        esperados = referencia(cadastrados, consulta, 3, 0.3)
+        assert [c["semelhanca"] for c in candidatos] == [semelhanca for _, semelhanca in esperados]
+
+
+def test_nome_sem_acentos_e_pontuacao(indice):
+    indice_nomes, _ = indice
+    candidatos, _ = indice_nomes.buscar('ACAO E COMERCIO DE PECAS LTDA', limite=1)
+    assert candidatos[0]["documento"] == '11222333000181'
+    assert candidatos[0]["nome"] == 'Ação & Comércio de Peças Ltda.'
+    assert candidatos[0]["tipo"] == 'cnpj'
+    assert indice_nomes.buscar('  ...  ')[0] == []
+
+
+def test_orcamento_pequeno_ainda_encontra_o_nome_exato(indice, monkeypatch):
+    indice_nomes, cadastrados = indice
+    monkeypatch.setattr(nomes, 'numpy', None)
+    monkeypatch.setattr(nomes, 'ORCAMENTO', 1)
+    indice_nomes._secoes = None
+    documento, normalizados = sorted(cadastrados.items())[0]
+    candidatos, _ = indice_nomes.buscar(next(iter(normalizados)), limite=5)
+    assert candidatos[0]["documento"] == documento and candidatos[0]["semelhanca"] == 1.0
+
+
+def test_nome_com_tabulacao(tmp_path):
+    base = str(tmp_path / 'local.sqlite3')
+    base_local.importar(escrever_csv(tmp_path / 'v1.csv', [
+        sancao('11.222.333/0001-81', 'T1', nome='CONSTRUTORA\tNORTE LTDA'),
+        sancao('11.444.777/0001-61', 'T2', nome='Ação\t\tComércio'),
+    ]), base)
+    destino = str(tmp_path / 'nomes.idx')
+    nomes.construir(base, destino)
+    indice_nomes = nomes.IndiceNomes(destino)
+
+    candidatos, _ = indice_nomes.buscar('construtora norte ltda', limite=1)
+    assert [(c["documento"], c["nome"], c["semelhanca"]) for c in candidatos] == [
+        ('11222333000181', 'CONSTRUTORA\tNORTE LTDA', 1.0)
+    ]
+    candidatos, _ = indice_nomes.buscar('acao comercio', limite=1)
+    assert candidatos[0]["nome"] == 'Ação\t\tComércio'
+
+
+def test_indice_de_formato_anterior_e_recusado(tmp_path):
+    destino = tmp_path / 'nomes.idx'
+    destino.write_bytes(nomes.CABECALHO.pack(nomes.MAGICO, 1, True, 0, 1, 0, 0, 0, 1, 0))
+    with pytest.raises(ValueError, match='reconstrua'):
+        nomes.IndiceNomes(str(destino)).buscar('acao')
@@ -0,0 +1,114 @@
+from datetime import date
+
+import pytest
+
+import projecao
+
+HOJE = date(2025, 6, 15)
+
+
+def sancao(tipo='Suspensão', fim='01/01/2030', orgao='CGU'):
+    return {"sancao": {"tipo": tipo, "fim_data": fim, "inicio_data": '01/01/2020'},
+            "orgao_sancionador": {"nome": orgao}}
+
+
+@pytest.mark.parametrize('fim', [None, '', '**', '  ', '31/02/2024', '2024-01-01'])
+def test_data_final_ausente_ou_invalida_conta_como_sem_prazo(fim):
+    resumo = projecao.resumir([sancao(fim=fim)], hoje=HOJE)
+    assert (resumo["ativas"], resumo["expiradas"], resumo["sem_prazo"]) == (1, 0, 1)
+    assert resumo["fim_mais_recente"] is None
+
+
+def test_sancao_sem_fim_data():
+    item = sancao()
+    del item["sancao"]["fim_data"]
+    assert projecao.resumir([item, {"sancao": None}], hoje=HOJE)["sem_prazo"] == 2
+
+
+def test_ativas_expiradas_e_fim_mais_recente():
+    data = [
+        sancao(fim='14/06/2025', orgao='TCU'),
+        sancao(fim='15/06/2025'),
+        sancao(fim=' 01/01/2031 ', orgao='CGU'),
+        sancao(fim='**'),
+    ]
+    resumo = projecao.resumir(data, hoje=HOJE)
+    # A sanção que termina hoje ainda está ativa
+    assert (resumo["total"], resumo["ativas"], resumo["expiradas"], resumo["sem_prazo"]) == (4, 3, 1, 1)
+    assert resumo["fim_mais_recente"] == '01/01/2031'
+    assert resumo["orgaos"] == ['CGU', 'TCU']
+
+
+def test_gravidade_pelo_inicio_do_tipo_sem_acentos():
+    assert projecao.gravidade('Inidoneidade') == 0
+    assert projecao.gravidade('Declaração de Inidoneidade') == 1
+    assert projecao.gravidade('PROIBIÇÃO - Lei de Improbidade') == 2
+    assert projecao.gravidade('  Impedimento/proibição de contratar') == 3
+    assert projecao.gravidade('Suspensão') == 4
+    assert projecao.gravidade('Multa') == projecao.gravidade(None) == len(projecao.GRAVIDADE)
+
+
+def test_tipo_mais_grave_mantem_o_primeiro_em_caso_de_empate():
+    data = [
+        sancao(tipo='Multa'),
+        sancao(tipo='Impedimento - Lei do Pregão'),
+        sancao(tipo='Suspensão'),
+        sancao(tipo='Impedimento/proibição de contratar'),
+    ]
+    assert projecao.resumir(data, hoje=HOJE)["tipo_mais_grave"] == 'Impedimento - Lei do Pregão'
+    # Entre tipos fora de GRAVIDADE, também vale o primeiro
+    assert projecao.resumir([sancao(tipo='Multa'), sancao(tipo='Advertência')], hoje=HOJE)["tipo_mais_grave"] == 'Multa'
+    assert projecao.resumir([sancao(tipo=None)], hoje=HOJE)["tipo_mais_grave"] is None
+
+
+@pytest.mark.parametrize('offset, limit, esperado', [
+    (None, None, None),
+    ('', '', None),
+    ('2', None, (2, projecao.MAX_LIMITE)),
+    (None, '10', (0, 10)),
+    ('0', '0', (0, 0)),
+    ('0', str(projecao.MAX_LIMITE), (0, projecao.MAX_LIMITE)),
+])
+def test_ler_pagina_valida(offset, limit, esperado):
+    assert projecao.ler_pagina(offset, limit) == (esperado, None)
+
+
+@pytest.mark.parametrize('offset, limit', [
+    ('-1', '10'), ('0', '-1'), ('0', str(projecao.MAX_LIMITE + 1)), ('a', '1'), ('1.5', None),
+])
+def test_ler_pagina_invalida(offset, limit):
+    pagina, erro = projecao.ler_pagina(offset, limit)
+    assert pagina is None
+    payload, status = erro
+    assert status == 400 and set(payload) == {"code", "code_message", "errors"}
+
+
+@pytest.mark.parametrize('offset, limit, indices', [
+    (0, 2, [0, 1]),
+    (3, 10, [3, 4]),
+    (5, 10, []),
+    (100, 10, []),
+    (1, 0, []),
+])
+def test_paginar_dentro_dos_limites(offset, limit, indices):
+    payload = {"code": 200, "data_count": 5, "data": [{"i": i} for i in range(5)]}
+    pagina = projecao.paginar(payload, offset, limit)
+    assert [item["i"] for item in pagina["data"]] == indices
+    assert pagina["data_count"] == 5
+    assert pagina["paginacao"] == {"offset": offset, "limit": limit, "total": 5}
+    assert len(payload["data"]) == 5
+
+
+def test_paginar_resposta_de_erro_e_veredito():
+    erro = {"code": 500, "errors": ["falha"]}
+    assert projecao.paginar(erro, 0, 1) is erro
+    payload = {"code": 200, "data_count": 3, "data": [sancao(), sancao(), sancao()]}
+    pagina = projecao.aplicar(payload, 'veredito', projecao.ler_campos('sancoes,data_count'), pagina=(2, 5))
+    assert pagina["data_count"] == 3 and len(pagina["sancoes"]) == 1
+    assert pagina["paginacao"]["total"] == 3
+
+
+def test_resumo_e_calculado_antes_da_paginacao():
+    payload = {"code": 200, "data_count": 3, "data": [sancao(fim='01/01/2000'), sancao(), sancao()]}
+    pagina = projecao.aplicar(payload, 'completo', projecao.ler_campos('resumo,data'), pagina=(0, 1))
+    assert pagina["resumo"]["total"] == 3 and len(pagina["data"]) == 1
@@ -0,0 +1,128 @@
+import time
+
+import pytest
+
+import cache
+import cadastros
+import consulta
+import metricas
+import resiliencia
+
+
+@pytest.fixture
+def estado(tmp_path):
+    return resiliencia.SharedState(str(tmp_path / 'estado.sqlite3'))
+
+
+@pytest.fixture
+def estado_indisponivel(tmp_path):
+    # Um diretório no lugar do arquivo: o SQLite não consegue abri-lo
+    return resiliencia.SharedState(str(tmp_path))
+
+
+def test_disjuntor_abre_apos_falhas_consecutivas(estado):
+    disjuntor = resiliencia.CircuitBreaker(estado, threshold=3, cooldown=60)
+    disjuntor.registrar(False)
+    disjuntor.registrar(False)
+    disjuntor.registrar(True)
+    # Um sucesso zera a contagem
+    disjuntor.registrar(False)
+    disjuntor.registrar(False)
+    assert disjuntor.permitir() == (True, 0)
+    disjuntor.registrar(False)
+    permitido, espera = disjuntor.permitir()
+    assert not permitido and 59 < espera <= 60
+
+
+def test_disjuntor_libera_uma_unica_chamada_de_teste(estado):
+    disjuntor = resiliencia.CircuitBreaker(estado, threshold=1, cooldown=0.05)
+    # Outro worker, com o mesmo arquivo de estado
+    outro = resiliencia.CircuitBreaker(resiliencia.SharedState(estado.path), threshold=1, cooldown=0.05)
+    disjuntor.registrar(False)
+    assert not outro.permitir()[0]
+    time.sleep(0.06)
+    assert disjuntor.permitir() == (True, 0)
+    assert not outro.permitir()[0]
+
+    # A chamada de teste falhou: abre de novo
+    disjuntor.registrar(False)
+    time.sleep(0.06)
+    assert outro.permitir() == (True, 0)
+    outro.registrar(True)
+    assert disjuntor.permitir() == (True, 0)
+    assert outro.permitir() == (True, 0)
+
+
+def test_disjuntores_de_cadastros_distintos_sao_independentes(estado):
+    ceis = resiliencia.CircuitBreaker(estado, threshold=1, cooldown=60, chave='infosimples-ceis')
+    cnep = resiliencia.CircuitBreaker(estado, threshold=1, cooldown=60, chave='infosimples-cnep')
+    ceis.registrar(False)
+    assert not ceis.permitir()[0]
+    assert cnep.permitir() == (True, 0)
+
+
+def test_limitador_respeita_rajada_e_taxa(estado):
+    limitador = resiliencia.TokenBucket(estado, rate=20, burst=2, limites={"lento": 0.001})
+    assert limitador.acquire('a', max_wait=0)
+    assert limitador.acquire('a', max_wait=0)
+    assert not limitador.acquire('a', max_wait=0)
+    # A próxima ficha chega em 1/20 s
+    inicio = time.monotonic()
+    assert limitador.acquire('a', max_wait=1)
+    assert 0.02 < time.monotonic() - inicio < 0.5
+    # Cada token tem suas fichas, e limites específicos prevalecem sobre o padrão
+    assert limitador.acquire('b', max_wait=0)
+    assert limitador.acquire('lento', max_wait=0)
+    assert limitador.acquire('lento', max_wait=0)
+    assert not limitador.acquire('lento', max_wait=0.1)
+
+
+def test_limitador_e_compartilhado_entre_workers(estado):
+    limitador = resiliencia.TokenBucket(estado, rate=0.001, burst=2)
+    outro = resiliencia.TokenBucket(resiliencia.SharedState(estado.path), rate=0.001, burst=2)
+    assert limitador.acquire('a', max_wait=0)
+    assert outro.acquire('a', max_wait=0)
+    assert not limitador.acquire('a', max_wait=0)
+    assert not outro.acquire('a', max_wait=0)
+
+
+def test_sem_arquivo_de_estado_usa_o_estado_do_worker(estado_indisponivel):
+    erros = metricas.SHARED_STATE_ERRORS.valor()
+    disjuntor = resiliencia.CircuitBreaker(estado_indisponivel, threshold=2, cooldown=60)
+    limitador = resiliencia.TokenBucket(estado_indisponivel, rate=0.001, burst=1)
+
+    assert disjuntor.permitir() == (True, 0)
+    assert metricas.SHARED_STATE_ERRORS.valor() == erros + 1
+    disjuntor.registrar(False)
+    disjuntor.registrar(False)
+    assert not disjuntor.permitir()[0]
+
+    assert limitador.acquire('a', max_wait=0)
+    assert not limitador.acquire('a', max_wait=0)
+    # Durante o intervalo de fallback o arquivo não é tentado de novo a cada chamada
+    assert metricas.SHARED_STATE_ERRORS.valor() == erros + 1
+
+
+def test_arquivo_volta_a_ser_usado_apos_o_intervalo(tmp_path):
+    estado = resiliencia.SharedState(str(tmp_path / 'sub' / 'estado.sqlite3'), fallback=0.01)
+    disjuntor = resiliencia.CircuitBreaker(estado, threshold=1, cooldown=60)
+    assert disjuntor.permitir() == (True, 0)
+    assert not estado.disponivel()
+
+    (tmp_path / 'sub').mkdir()
+    time.sleep(0.02)
+    disjuntor.registrar(False)
+    assert estado.disponivel()
+    assert not resiliencia.CircuitBreaker(resiliencia.SharedState(estado.path), threshold=1).permitir()[0]
+
+
+def test_consulta_funciona_sem_arquivo_de_estado(servidor_falso, estado_indisponivel, monkeypatch):
+    monkeypatch.setitem(cadastros.URLS, 'ceis', servidor_falso.url)
+    monkeypatch.setattr(consulta.breaker, 'state', estado_indisponivel)
+    monkeypatch.setattr(consulta.rate_limiter, 'state', estado_indisponivel)
+    monkeypatch.setattr(consulta.rate_limiter, 'rate', 100)
+    consulta.result_cache.clear()
+
+    payload, status, cache_status, _ = consulta.consultar('token', cnpj='11.222.333/0001-81')
+    assert (status, cache_status, payload["code"]) == (200, 'MISS', 200)
+    assert consulta.result_cache.get(cache.chave_cache('11222333000181')) is not None
@@ -0,0 +1,96 @@
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+import cadastros
+import consulta
+import singleflight
+
+
+def test_chamadas_simultaneas_compartilham_o_resultado():
+    grupo = singleflight.SingleFlight()
+    liberar = threading.Event()
+    execucoes = []
+
+    def chamar():
+        execucoes.append(1)
+        liberar.wait(5)
+        return 'resultado'
+
+    with ThreadPoolExecutor(8) as executor:
+        futuros = [executor.submit(grupo.do, 'chave', chamar)]
+        while not execucoes:
+            threading.Event().wait(0.01)
+        futuros += [executor.submit(grupo.do, 'chave', chamar) for _ in range(7)]
+        # As demais threads chegam enquanto a primeira chamada está em andamento
+        threading.Event().wait(0.1)
+        liberar.set()
+        resultados = [futuro.result() for futuro in futuros]
+    assert len(execucoes) == 1
+    assert sorted(compartilhado for _, compartilhado in resultados) == [False] + [True] * 7
+    assert {resultado for resultado, _ in resultados} == {'resultado'}
+    # Concluída a chamada, a próxima executa de novo
+    assert grupo.do('chave', lambda: 'outro') == ('outro', False)
+
+
+def test_erro_e_repassado_a_quem_aguardava():
+    grupo = singleflight.SingleFlight()
+    entrou = threading.Event()
+    liberar = threading.Event()
+
+    def falhar():
+        entrou.set()
+        liberar.wait(5)
+        raise RuntimeError('falhou')
+
+    with ThreadPoolExecutor(2) as executor:
+        lider = executor.submit(grupo.do, 'chave', falhar)
+        entrou.wait(5)
+        seguidor = executor.submit(grupo.do, 'chave', lambda: 'nunca')
+        threading.Event().wait(0.1)
+        liberar.set()
+        for futuro in (lider, seguidor):
+            with pytest.raises(RuntimeError):
+                futuro.result()
+
+
+def test_chaves_distintas_nao_esperam_umas_pelas_outras():
+    grupo = singleflight.SingleFlight()
+    liberar = threading.Event()
+    with ThreadPoolExecutor(2) as executor:
+        lento = executor.submit(grupo.do, 'a', lambda: liberar.wait(5))
+        assert grupo.do('b', lambda: 'b') == ('b', False)
+        liberar.set()
+        assert lento.result() == (True, False)
+
+
+def test_versao_assincrona_agrupa_e_sobrevive_ao_cancelamento():
+    async def cenario():
+        grupo = singleflight.AsyncSingleFlight()
+        execucoes = []
+
+        async def chamar():
+            execucoes.append(1)
+            await asyncio.sleep(0.05)
+            return 'ok'
+
+        cancelada = asyncio.ensure_future(grupo.do('chave', chamar))
+        outras = [asyncio.ensure_future(grupo.do('chave', chamar)) for _ in range(4)]
+        await asyncio.sleep(0)
+        cancelada.cancel()
+        return execucoes, await asyncio.gather(*outras)
+
+    execucoes, resultados = asyncio.run(cenario())
+    assert execucoes == [1] and resultados == ['ok'] * 4
+
+
+def test_consultas_simultaneas_fazem_uma_unica_chamada(servidor_falso, monkeypatch):
+    monkeypatch.setitem(cadastros.URLS, 'ceis', servidor_falso.url)
+    servidor_falso.config.latencia = 200
+    consulta.result_cache.clear()
+    with ThreadPoolExecutor(10) as executor:
+        resultados = list(executor.map(lambda _: consulta.consultar('t', cnpj='11.222.333/0001-81'), range(10)))
+    assert {status for _, status, _, _ in resultados} == {200}
+    assert servidor_falso.estatisticas.exportar()["chamadas"] == 1
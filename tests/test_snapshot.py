@@ -0,0 +1,212 @@
+import threading
+import time
+
+import pytest
+
+import cache
+import metricas
+import snapshot
+
+
+@pytest.fixture
+def caminho(tmp_path):
+    return str(tmp_path / 'cache.snapshot')
+
+
+def worker(caminho, maximo=1000):
+    # Cada instância faz o papel de um worker, com seu próprio cache em memória
+    return snapshot.SnapshotCache(cache.MemoryCache(), snapshot.Snapshot(caminho), intervalo=0, maximo=maximo)
+
+
+def resultado(codigo):
+    return {"code": 200, "data_count": 1, "data": [{"sancao": {"codigo": codigo}}]}
+
+
+def test_gravar_e_buscar(caminho):
+    agora = time.time()
+    entradas = [(f'cnpj:{i:014d}', resultado(str(i)), agora - 10, agora + 100) for i in range(500)]
+    entradas.append(('cnpj:expirada', resultado('x'), agora - 200, agora - 100))
+    entradas.append(('cnpj:descartada', resultado('y'), agora - 200, agora - cache.STALE_MAX - 1))
+    assert snapshot.gravar(entradas, caminho, agora) == 501
+
+    lido = snapshot.Snapshot(caminho)
+    for i in (0, 250, 499):
+        assert lido.buscar(f'cnpj:{i:014d}', agora) == (resultado(str(i)), agora - 10, agora + 100)
+    assert lido.buscar('cnpj:ausente', agora) is None
+    assert lido.buscar('cnpj:expirada', agora) is None
+    assert lido.buscar('cnpj:expirada', agora, desatualizado=True)[0] == resultado('x')
+    assert len(list(lido.entradas(agora))) == 501
+
+
+def test_arquivo_de_outro_formato_e_ignorado(caminho):
+    with open(caminho, 'wb') as f:
+        f.write(b'OUTROARQ' + b'\0' * 64)
+    assert snapshot.Snapshot(caminho).buscar('cnpj:1') is None
+    assert snapshot.Snapshot(caminho + '.ausente').buscar('cnpj:1') is None
+
+
+def test_worker_novo_inicia_aquecido(caminho):
+    antigo = worker(caminho)
+    armazenado_em = time.time() - 30
+    antigo.set('cnpj:11222333000181', resultado('A'), 3600, stored_at=armazenado_em)
+    assert antigo.salvar() == 1
+
+    novo = worker(caminho)
+    antes = metricas.CACHE_SNAPSHOT_HITS.valor()
+    assert novo.get('cnpj:11222333000181') == (resultado('A'), armazenado_em)
+    assert metricas.CACHE_SNAPSHOT_HITS.valor() == antes + 1
+    # A entrada foi copiada para a memória: a segunda busca não vai ao snapshot
+    assert novo.cache.get('cnpj:11222333000181') == (resultado('A'), armazenado_em)
+    assert novo.get('cnpj:ausente') is None
+
+
+def test_resultado_expirado_vem_do_snapshot_em_get_stale_e_expiracao(caminho):
+    antigo = worker(caminho)
+    armazenado_em = time.time() - 120
+    antigo.set('cnpj:11444777000161', resultado('B'), 60, stored_at=armazenado_em)
+    antigo.salvar()
+
+    novo = worker(caminho)
+    assert novo.get('cnpj:11444777000161') is None
+    assert novo.expiracao('cnpj:11444777000161') == armazenado_em + 60
+    assert worker(caminho).get_stale('cnpj:11444777000161') == (resultado('B'), armazenado_em)
+    assert worker(caminho).expiracao('cnpj:ausente') is None
+
+
+def test_mescla_com_o_snapshot_anterior(caminho):
+    agora = time.time()
+    primeiro, segundo = worker(caminho), worker(caminho)
+    primeiro.set('cnpj:1', resultado('antigo'), 3600, stored_at=agora - 100)
+    primeiro.set('cnpj:2', resultado('removido'), 3600, stored_at=agora - 100)
+    primeiro.salvar()
+
+    segundo.set('cnpj:1', resultado('novo'), 3600, stored_at=agora - 10)
+    segundo.set('cnpj:3', resultado('C'), 3600, stored_at=agora - 10)
+    segundo.delete('cnpj:2')
+    assert segundo.salvar() == 2
+    lido = snapshot.Snapshot(caminho)
+    assert lido.buscar('cnpj:1')[0] == resultado('novo')
+    assert lido.buscar('cnpj:2') is None
+    assert lido.buscar('cnpj:3')[0] == resultado('C')
+
+    # Um resultado mais antigo em memória não substitui o mais novo do snapshot
+    primeiro.salvar()
+    assert snapshot.Snapshot(caminho).buscar('cnpj:1')[0] == resultado('novo')
+
+    # clear descarta o conteúdo anterior; o máximo mantém os armazenados mais recentemente
+    limitado = worker(caminho, maximo=1)
+    limitado.clear()
+    limitado.set('cnpj:4', resultado('D'), 3600, stored_at=agora - 50)
+    limitado.set('cnpj:5', resultado('E'), 3600, stored_at=agora - 5)
+    assert limitado.salvar() == 1
+    assert [chave for chave, _, _, _ in snapshot.Snapshot(caminho).entradas()] == ['cnpj:5']
+
+
+def test_gravacoes_simultaneas_nao_perdem_entradas(caminho):
+    workers = [worker(caminho, maximo=10000) for _ in range(8)]
+    for i, w in enumerate(workers):
+        for j in range(200):
+            w.set(f'cnpj:{i}-{j}', resultado(f'{i}-{j}'), 3600)
+    barreira = threading.Barrier(len(workers))
+
+    def salvar(w):
+        barreira.wait()
+        assert w.salvar() is not None
+
+    threads = [threading.Thread(target=salvar, args=(w,)) for w in workers]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert len(list(snapshot.Snapshot(caminho).entradas())) == 8 * 200
+
+
+def test_sem_caminho_o_snapshot_fica_desativado():
+    memoria = cache.MemoryCache()
+    assert snapshot.aquecido(memoria, '') is memoria
+    assert snapshot.aquecido(None, 'cache.snapshot') is None
+
+
+def test_remocoes_sao_esquecidas_depois_de_gravadas(caminho):
+    agora = time.time()
+    anterior = worker(caminho)
+    anterior.set('cnpj:1', resultado('A'), 3600, stored_at=agora - 10)
+    anterior.set('cnpj:2', resultado('B'), 3600, stored_at=agora - 10)
+    anterior.salvar()
+
+    atual = worker(caminho)
+    atual.delete('cnpj:1')
+    assert atual.get('cnpj:1') is None
+    assert atual.salvar() == 1
+    assert atual._removidas == {}
+    # A entrada removida não está mais no arquivo, então não volta mesmo sem ser lembrada
+    assert atual.get('cnpj:1') is None
+    assert atual.get('cnpj:2')[0] == resultado('B')
+
+
+def test_excesso_de_remocoes_descarta_o_snapshot_anterior(caminho, monkeypatch):
+    monkeypatch.setattr(snapshot, 'MAX_REMOVIDAS', 2)
+    agora = time.time()
+    anterior = worker(caminho)
+    for i in range(4):
+        anterior.set(f'cnpj:{i}', resultado(str(i)), 3600, stored_at=agora - 10)
+    anterior.salvar()
+
+    atual = worker(caminho)
+    for i in range(3):
+        atual.delete(f'cnpj:{i}')
+    assert len(atual._removidas) <= 2
+    # Nenhuma entrada removida volta do snapshot, nem as que deixaram de ser lembradas
+    assert [atual.get(f'cnpj:{i}') for i in range(4)] == [None] * 4
+
+    atual.set('cnpj:9', resultado('9'), 3600)
+    assert atual.salvar() == 1
+    assert atual._descartado is None and atual._removidas == {}
+    assert [chave for chave, _, _, _ in snapshot.Snapshot(caminho).entradas()] == ['cnpj:9']
+
+
+def test_remocao_durante_a_gravacao_continua_lembrada(caminho, monkeypatch):
+    agora = time.time()
+    anterior = worker(caminho)
+    anterior.set('cnpj:1', resultado('A'), 3600, stored_at=agora - 10)
+    anterior.salvar()
+
+    atual = worker(caminho)
+    gravar = snapshot.gravar
+
+    def gravar_e_remover(*args):
+        atual.delete('cnpj:1')
+        return gravar(*args)
+
+    monkeypatch.setattr(snapshot, 'gravar', gravar_e_remover)
+    atual.salvar()
+    assert 'cnpj:1' in atual._removidas
+    assert atual.get('cnpj:1') is None
+
+
+def test_buscas_concorrentes_com_o_arquivo_sendo_trocado(caminho, monkeypatch):
+    monkeypatch.setattr(snapshot, '_VERIFICACAO', 0)
+    agora = time.time()
+    snapshot.gravar([('cnpj:1', resultado('A'), agora, agora + 3600)], caminho, agora)
+    lido = snapshot.Snapshot(caminho)
+    erros = []
+    parar = threading.Event()
+
+    def buscar():
+        while not parar.is_set():
+            try:
+                assert lido.buscar('cnpj:1') is not None
+            except Exception as e:
+                erros.append(e)
+                return
+
+    threads = [threading.Thread(target=buscar) for _ in range(4)]
+    for t in threads:
+        t.start()
+    for i in range(50):
+        entradas = [(f'cnpj:{j}', resultado(str(j)), agora, agora + 3600) for j in range(1, i + 2)]
+        snapshot.gravar(entradas, caminho, agora)
+    parar.set()
+    for t in threads:
+        t.join()
+    assert erros == []
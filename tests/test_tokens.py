@@ -0,0 +1,74 @@
+import pytest
+
+import resiliencia
+import tokens
+
+CONFIGURACAO = [
+    {"nome": "contrato-a", "token": "token-a", "cota": 1000},
+    {"nome": "contrato-b", "token": "token-b", "cota": 1000},
+]
+
+
+@pytest.fixture(autouse=True)
+def leitura_imediata(monkeypatch):
+    # Cada escolha lê o estado compartilhado
+    monkeypatch.setattr(tokens, 'ATUALIZAR_ESTADO', 0)
+
+
+def usados(state):
+    return dict(state.connect().execute("SELECT chave, usados FROM tokens").fetchall())
+
+
+def test_uso_fica_em_memoria_ate_a_gravacao(tmp_path):
+    state = resiliencia.SharedState(str(tmp_path / 'estado.sqlite3'))
+    pool = tokens.TokenPool(CONFIGURACAO, state, intervalo=3600)
+    for _ in range(5):
+        credencial = pool.escolher()
+        pool.registrar(credencial, 0.01, 200)
+    # Nenhuma transação no caminho da chamada
+    assert usados(state) == {}
+    assert sum(c.usados for c in pool.credenciais) == 5
+    assert pool.gravar()
+    assert sum(usados(state).values()) == 5
+    # A leitura seguinte não conta duas vezes o que acabou de ser gravado
+    pool.escolher()
+    assert sum(c.usados for c in pool.credenciais) == 5
+
+
+def test_uso_somado_entre_workers(tmp_path):
+    state = resiliencia.SharedState(str(tmp_path / 'estado.sqlite3'))
+    pool = tokens.TokenPool(CONFIGURACAO[:1], state, intervalo=3600)
+    outro = tokens.TokenPool(CONFIGURACAO[:1], resiliencia.SharedState(state.path), intervalo=3600)
+    pool.registrar(pool.escolher(), 0.01, 200)
+    outro.registrar(outro.escolher(), 0.01, 200)
+    outro.registrar(outro.escolher(), 0.01, 200)
+    pool.gravar()
+    outro.gravar()
+    pool.escolher()
+    assert pool.credenciais[0].usados == 3
+
+
+def test_retirada_gravada_na_hora(tmp_path):
+    state = resiliencia.SharedState(str(tmp_path / 'estado.sqlite3'))
+    pool = tokens.TokenPool(CONFIGURACAO, state, intervalo=3600)
+    outro = tokens.TokenPool(CONFIGURACAO, resiliencia.SharedState(state.path), intervalo=3600)
+    credencial = pool.escolher()
+    pool.registrar(credencial, 0.01, 401)
+    escolhido = outro.escolher()
+    assert escolhido.nome != credencial.nome
+    assert outro.escolher(excluir=escolhido) is None
+    assert {item["nome"]: item["motivo"] for item in outro.estado()}[credencial.nome] == 'autenticacao'
+
+
+def test_pool_funciona_sem_o_arquivo_de_estado(tmp_path):
+    # Um diretório no lugar do arquivo: o SQLite não consegue abri-lo
+    pool = tokens.TokenPool(CONFIGURACAO, resiliencia.SharedState(str(tmp_path)), intervalo=3600)
+    credencial = pool.escolher()
+    assert credencial is not None
+    pool.registrar(credencial, 0.01, 429)
+    assert not pool.gravar()
+    outra = pool.escolher()
+    assert outra is not None and outra is not credencial
+    pool.registrar(outra, 0.01, 200)
+    assert credencial.pendentes == 1 and outra.pendentes == 1
+    assert [item["ativo"] for item in pool.estado()].count(False) == 1
@@ -0,0 +1,143 @@
+import json
+import os
+import shutil
+
+import pytest
+
+import cadastros
+import consulta
+import documentos
+import triagem
+
+DOCUMENTOS = [documentos.gerar_cnpj(f'{i:08d}0001') for i in range(1, 9)]
+
+
+@pytest.fixture
+def api(servidor_falso, monkeypatch):
+    monkeypatch.setitem(cadastros.URLS, 'ceis', servidor_falso.url)
+    consulta.result_cache.clear()
+    original = consulta.consultar
+    api = type('Api', (), {'falhando': set(), 'consultados': []})()
+
+    def consultar(token, cnpj=None, cpf=None, **kwargs):
+        api.consultados.append(cnpj or cpf)
+        if (cnpj or cpf) in api.falhando:
+            return {"code": 504, "code_message": "Tempo esgotado", "errors": ["timeout"]}, 504, None, 0
+        return original(token, cnpj, cpf, **kwargs)
+
+    monkeypatch.setattr(consulta, 'consultar', consultar)
+    return api
+
+
+@pytest.fixture
+def entrada(tmp_path):
+    caminho = tmp_path / 'fornecedores.csv'
+    caminho.write_text('cnpj\n' + '\n'.join(DOCUMENTOS + ['123']) + '\n')
+    return str(caminho)
+
+
+def ler_ndjson(caminho):
+    with open(caminho, encoding='utf-8') as f:
+        return [json.loads(linha) for linha in f]
+
+
+def ultima_por_indice(linhas):
+    return {linha["indice"]: linha for linha in linhas}
+
+
+def interromper_apos(checkpoints):
+    chamadas = []
+
+    def progresso(processados, resumo):
+        chamadas.append(processados)
+        if len(chamadas) == checkpoints:
+            raise KeyboardInterrupt
+    return progresso
+
+
+def test_retoma_do_checkpoint_descartando_o_que_veio_depois(api, entrada, tmp_path):
+    saida = str(tmp_path / 'resultado.ndjson')
+    with pytest.raises(KeyboardInterrupt):
+        triagem.executar(entrada, saida, 't', concorrencia=1, intervalo=3, progresso=interromper_apos(1))
+    estado = triagem.ler_checkpoint(saida + '.checkpoint.json')
+    assert estado["processados"] == 3 and not estado["concluido"]
+    assert os.path.getsize(saida) == estado["posicao"]
+    # Linhas gravadas depois do checkpoint (ex.: queda antes do próximo) são descartadas ao retomar
+    with open(saida, 'ab') as f:
+        f.write(b'{"indice": 3, "parcial"')
+
+    api.consultados.clear()
+    resumo = triagem.executar(entrada, saida, 't', concorrencia=1, intervalo=3)
+    assert api.consultados == DOCUMENTOS[3:]
+    linhas = ler_ndjson(saida)
+    assert [linha["indice"] for linha in linhas] == list(range(9))
+    assert [linha["documento"] for linha in linhas] == DOCUMENTOS + ['123']
+    assert (resumo["total"], resumo["erros"], resumo["falhas"]) == (9, 1, 0)
+
+    # Concluída, a mesma linha de comando não consulta de novo
+    api.consultados.clear()
+    assert triagem.executar(entrada, saida, 't')["total"] == 9
+    assert api.consultados == []
+
+
+def test_saida_texto_trunca_na_posicao_do_checkpoint(tmp_path):
+    caminho = str(tmp_path / 'resultado.csv')
+    with open(caminho, 'wb') as f:
+        f.write(b'cabecalho\nlinha 1\nlinha parcial')
+    saida = triagem.SaidaTexto(caminho, 'csv', posicao=len(b'cabecalho\nlinha 1\n'))
+    saida.escrever([dict(dict.fromkeys(triagem.COLUNAS, ''), indice=2, resultado={"code": 200})])
+    assert saida.sincronizar() == os.path.getsize(caminho)
+    saida.fechar()
+    with open(caminho, encoding='utf-8') as f:
+        linhas = f.read().splitlines()
+    assert linhas[:2] == ['cabecalho', 'linha 1']
+    assert len(linhas) == 3 and linhas[2].startswith('2,')
+
+    with pytest.raises(RuntimeError, match='--reiniciar'):
+        triagem.SaidaTexto(str(tmp_path / 'removido.csv'), 'csv', posicao=10)
+
+
+def test_falhas_sao_consultadas_de_novo_ao_retomar(api, entrada, tmp_path):
+    saida = str(tmp_path / 'resultado.ndjson')
+    api.falhando = {DOCUMENTOS[1], DOCUMENTOS[4]}
+    resumo = triagem.executar(entrada, saida, 't', concorrencia=2)
+    assert (resumo["erros"], resumo["falhas"]) == (3, 2)
+    estado = triagem.ler_checkpoint(saida + '.checkpoint.json')
+    assert estado["concluido"]
+    # O documento inválido (400) não é repetido
+    assert estado["falhas"] == [[1, DOCUMENTOS[1]], [4, DOCUMENTOS[4]]]
+
+    api.falhando = {DOCUMENTOS[4]}
+    api.consultados.clear()
+    resumo = triagem.executar(entrada, saida, 't')
+    assert api.consultados == [DOCUMENTOS[1], DOCUMENTOS[4]]
+    assert (resumo["total"], resumo["erros"], resumo["falhas"]) == (9, 2, 1)
+
+    api.falhando = set()
+    api.consultados.clear()
+    resumo = triagem.executar(entrada, saida, 't')
+    assert api.consultados == [DOCUMENTOS[4]]
+    assert (resumo["total"], resumo["erros"], resumo["falhas"]) == (9, 1, 0)
+
+    # A linha mais recente de cada indice prevalece
+    linhas = ultima_por_indice(ler_ndjson(saida))
+    assert sorted(linhas) == list(range(9))
+    assert [linhas[i]["status"] for i in range(9)] == [200] * 8 + [400]
+
+
+def test_parquet_grava_uma_parte_por_checkpoint(api, entrada, tmp_path):
+    pytest.importorskip('pyarrow')
+    import pyarrow.parquet
+
+    saida = str(tmp_path / 'resultado.parquet')
+    with pytest.raises(KeyboardInterrupt):
+        triagem.executar(entrada, saida, 't', concorrencia=1, intervalo=3, progresso=interromper_apos(2))
+    assert sorted(os.listdir(saida)) == ['part-00000.parquet', 'part-00001.parquet']
+    # Uma parte gravada depois do último checkpoint é descartada ao retomar
+    shutil.copy(os.path.join(saida, 'part-00001.parquet'), os.path.join(saida, 'part-00002.parquet'))
+
+    triagem.executar(entrada, saida, 't', concorrencia=1, intervalo=3)
+    assert sorted(os.listdir(saida)) == ['part-00000.parquet', 'part-00001.parquet', 'part-00002.parquet']
+    tabela = pyarrow.parquet.read_table(saida)
+    assert tabela.column('indice').to_pylist() == list(range(9))
+    assert tabela.column('documento').to_pylist() == DOCUMENTOS + ['123']
@@ -0,0 +1,57 @@
+import time
+
+import pytest
+import requests
+
+import upstream
+
+
+def chamadas(servidor):
+    return servidor.estatisticas.exportar()["chamadas"]
+
+
+def test_sessao_reaproveita_conexao(servidor_falso):
+    sessao = upstream.criar_sessao(pool_size=1)
+    for documento in ('11222333000181', '11444777000161'):
+        response = sessao.post(servidor_falso.url, data={"cnpj": documento, "token": "t"}, timeout=5)
+        assert response.status_code == 200
+        assert response.json()["header"]["parameters"] == {"cnpj": documento}
+    adapter = sessao.get_adapter(servidor_falso.url)
+    pool = adapter.poolmanager.connection_from_url(servidor_falso.url)
+    assert pool.num_connections == 1
+    assert chamadas(servidor_falso) == 2
+
+
+@pytest.mark.parametrize('status', [500, 502, 503, 504])
+def test_resposta_5xx_nao_e_repetida(servidor_falso, status):
+    # Um POST cobrado que a API pode já ter processado nunca é reenviado
+    servidor_falso.config.erros = 1.0
+    servidor_falso.config.status_erro = status
+    sessao = upstream.criar_sessao(retries=3, backoff_factor=0)
+    response = sessao.post(servidor_falso.url, data={"cnpj": "11222333000181"}, timeout=5)
+    assert response.status_code == status
+    assert chamadas(servidor_falso) == 1
+
+
+def test_timeout_de_leitura_nao_e_repetido(servidor_falso):
+    servidor_falso.config.latencia = 500
+    sessao = upstream.criar_sessao(retries=3, backoff_factor=0)
+    with pytest.raises(requests.exceptions.ReadTimeout):
+        sessao.post(servidor_falso.url, data={"cnpj": "11222333000181"}, timeout=(5, 0.1))
+    # O servidor só contabiliza a chamada ao terminar de responder
+    time.sleep(0.6)
+    assert chamadas(servidor_falso) == 1
+
+
+def test_erro_de_conexao_e_repetido(monkeypatch):
+    tentativas = []
+
+    def recusar(endereco, *args, **kwargs):
+        tentativas.append(endereco)
+        raise ConnectionRefusedError("recusada")
+
+    monkeypatch.setattr('urllib3.util.connection.create_connection', recusar)
+    sessao = upstream.criar_sessao(retries=2, backoff_factor=0)
+    with pytest.raises(requests.exceptions.ConnectionError):
+        sessao.post('http://127.0.0.1:9/', data={"cnpj": "11222333000181"}, timeout=1)
+    assert len(tentativas) == 3
@@ -0,0 +1,380 @@
+"""
+Pool de tokens da API da Infosimples mantido pelo servidor
+
+Com tokens configurados, as consultas podem ser feitas sem token no
+formulário: cada chamada usa o token com mais cota restante e menor
+latência recente, distribuindo a carga entre vários contratos. O uso de
+cada token é contado no arquivo de estado compartilhado entre os workers,
+e tokens recusados pela API (autenticação ou cota) são retirados do pool.
+
+O uso é acumulado em memória e gravado no arquivo por uma thread de cada
+worker a cada CEIS_TOKEN_GRAVACAO segundos, fora do caminho da chamada;
+retiradas são gravadas na hora. Se o arquivo não puder ser usado, o worker
+segue com o uso e as retiradas que conhece.
+
+Configuração:
+    CEIS_TOKENS=token1,token2
+    CEIS_TOKENS_FILE=tokens.json  # [{"nome": "contrato-a", "token": "...", "cota": 100000}]
+
+Uso:
+    python tokens.py estado
+    python tokens.py reativar contrato-a
+"""
+import argparse
+import atexit
+import hashlib
+import json
+import os
+import sqlite3
+import sys
+import threading
+import time
+
+import metricas
+import resiliencia
+
+# Tokens separados por vírgula e/ou arquivo JSON com nome, token e cota de cada um
+TOKENS = os.environ.get('CEIS_TOKENS', '')
+TOKENS_FILE = os.environ.get('CEIS_TOKENS_FILE', '')
+
+# Cota mensal padrão de chamadas por token (0 = sem limite)
+COTA = int(os.environ.get('CEIS_TOKEN_COTA', 0))
+
+# Códigos (status HTTP ou code da Infosimples) que retiram o token do pool:
+# falhas de autenticação/permissão em definitivo e cota esgotada por um período
+CODIGOS_AUTENTICACAO = {int(c) for c in os.environ.get('CEIS_TOKEN_CODIGOS_AUTENTICACAO', '401,403,601,603').split(',') if c.strip()}
+CODIGOS_COTA = {int(c) for c in os.environ.get('CEIS_TOKEN_CODIGOS_COTA', '402,429').split(',') if c.strip()}
+
+# Segundos até um token com cota esgotada voltar ao pool
+QUARENTENA = float(os.environ.get('CEIS_TOKEN_QUARENTENA', 3600))
+
+# Intervalo, em segundos, entre as gravações do uso dos tokens no estado compartilhado (0 grava a cada chamada)
+GRAVACAO_INTERVAL = float(os.environ.get('CEIS_TOKEN_GRAVACAO', 1.0))
+
+# Peso das chamadas recentes na média de latência de cada token
+PESO_LATENCIA = 0.2
+
+# Intervalo, em segundos, entre leituras do uso compartilhado dos tokens
+ATUALIZAR_ESTADO = 1.0
+
+
+def carregar_configuracao(tokens=TOKENS, arquivo=TOKENS_FILE, cota=COTA):
+    """
+    Lê os tokens configurados, retornando uma lista de {nome, token, cota}
+    """
+    configurados = []
+    if arquivo:
+        with open(arquivo, encoding='utf-8') as f:
+            for item in json.load(f):
+                if isinstance(item, str):
+                    item = {"token": item}
+                configurados.append(item)
+    configurados.extend({"token": token.strip()} for token in tokens.split(',') if token.strip())
+
+    vistos = set()
+    resultado = []
+    for item in configurados:
+        token = item["token"]
+        if token in vistos:
+            continue
+        vistos.add(token)
+        chave = hashlib.sha256(token.encode('utf-8')).hexdigest()
+        resultado.append({
+            # O nome identifica o token nas métricas e no estado, sem expor o token
+            "nome": item.get("nome") or f"token-{chave[:8]}",
+            "token": token,
+            "cota": int(item.get("cota", cota) or 0)
+        })
+    return resultado
+
+
+class Credencial:
+    """
+    Token do pool com suas estatísticas neste worker
+    """
+
+    def __init__(self, nome, token, cota):
+        self.nome = nome
+        self.token = token
+        self.cota = cota
+        self.chave = hashlib.sha256(token.encode('utf-8')).hexdigest()
+        self.latencia = None
+        self.em_andamento = 0
+        self.usados = 0
+        self.desativado_ate = 0.0
+        self.motivo = None
+        # Chamadas e retirada ainda não gravadas no estado compartilhado
+        self.pendentes = 0
+        self.retirada = None
+
+
+class TokenPool:
+    """
+    Seleção de tokens por cota restante e latência, com uso compartilhado entre os workers
+    """
+
+    def __init__(self, configuracao=None, state=None, quarentena=QUARENTENA, intervalo=GRAVACAO_INTERVAL):
+        configuracao = carregar_configuracao() if configuracao is None else configuracao
+        self.credenciais = [Credencial(c["nome"], c["token"], c["cota"]) for c in configuracao]
+        self.state = state or resiliencia.SharedState()
+        self.quarentena = quarentena
+        self.intervalo = intervalo
+        self._lock = threading.Lock()
+        self._lido_em = 0.0
+        self._pid = None
+
+    def __bool__(self):
+        return bool(self.credenciais)
+
+    def iniciar(self):
+        """
+        Inicia a thread de gravação do uso neste processo (recriada após um fork)
+        """
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            if self._pid is not None:
+                # O uso pendente herdado do processo pai é gravado por ele
+                for credencial in self.credenciais:
+                    credencial.pendentes = 0
+                    credencial.retirada = None
+            self._pid = os.getpid()
+            if self.intervalo > 0:
+                threading.Thread(target=self._loop, daemon=True).start()
+            atexit.register(self.gravar)
+
+    def _periodo(self):
+        # As cotas são mensais
+        return time.strftime('%Y-%m')
+
+    def _conexao(self):
+        conn = self.state.connect()
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS tokens ("
+            " chave TEXT PRIMARY KEY,"
+            " periodo TEXT NOT NULL,"
+            " usados INTEGER NOT NULL,"
+            " desativado_ate REAL NOT NULL,"
+            " motivo TEXT)"
+        )
+        return conn
+
+    def _atualizar_estado(self):
+        """
+        Lê o uso e as retiradas registrados por todos os workers (no máximo uma vez por segundo)
+        """
+        agora = time.monotonic()
+        if agora - self._lido_em < ATUALIZAR_ESTADO:
+            return
+        self._lido_em = agora
+        if not self.state.disponivel():
+            return
+        try:
+            rows = self._conexao().execute("SELECT chave, periodo, usados, desativado_ate, motivo FROM tokens").fetchall()
+        except sqlite3.Error as e:
+            # Sem o arquivo de estado, valem o uso e as retiradas conhecidos pelo worker
+            self.state.falhou(e)
+            return
+        estado = {chave: (periodo, usados, desativado_ate, motivo) for chave, periodo, usados, desativado_ate, motivo in rows}
+        periodo_atual = self._periodo()
+        for credencial in self.credenciais:
+            periodo, usados, desativado_ate, motivo = estado.get(credencial.chave, (periodo_atual, 0, 0.0, None))
+            # As chamadas deste worker ainda não gravadas somam-se às já gravadas
+            credencial.usados = (usados if periodo == periodo_atual else 0) + credencial.pendentes
+            if credencial.retirada is None:
+                credencial.desativado_ate = desativado_ate
+                credencial.motivo = motivo
+
+    def escolher(self, excluir=None):
+        """
+        Reserva o token com a melhor relação entre cota restante e latência recente
+
+        Retorna None se nenhum token estiver disponível (além de excluir, se
+        informado). O token escolhido deve ser liberado com registrar() após a chamada.
+        """
+        with self._lock:
+            self._atualizar_estado()
+            agora = time.time()
+            melhor, melhor_nota = None, None
+            for credencial in self.credenciais:
+                if credencial is excluir or credencial.desativado_ate > agora:
+                    continue
+                if credencial.cota:
+                    restante = (credencial.cota - credencial.usados) / credencial.cota
+                    if restante <= 0:
+                        continue
+                else:
+                    restante = 1.0
+                # Tokens ainda sem medição são experimentados primeiro
+                latencia = credencial.latencia if credencial.latencia is not None else 0.001
+                nota = restante / (latencia * (1 + credencial.em_andamento))
+                if melhor_nota is None or nota > melhor_nota:
+                    melhor, melhor_nota = credencial, nota
+            if melhor is not None:
+                melhor.em_andamento += 1
+            return melhor
+
+    def reservar(self, credencial):
+        """
+        Reserva novamente um token já em uso, para uma chamada simultânea com o mesmo token
+        """
+        with self._lock:
+            credencial.em_andamento += 1
+        return credencial
+
+    def liberar(self, credencial):
+        """
+        Libera um token reservado que não chegou a ser usado
+        """
+        with self._lock:
+            credencial.em_andamento -= 1
+
+    def registrar(self, credencial, duracao, status_http, codigo=None):
+        """
+        Libera o token após uma chamada, atualizando latência, uso e retiradas
+
+        status_http é None quando a chamada falhou sem resposta; codigo é o
+        "code" da resposta da Infosimples, quando houver. O uso só é gravado no
+        estado compartilhado pela thread de gravação; retiradas, na hora.
+        """
+        self.iniciar()
+        motivo, desativado_ate = None, 0.0
+        if status_http in CODIGOS_AUTENTICACAO or codigo in CODIGOS_AUTENTICACAO:
+            motivo, desativado_ate = 'autenticacao', float('inf')
+        elif status_http in CODIGOS_COTA or codigo in CODIGOS_COTA:
+            motivo, desativado_ate = 'cota', time.time() + self.quarentena
+
+        metricas.TOKEN_CALLS.inc(token=credencial.nome, resultado=motivo or ('erro' if status_http is None or status_http >= 500 else 'ok'))
+
+        with self._lock:
+            credencial.em_andamento -= 1
+            if credencial.latencia is None:
+                credencial.latencia = duracao
+            else:
+                credencial.latencia += PESO_LATENCIA * (duracao - credencial.latencia)
+            credencial.usados += 1
+            credencial.pendentes += 1
+            if motivo:
+                credencial.desativado_ate = desativado_ate
+                credencial.motivo = motivo
+                credencial.retirada = (motivo, desativado_ate)
+
+        if motivo:
+            metricas.TOKEN_REMOVALS.inc(token=credencial.nome, motivo=motivo)
+        if motivo or self.intervalo <= 0:
+            # Os demais workers deixam de usar o token retirado na próxima leitura do estado
+            self.gravar()
+
+    def gravar(self):
+        """
+        Grava no estado compartilhado o uso e as retiradas acumulados neste worker
+
+        Retorna False se o arquivo de estado não pôde ser usado; nesse caso o
+        uso continua pendente e é gravado na próxima vez.
+        """
+        with self._lock:
+            pendentes = [(c, c.pendentes, c.retirada) for c in self.credenciais if c.pendentes or c.retirada]
+        if not pendentes:
+            return True
+        if not self.state.disponivel():
+            return False
+        periodo = self._periodo()
+        try:
+            self._conexao()
+            conn = self.state.transacao()
+            try:
+                for credencial, chamadas, retirada in pendentes:
+                    conn.execute(
+                        "INSERT INTO tokens (chave, periodo, usados, desativado_ate, motivo) VALUES (?, ?, ?, 0, NULL)"
+                        " ON CONFLICT (chave) DO UPDATE SET"
+                        " usados = CASE WHEN periodo = excluded.periodo THEN usados + excluded.usados ELSE excluded.usados END,"
+                        " periodo = excluded.periodo",
+                        (credencial.chave, periodo, chamadas)
+                    )
+                    if retirada:
+                        conn.execute(
+                            "UPDATE tokens SET desativado_ate = ?, motivo = ? WHERE chave = ?",
+                            (retirada[1], retirada[0], credencial.chave)
+                        )
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+        except sqlite3.Error as e:
+            self.state.falhou(e)
+            return False
+
+        with self._lock:
+            for credencial, chamadas, retirada in pendentes:
+                credencial.pendentes -= chamadas
+                if credencial.retirada is retirada:
+                    credencial.retirada = None
+        return True
+
+    def _loop(self):
+        while True:
+            time.sleep(self.intervalo)
+            self.gravar()
+
+    def reativar(self, nome):
+        """
+        Devolve ao pool um token retirado (ex.: após renovar o contrato)
+
+        Retorna False se não houver token com esse nome.
+        """
+        for credencial in self.credenciais:
+            if credencial.nome == nome:
+                conn = self._conexao()
+                conn.execute("UPDATE tokens SET desativado_ate = 0, motivo = NULL WHERE chave = ?", (credencial.chave,))
+                with self._lock:
+                    credencial.desativado_ate = 0.0
+                    credencial.motivo = None
+                    credencial.retirada = None
+                return True
+        return False
+
+    def estado(self):
+        """
+        Situação de cada token (sem o valor do token), para métricas e diagnóstico
+        """
+        with self._lock:
+            self._atualizar_estado()
+            agora = time.time()
+            return [{
+                "nome": c.nome,
+                "ativo": c.desativado_ate <= agora,
+                "motivo": c.motivo if c.desativado_ate > agora else None,
+                "cota": c.cota,
+                "usados": c.usados,
+                "latencia_ms": round(c.latencia * 1000, 1) if c.latencia is not None else None,
+                "em_andamento": c.em_andamento
+            } for c in self.credenciais]
+
+
+def main(argv=None):
+    """
+    Linha de comando para acompanhar e reativar os tokens do servidor
+    """
+    parser = argparse.ArgumentParser(description="Pool de tokens da API")
+    sub = parser.add_subparsers(dest='comando', required=True)
+    sub.add_parser('estado', help="Lista os tokens configurados, com uso no mês e situação")
+    cmd = sub.add_parser('reativar', help="Devolve ao pool um token retirado")
+    cmd.add_argument('nome', help="Nome do token (como listado em estado)")
+    args = parser.parse_args(argv)
+
+    pool = TokenPool()
+    if args.comando == 'reativar':
+        if not pool.reativar(args.nome):
+            print(f"Token não configurado: {args.nome}", file=sys.stderr)
+            return 1
+        return 0
+
+    for item in pool.estado():
+        print(json.dumps(item, ensure_ascii=False))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
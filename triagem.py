@@ -0,0 +1,443 @@
+"""
+Triagem em lote pela linha de comando
+
+Consulta os documentos de um arquivo CSV ou planilha Excel sem passar pelo
+servidor web, usando o mesmo núcleo de consulta dos endpoints (cache,
+agrupamento de chamadas, limite de taxa, histórico). O arquivo é lido aos
+poucos e os resultados são gravados na ordem da entrada, em CSV, NDJSON ou
+Parquet, à medida que ficam prontos.
+
+O progresso é salvo periodicamente em um checkpoint: se a execução for
+interrompida, a mesma linha de comando retoma a partir do último checkpoint,
+sem consultar de novo (nem gastar créditos com) os documentos já gravados.
+Documentos cuja consulta falhou (erro da API, limite de taxa, tempo esgotado)
+ficam registrados à parte no checkpoint e são consultados de novo ao retomar;
+a nova linha, com o mesmo indice, substitui a anterior.
+
+Uso:
+    consulta-ceis triagem fornecedores.csv resultado.csv --concorrencia 16 --taxa 10
+    python triagem.py fornecedores.xlsx resultado.parquet
+"""
+import argparse
+import csv
+import io
+import itertools
+import json
+import os
+import sys
+import time
+
+import auditoria
+import consulta
+import documentos
+import lote
+import projecao
+import serializacao
+
+try:
+    import openpyxl
+except ImportError:  # Necessário apenas para planilhas Excel
+    openpyxl = None
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:  # Necessário apenas para a saída em Parquet
+    pyarrow = None
+
+FORMATOS = ('csv', 'ndjson', 'parquet')
+
+# Colunas da saída em CSV e Parquet
+COLUNAS = ('indice', 'documento', 'tipo', 'status', 'cache', 'idade', 'situacao', 'data_count', 'erros', 'resultado')
+
+# Versão do formato do checkpoint
+VERSAO_CHECKPOINT = 2
+
+
+def ler_planilha(caminho):
+    """
+    Lê os documentos da primeira aba de uma planilha Excel (.xlsx)
+
+    Usa a mesma regra do CSV: a coluna de documento reconhecida no cabeçalho
+    ou, sem cabeçalho, a primeira coluna. A planilha é lida linha a linha.
+    """
+    if openpyxl is None:
+        raise RuntimeError("A leitura de planilhas Excel requer o pacote openpyxl: pip install consulta-ceis[excel]")
+    planilha = openpyxl.load_workbook(caminho, read_only=True, data_only=True)
+    try:
+        coluna = 0
+        for n, linha in enumerate(planilha.worksheets[0].iter_rows(values_only=True)):
+            valores = ['' if valor is None else valor for valor in linha]
+            if not any(str(valor).strip() for valor in valores):
+                continue
+            if n == 0 and not any(ch.isdigit() for ch in ''.join(str(valor) for valor in valores)):
+                cabecalho = [str(valor).strip().lower() for valor in valores]
+                for nome in lote.CSV_COLUMNS:
+                    if nome in cabecalho:
+                        coluna = cabecalho.index(nome)
+                        break
+                continue
+            if coluna < len(valores) and str(valores[coluna]).strip():
+                yield _celula(valores[coluna])
+    finally:
+        planilha.close()
+
+
+def _celula(valor):
+    # Documentos digitados como número perdem os zeros à esquerda na planilha
+    if isinstance(valor, (int, float)):
+        texto = str(int(valor))
+        cpf = texto.zfill(11)
+        return cpf if len(texto) <= 11 and documentos.cpf_valido(cpf) else texto.zfill(14)
+    return str(valor).strip()
+
+
+def ler_entrada(caminho):
+    """
+    Gera os documentos do arquivo de entrada (CSV ou .xlsx)
+    """
+    if caminho.lower().endswith(('.xlsx', '.xlsm')):
+        yield from ler_planilha(caminho)
+    else:
+        with open(caminho, 'rb') as f:
+            yield from lote.ler_csv(f)
+
+
+def preparar(valores, pular=0, tamanho=1000):
+    """
+    Classifica os documentos em blocos, mantendo uma linha de saída por linha de entrada
+
+    As pular primeiras linhas (já gravadas em uma execução anterior) são descartadas.
+    """
+    bloco = []
+    for n, valor in enumerate(valores):
+        if n < pular:
+            continue
+        bloco.append(str(valor).strip())
+        if len(bloco) >= tamanho:
+            yield from _classificar(bloco)
+            bloco = []
+    yield from _classificar(bloco)
+
+
+def _classificar(bloco):
+    for valor, (tipo, documento) in zip(bloco, documentos.classificar_lista(bloco)):
+        yield valor, tipo, documento
+
+
+def falhou(item):
+    """
+    Indica se a consulta falhou por um motivo passageiro e deve ser repetida ao retomar
+
+    Documentos inválidos (400) não são repetidos: a nova consulta teria o mesmo resultado.
+    """
+    return item["status"] == 429 or item["status"] >= 500
+
+
+def linha_de(indice, item, apresentar=None):
+    """
+    Converte o resultado de um documento em uma linha da saída
+    """
+    resultado = item["resultado"]
+    if apresentar is not None:
+        resultado = apresentar(resultado)
+    return {
+        "indice": indice,
+        "documento": item["documento"],
+        "tipo": item.get("tipo"),
+        "status": item["status"],
+        "cache": item["cache"],
+        "idade": item.get("idade"),
+        "situacao": auditoria.situacao_de(item["resultado"], item["status"]),
+        "data_count": item["resultado"].get("data_count"),
+        "erros": '; '.join(str(erro) for erro in item["resultado"].get("errors") or []),
+        "resultado": resultado
+    }
+
+
+class SaidaTexto:
+    """
+    Saída em CSV ou NDJSON, gravada em um único arquivo
+
+    A posição do checkpoint é o tamanho do arquivo: ao retomar, o que foi
+    gravado depois do último checkpoint é descartado.
+    """
+
+    def __init__(self, caminho, formato, posicao=0):
+        self.formato = formato
+        if posicao and not os.path.exists(caminho):
+            raise RuntimeError(f"O arquivo de saída {caminho} não existe mais; use --reiniciar")
+        if posicao:
+            with open(caminho, 'r+b') as f:
+                f.truncate(posicao)
+            self.arquivo = open(caminho, 'ab')
+        else:
+            self.arquivo = open(caminho, 'wb')
+        if formato == 'csv' and self.arquivo.tell() == 0:
+            self._escrever_csv([dict(zip(COLUNAS, COLUNAS))])
+
+    def _escrever_csv(self, linhas):
+        texto = io.StringIO()
+        escritor = csv.DictWriter(texto, COLUNAS, lineterminator='\n')
+        escritor.writerows(linhas)
+        self.arquivo.write(texto.getvalue().encode('utf-8'))
+
+    def escrever(self, linhas):
+        if self.formato == 'csv':
+            self._escrever_csv([
+                dict(linha, resultado=serializacao.dumps(linha["resultado"]).decode('utf-8')) for linha in linhas
+            ])
+        else:
+            self.arquivo.write(b''.join(serializacao.dumps(linha) + b'\n' for linha in linhas))
+
+    def sincronizar(self):
+        """
+        Garante que o que foi gravado está em disco e retorna a posição para o checkpoint
+        """
+        self.arquivo.flush()
+        os.fsync(self.arquivo.fileno())
+        return self.arquivo.tell()
+
+    def fechar(self):
+        self.arquivo.close()
+
+
+class SaidaParquet:
+    """
+    Saída em Parquet: uma pasta com um arquivo por checkpoint (part-00000.parquet, ...)
+
+    Arquivos Parquet não aceitam acréscimos depois de fechados; a pasta é lida
+    como um único conjunto de dados (ex.: pandas.read_parquet("resultado.parquet")).
+    A posição do checkpoint é a quantidade de partes gravadas.
+    """
+
+    def __init__(self, caminho, formato='parquet', posicao=0):
+        if pyarrow is None:
+            raise RuntimeError("A saída em Parquet requer o pacote pyarrow: pip install consulta-ceis[parquet]")
+        self.caminho = caminho
+        self.partes = posicao
+        self.schema = pyarrow.schema([
+            ('indice', pyarrow.int64()), ('documento', pyarrow.string()), ('tipo', pyarrow.string()),
+            ('status', pyarrow.int32()), ('cache', pyarrow.string()), ('idade', pyarrow.int64()),
+            ('situacao', pyarrow.string()), ('data_count', pyarrow.int64()), ('erros', pyarrow.string()),
+            ('resultado', pyarrow.string())
+        ])
+        self._linhas = []
+        os.makedirs(caminho, exist_ok=True)
+        # Partes gravadas depois do último checkpoint são descartadas
+        for nome in os.listdir(caminho):
+            if nome.startswith('part-') and nome.endswith('.parquet') and int(nome[5:-8]) >= posicao:
+                os.remove(os.path.join(caminho, nome))
+
+    def escrever(self, linhas):
+        self._linhas.extend(
+            dict(linha, resultado=serializacao.dumps(linha["resultado"]).decode('utf-8')) for linha in linhas
+        )
+
+    def sincronizar(self):
+        if self._linhas:
+            tabela = pyarrow.Table.from_pylist(self._linhas, schema=self.schema)
+            temporario = os.path.join(self.caminho, f'.part-{self.partes:05d}.parquet.tmp')
+            pyarrow.parquet.write_table(tabela, temporario)
+            os.replace(temporario, os.path.join(self.caminho, f'part-{self.partes:05d}.parquet'))
+            self.partes += 1
+            self._linhas = []
+        return self.partes
+
+    def fechar(self):
+        self.sincronizar()
+
+
+def identificar_entrada(caminho):
+    """
+    Identificação do arquivo de entrada, para detectar mudanças antes de retomar
+    """
+    info = os.stat(caminho)
+    return {"caminho": os.path.abspath(caminho), "tamanho": info.st_size, "modificado_em": info.st_mtime}
+
+
+def ler_checkpoint(caminho):
+    if not os.path.exists(caminho):
+        return None
+    with open(caminho, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def gravar_checkpoint(caminho, dados):
+    # Gravação atômica: um checkpoint interrompido não corrompe o anterior
+    temporario = caminho + '.tmp'
+    with open(temporario, 'w', encoding='utf-8') as f:
+        json.dump(dados, f, ensure_ascii=False)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temporario, caminho)
+
+
+def formato_de(caminho, formato=None):
+    if formato:
+        return formato
+    extensao = os.path.splitext(caminho)[1].lower().lstrip('.')
+    return {'jsonl': 'ndjson', 'pq': 'parquet'}.get(extensao, extensao if extensao in FORMATOS else 'csv')
+
+
+def executar(entrada, saida, token=None, formato=None, concorrencia=lote.CONCURRENCY, taxa=lote.RATE,
+             checkpoint=None, intervalo=500, reiniciar=False, apresentar=None, progresso=None):
+    """
+    Executa (ou retoma) a triagem de um arquivo e retorna o resumo
+
+    intervalo é a quantidade de linhas gravadas entre checkpoints (além de
+    um checkpoint a cada 5 s). progresso, se informado, é chamado com o
+    resumo parcial a cada checkpoint.
+
+    Ao retomar, os documentos que falharam são consultados antes das linhas
+    restantes da entrada, inclusive se a execução anterior já tiver terminado;
+    suas novas linhas são acrescentadas à saída com o indice original. O
+    resumo informa em "falhas" quantos documentos ainda falharam.
+    """
+    formato = formato_de(saida, formato)
+    checkpoint = checkpoint or saida + '.checkpoint.json'
+    identificacao = identificar_entrada(entrada)
+
+    estado = None if reiniciar else ler_checkpoint(checkpoint)
+    if estado is not None:
+        if estado.get("versao") != VERSAO_CHECKPOINT or estado.get("formato") != formato:
+            raise RuntimeError(f"O checkpoint {checkpoint} é de outra versão ou formato; use --reiniciar")
+        if estado.get("entrada") != identificacao:
+            raise RuntimeError(f"O arquivo de entrada mudou desde o checkpoint {checkpoint}; use --reiniciar")
+        if estado.get("concluido") and not estado["falhas"]:
+            return estado["resumo"]
+    else:
+        estado = {
+            "versao": VERSAO_CHECKPOINT,
+            "entrada": identificacao,
+            "formato": formato,
+            "processados": 0,
+            "posicao": 0,
+            # [indice, documento] das consultas que falharam, repetidas ao retomar
+            "falhas": [],
+            "concluido": False,
+            "resumo": {}
+        }
+
+    resumo = lote.Resumo()
+    for campo in ('total', 'sancionados', 'sem_sancao', 'erros', 'cache_hits'):
+        setattr(resumo, campo, estado["resumo"].get(campo, 0))
+    resumo.inicio -= estado["resumo"].get("duracao_ms", 0) / 1000
+
+    classe = SaidaParquet if formato == 'parquet' else SaidaTexto
+    destino = classe(saida, formato, estado["posicao"])
+    inicial = estado["processados"]
+    retentar = estado["falhas"]
+    novas_falhas = []
+
+    def salvar(concluido=False):
+        estado["posicao"] = destino.sincronizar()
+        estado["processados"] = inicial + max(proximo - len(retentar), 0)
+        estado["falhas"] = retentar[proximo:] + novas_falhas
+        estado["concluido"] = concluido
+        estado["resumo"] = dict(resumo.como_dict(), falhas=len(estado["falhas"]))
+        gravar_checkpoint(checkpoint, estado)
+        if progresso is not None:
+            progresso(estado["processados"], estado["resumo"])
+
+    # As falhas anteriores são consultadas primeiro, seguidas das linhas ainda não gravadas
+    valores = itertools.chain(
+        (documento for _, documento in retentar),
+        itertools.islice(ler_entrada(entrada), inicial, None)
+    )
+
+    # Os resultados chegam fora de ordem; são gravados na ordem da entrada
+    prontos = {}
+    proximo = 0
+    gravados = 0
+    ultimo_checkpoint = time.monotonic()
+    try:
+        itens = lote.executar(token, preparar(valores), concorrencia, taxa)
+        for indice, item in itens:
+            prontos[indice] = item
+            linhas = []
+            while proximo in prontos:
+                item = prontos.pop(proximo)
+                if proximo < len(retentar):
+                    numero = retentar[proximo][0]
+                    # A falha anterior já foi contada no resumo
+                    resumo.total -= 1
+                    resumo.erros -= 1
+                else:
+                    numero = inicial + proximo - len(retentar)
+                resumo.adicionar(item)
+                if falhou(item):
+                    novas_falhas.append([numero, item["documento"]])
+                linhas.append(linha_de(numero, item, apresentar))
+                proximo += 1
+            if linhas:
+                destino.escrever(linhas)
+            if proximo - gravados >= intervalo or time.monotonic() - ultimo_checkpoint > 5:
+                salvar()
+                gravados = proximo
+                ultimo_checkpoint = time.monotonic()
+        salvar(concluido=True)
+    except KeyboardInterrupt:
+        # Grava o que já está pronto, para retomar depois deste ponto
+        salvar()
+        raise
+    finally:
+        destino.fechar()
+    return estado["resumo"]
+
+
+def main(argv=None):
+    """
+    Linha de comando da triagem em lote
+    """
+    parser = argparse.ArgumentParser(
+        prog='consulta-ceis triagem',
+        description="Triagem em lote de CNPJs/CPFs a partir de um arquivo CSV ou Excel"
+    )
+    parser.add_argument('entrada', help="Arquivo CSV ou .xlsx com os documentos")
+    parser.add_argument('saida', help="Arquivo de saída (.csv, .ndjson ou .parquet)")
+    parser.add_argument('--formato', choices=FORMATOS, help="Formato da saída (padrão: pela extensão)")
+    parser.add_argument('--token', default=os.environ.get('CEIS_TOKEN'),
+                        help="Token da API (padrão: CEIS_TOKEN; dispensado com CEIS_TOKENS)")
+    parser.add_argument('--concorrencia', type=int, default=lote.CONCURRENCY, help="Consultas simultâneas (padrão: %(default)s)")
+    parser.add_argument('--taxa', type=float, default=lote.RATE,
+                        help="Limite de chamadas à API por segundo (padrão: %(default)s; 0 desativa)")
+    parser.add_argument('--checkpoint', help="Arquivo de checkpoint (padrão: <saida>.checkpoint.json)")
+    parser.add_argument('--intervalo', type=int, default=500, help="Linhas gravadas entre checkpoints (padrão: %(default)s)")
+    parser.add_argument('--reiniciar', action='store_true', help="Ignora o checkpoint e começa do início")
+    parser.add_argument('--modo', help="completo (padrão), veredito ou resumo")
+    parser.add_argument('--fields', help="Campos do resultado, separados por vírgula")
+    args = parser.parse_args(argv)
+
+    if not args.token and not consulta.pool:
+        parser.error("informe o token da API (--token ou CEIS_TOKEN) ou configure CEIS_TOKENS")
+    apresentacao, erro = projecao.ler_parametros(args.modo, args.fields)
+    if erro:
+        parser.error(erro[0]["errors"][0])
+    modo, caminhos = apresentacao
+    apresentar = None if modo == 'completo' and not caminhos else (lambda payload: projecao.aplicar(payload, modo, caminhos))
+
+    def progresso(processados, resumo):
+        print(f"{processados} documentos ({resumo['sancionados']} sancionados, {resumo['erros']} erros)",
+              file=sys.stderr, flush=True)
+
+    try:
+        resumo = executar(
+            args.entrada, args.saida, args.token, args.formato, args.concorrencia, args.taxa,
+            args.checkpoint, args.intervalo, args.reiniciar, apresentar, progresso
+        )
+    except RuntimeError as e:
+        print(str(e), file=sys.stderr)
+        return 1
+    except KeyboardInterrupt:
+        print("Interrompido; execute o mesmo comando para retomar.", file=sys.stderr)
+        return 130
+    if resumo.get("falhas"):
+        print(f"{resumo['falhas']} documentos falharam; execute o mesmo comando para consultá-los de novo.",
+              file=sys.stderr)
+    print(json.dumps(resumo, ensure_ascii=False))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
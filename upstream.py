@@ -0,0 +1,145 @@
+"""
+Cliente HTTP compartilhado para a API da Infosimples
+
+Mantém uma única sessão por processo (cada worker do Gunicorn tem a sua),
+reaproveitando conexões TCP/TLS entre as consultas em vez de abrir uma
+nova conexão a cada chamada.
+"""
+import os
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+try:
+    import httpx
+except ImportError:  # Necessário apenas para o modo ASGI
+    httpx = None
+
+# URL da API do Portal da Transparência CEIS (pode ser trocada por um servidor local em testes)
+API_URL = os.environ.get(
+    'CEIS_API_URL',
+    "https://api.infosimples.com/api/v2/consultas/portal-transparencia/ceis"
+)
+
+# Tamanho do pool de conexões por worker (recomenda-se igualar ao número de threads do Gunicorn)
+POOL_SIZE = int(os.environ.get('CEIS_POOL_SIZE', 10))
+
+# Se verdadeiro, threads aguardam uma conexão livre em vez de abrir conexões extras descartáveis
+POOL_BLOCK = os.environ.get('CEIS_POOL_BLOCK', '1').lower() in ('1', 'true', 'sim')
+
+# Timeouts em segundos: conexão e leitura (a leitura cobre o timeout de 300 s enviado à API)
+CONNECT_TIMEOUT = float(os.environ.get('CEIS_CONNECT_TIMEOUT', 5))
+READ_TIMEOUT = float(os.environ.get('CEIS_READ_TIMEOUT', 310))
+
+# Tentativas extras em erros de conexão e fator de espera exponencial entre elas
+RETRIES = int(os.environ.get('CEIS_RETRIES', 3))
+BACKOFF_FACTOR = float(os.environ.get('CEIS_BACKOFF_FACTOR', 0.5))
+
+# Conexões simultâneas do cliente assíncrono por worker (modo ASGI)
+ASYNC_POOL_SIZE = int(os.environ.get('CEIS_ASYNC_POOL_SIZE', 1000))
+
+_session = None
+_session_pid = None
+_session_lock = threading.Lock()
+
+
+def criar_sessao(pool_size=POOL_SIZE, pool_block=POOL_BLOCK,
+                 retries=RETRIES, backoff_factor=BACKOFF_FACTOR):
+    """
+    Cria uma sessão HTTP com pool de conexões keep-alive e retentativas
+
+    Só são repetidas as falhas em que a consulta certamente não chegou à API:
+    erros ao estabelecer a conexão. Timeouts de leitura e respostas 5xx
+    (inclusive 502/504 do gateway) não são repetidos, pois a consulta é um
+    POST cobrado que a API pode já ter processado.
+    """
+    retry = Retry(
+        total=retries,
+        connect=retries,
+        read=0,
+        status=0,
+        other=0,
+        backoff_factor=backoff_factor,
+        raise_on_status=False
+    )
+    adapter = HTTPAdapter(
+        pool_connections=1,
+        pool_maxsize=pool_size,
+        pool_block=pool_block,
+        max_retries=retry
+    )
+
+    session = requests.Session()
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+
+def get_session():
+    """
+    Retorna a sessão do processo atual, criando-a na primeira chamada
+
+    A sessão é recriada após um fork (ex.: Gunicorn com --preload) para que
+    os workers não compartilhem sockets herdados do processo pai.
+    """
+    global _session, _session_pid
+
+    pid = os.getpid()
+    if _session is None or _session_pid != pid:
+        with _session_lock:
+            if _session is None or _session_pid != pid:
+                _session = criar_sessao()
+                _session_pid = pid
+    return _session
+
+
+def reset_session():
+    """
+    Fecha a sessão atual; a próxima chamada criará uma nova
+    """
+    global _session, _session_pid
+
+    with _session_lock:
+        if _session is not None:
+            _session.close()
+        _session = None
+        _session_pid = None
+
+
+def post(params, url=None, timeout=None):
+    """
+    Envia uma consulta à API usando a sessão compartilhada
+
+    timeout substitui o timeout de leitura (CEIS_READ_TIMEOUT), em segundos.
+    """
+    return get_session().post(
+        url or API_URL,
+        data=params,
+        timeout=(CONNECT_TIMEOUT, timeout or READ_TIMEOUT)
+    )
+
+
+def criar_cliente_async(pool_size=ASYNC_POOL_SIZE, retries=RETRIES):
+    """
+    Cria o cliente HTTP assíncrono usado pelo modo ASGI
+
+    Um único cliente por worker mantém milhares de consultas em andamento
+    sobre um pool de conexões keep-alive. Como na sessão síncrona, apenas
+    erros de conexão são repetidos (pelo próprio transporte).
+    """
+    if httpx is None:
+        raise RuntimeError("O cliente assíncrono requer o pacote httpx (pip install httpx)")
+    return httpx.AsyncClient(
+        limits=httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size),
+        timeout=httpx.Timeout(READ_TIMEOUT, connect=CONNECT_TIMEOUT),
+        transport=httpx.AsyncHTTPTransport(retries=retries)
+    )
+
+
+async def post_async(client, params, url=None):
+    """
+    Envia uma consulta à API usando o cliente assíncrono
+    """
+    return await client.post(url or API_URL, data=params)